@@ -0,0 +1,377 @@
+"""Benchmark the gevent clients against a local SwiftStandin.
+
+Measures auth, upload, download, pooled request, listing, segmented
+upload, concurrent ranged read, chunked read and delete throughput and
+latency at several concurrency levels, with injected latency and
+bandwidth, and optionally compares the results to a baseline report
+written by a previous run.
+
+Example usage:
+    python tests/benchmark.py --concurrency 1,8,32 --latency 0.005 \\
+            --output report.json
+    python tests/benchmark.py --baseline report.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import gevent
+from gevent.pool import Pool
+
+import testbase
+
+from standin import SwiftStandin
+from trrackspace_gevent.services.cloudfiles.client import GCloudfilesClient
+from trrackspace_gevent.services.cloudfiles.upload import MIN_SEGMENT_SIZE
+from trrackspace_gevent.services.identity.client import GIdentityServiceClient
+
+#Benchmarked operations in the order they're run
+OPERATIONS = ("auth", "upload", "download", "request", "list",
+        "segmented_upload", "ranged_read", "chunks", "delete")
+
+#Operations on large objects, which are created by segmented_upload
+LARGE_OPERATIONS = ("segmented_upload", "ranged_read", "chunks")
+
+class BenchmarkResult(object):
+    """Throughput and latency of an operation at a concurrency level."""
+
+    def __init__(self, operation, concurrency, latencies, elapsed, size=0):
+        """BenchmarkResult constructor
+
+        Args:
+            operation: operation name, i.e. upload
+            concurrency: number of concurrent greenlets
+            latencies: list of per-request latencies in seconds
+            elapsed: total wall clock seconds
+            size: total number of bytes transferred
+        """
+        self.operation = operation
+        self.concurrency = concurrency
+        self.latencies = sorted(latencies)
+        self.elapsed = elapsed
+        self.size = size
+
+    @property
+    def key(self):
+        return "%s@%d" % (self.operation, self.concurrency)
+
+    def percentile(self, percentile):
+        if not self.latencies:
+            return None
+        index = int(len(self.latencies) * percentile / 100.0)
+        return self.latencies[min(index, len(self.latencies) - 1)]
+
+    def to_dict(self):
+        count = len(self.latencies)
+        return {
+            "operation": self.operation,
+            "concurrency": self.concurrency,
+            "count": count,
+            "ops_per_sec": count / self.elapsed if self.elapsed else 0,
+            "mb_per_sec": self.size / self.elapsed / 1024 / 1024 \
+                    if self.elapsed else 0,
+            "mean": sum(self.latencies) / count if count else None,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99)
+        }
+
+
+class Benchmark(object):
+    """Benchmark of the gevent clients against a SwiftStandin."""
+
+    def __init__(self,
+            standin,
+            concurrency_levels=(1, 8, 32),
+            object_count=200,
+            object_size=64 * 1024,
+            listing_batch_size=100,
+            large_object_count=4,
+            large_object_size=4 * MIN_SEGMENT_SIZE,
+            segment_size=MIN_SEGMENT_SIZE,
+            range_size=256 * 1024):
+        """Benchmark constructor
+
+        Args:
+            standin: started SwiftStandin
+            concurrency_levels: list of concurrency levels to run
+                each operation at.
+            object_count: number of objects uploaded, downloaded and
+                deleted at each concurrency level.
+            object_size: size of each object in bytes
+            listing_batch_size: batch size of listing requests
+            large_object_count: number of large objects uploaded and
+                read at each concurrency level. Large objects are
+                transferred one at a time, with concurrency segment
+                or range requests in flight.
+            large_object_size: size of each large object in bytes
+            segment_size: segment size of large object uploads
+            range_size: size of ranged and chunked read requests
+        """
+        self.standin = standin
+        self.concurrency_levels = concurrency_levels
+        self.object_count = object_count
+        self.object_size = object_size
+        self.listing_batch_size = listing_batch_size
+        self.large_object_count = large_object_count
+        self.large_object_size = large_object_size
+        self.segment_size = segment_size
+        self.range_size = range_size
+        self.data = os.urandom(object_size)
+        self.large_data = os.urandom(large_object_size)
+
+    def run(self, operations=OPERATIONS):
+        """Run benchmark.
+
+        Args:
+            operations: operations to benchmark. Upload is always run
+                if download, request, list or delete are, and
+                segmented_upload if ranged_read or chunks are, to
+                create objects.
+        Returns:
+            list of BenchmarkResult objects
+        """
+        results = []
+        for concurrency in self.concurrency_levels:
+            if "auth" in operations:
+                results.append(self._auth(concurrency))
+
+            client = GCloudfilesClient(
+                    identity_client=self._identity_client(),
+                    servicenet=False,
+                    pool_size=concurrency)
+            container = client.create_container(
+                    "benchmark_%d_%d" % (concurrency, int(time.time())))
+            names = ["object%06d" % i for i in range(self.object_count)]
+
+            upload = self._run("upload", concurrency, names,
+                    lambda name: container.create_object(name).write(
+                        self.data),
+                    self.object_size)
+            if "upload" in operations:
+                results.append(upload)
+
+            if "download" in operations:
+                results.append(self._run("download", concurrency, names,
+                    lambda name: container.get_object(name).read(),
+                    self.object_size))
+
+            #bodyless requests measure pool checkout and connection reuse
+            if "request" in operations:
+                results.append(self._run("request", concurrency, names,
+                    lambda name: client._send_request("HEAD",
+                        container.create_object(name).path).read()))
+
+            if "list" in operations:
+                results.append(self._run("list", concurrency,
+                    range(concurrency * 2),
+                    lambda i: list(container.list_all_objects(
+                        batch_size=self.listing_batch_size))))
+
+            if set(operations) & set(LARGE_OPERATIONS):
+                results.extend(self._large(client, container, concurrency,
+                    operations))
+
+            if "delete" in operations:
+                results.append(self._run("delete", concurrency, names,
+                    lambda name: container.delete_object(name)))
+            container.delete_all_objects()
+            container.delete()
+        return results
+
+    def _large(self, client, container, concurrency, operations):
+        """Benchmark large object operations.
+
+        Returns:
+            list of BenchmarkResult objects
+        """
+        results = []
+        names = ["large%06d" % i for i in range(self.large_object_count)]
+        upload = self._run("segmented_upload", concurrency, names,
+                lambda name: container.create_object(name).write(
+                    self.large_data,
+                    segment_size=self.segment_size,
+                    segment_concurrency=concurrency),
+                self.large_object_size,
+                pool_size=1)
+        if "segmented_upload" in operations:
+            results.append(upload)
+
+        if "ranged_read" in operations:
+            results.append(self._run("ranged_read", concurrency, names,
+                lambda name: container.get_object(name).read(
+                    concurrency=concurrency,
+                    range_size=self.range_size),
+                self.large_object_size,
+                pool_size=1))
+
+        if "chunks" in operations:
+            results.append(self._run("chunks", concurrency, names,
+                lambda name: list(container.get_object(name).chunks(
+                    chunk_size=self.range_size,
+                    concurrency=concurrency)),
+                self.large_object_size,
+                pool_size=1))
+
+        container.delete_all_objects()
+        segments = client.get_container("%s_segments" % container.name)
+        segments.delete_all_objects()
+        segments.delete()
+        return results
+
+    def _auth(self, concurrency):
+        return self._run("auth", concurrency,
+                range(max(concurrency * 4, 20)),
+                lambda i: self._identity_client().authenticate())
+
+    def _identity_client(self):
+        return GIdentityServiceClient(
+                username=self.standin.username,
+                api_key=self.standin.api_key,
+                endpoint=self.standin.identity_endpoint,
+                token_cache=None)
+
+    def _run(self, operation, concurrency, items, task, size=0,
+            pool_size=None):
+        """Run task for each item with the given concurrency.
+
+        Args:
+            pool_size: optional number of items to run concurrently,
+                for tasks which are concurrent themselves. Defaults
+                to concurrency.
+        Returns:
+            BenchmarkResult
+        """
+        latencies = []
+        def timed(item):
+            start = time.time()
+            task(item)
+            latencies.append(time.time() - start)
+
+        pool = Pool(pool_size or concurrency)
+        start = time.time()
+        greenlets = [pool.spawn(timed, item) for item in items]
+        gevent.joinall(greenlets, raise_error=True)
+        elapsed = time.time() - start
+        return BenchmarkResult(operation, concurrency, latencies,
+                elapsed, size * len(latencies))
+
+
+def compare(report, baseline, threshold=0.1):
+    """Compare report to a baseline report.
+
+    Args:
+        report: dict of result keys to result dicts
+        baseline: dict of result keys to result dicts
+        threshold: fractional throughput decrease or p99 latency
+            increase considered a regression.
+    Returns:
+        list of (key, metric, baseline value, value) regressions
+    """
+    regressions = []
+    for key, result in sorted(report.items()):
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        if result["ops_per_sec"] < previous["ops_per_sec"] * (1 - threshold):
+            regressions.append((key, "ops_per_sec",
+                previous["ops_per_sec"], result["ops_per_sec"]))
+        if previous["p99"] and result["p99"] \
+                and result["p99"] > previous["p99"] * (1 + threshold):
+            regressions.append((key, "p99", previous["p99"], result["p99"]))
+    return regressions
+
+def format_report(report, baseline=None):
+    """Return report formatted as a table."""
+    baseline = baseline or {}
+    lines = ["%-24s %8s %10s %10s %10s %10s %10s" % (
+        "operation", "count", "ops/s", "MB/s", "p50 ms", "p99 ms", "vs base")]
+    for key, result in sorted(report.items(),
+            key=lambda item: (OPERATIONS.index(item[1]["operation"]),
+                item[1]["concurrency"])):
+        previous = baseline.get(key)
+        change = ""
+        if previous and previous["ops_per_sec"]:
+            change = "%+.1f%%" % (100.0 * (result["ops_per_sec"]
+                / previous["ops_per_sec"] - 1))
+        lines.append("%-24s %8d %10.1f %10.2f %10.2f %10.2f %10s" % (
+            key,
+            result["count"],
+            result["ops_per_sec"],
+            result["mb_per_sec"],
+            (result["p50"] or 0) * 1000,
+            (result["p99"] or 0) * 1000,
+            change))
+    return "\n".join(lines)
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", default="1,8,32",
+            help="comma separated concurrency levels")
+    parser.add_argument("--operations", default=",".join(OPERATIONS),
+            help="comma separated operations to benchmark")
+    parser.add_argument("--objects", type=int, default=200,
+            help="number of objects per concurrency level")
+    parser.add_argument("--object-size", type=int, default=64 * 1024,
+            help="object size in bytes")
+    parser.add_argument("--large-objects", type=int, default=4,
+            help="number of large objects per concurrency level")
+    parser.add_argument("--large-object-size", type=int,
+            default=4 * MIN_SEGMENT_SIZE, help="large object size in bytes")
+    parser.add_argument("--segment-size", type=int, default=MIN_SEGMENT_SIZE,
+            help="segment size of large object uploads in bytes")
+    parser.add_argument("--range-size", type=int, default=256 * 1024,
+            help="size of ranged and chunked reads in bytes")
+    parser.add_argument("--latency", type=float, default=0.002,
+            help="injected latency per request in seconds")
+    parser.add_argument("--bandwidth", type=int, default=None,
+            help="injected bandwidth in bytes per second")
+    parser.add_argument("--output", help="path to write json report to")
+    parser.add_argument("--baseline", help="path of json report to compare to")
+    parser.add_argument("--threshold", type=float, default=0.1,
+            help="fractional change considered a regression")
+    args = parser.parse_args(argv)
+
+    standin = SwiftStandin(latency=args.latency, bandwidth=args.bandwidth)
+    standin.start()
+    try:
+        benchmark = Benchmark(
+                standin,
+                concurrency_levels=[int(c) for c in args.concurrency.split(",")],
+                object_count=args.objects,
+                object_size=args.object_size,
+                large_object_count=args.large_objects,
+                large_object_size=args.large_object_size,
+                segment_size=args.segment_size,
+                range_size=args.range_size)
+        results = benchmark.run(args.operations.split(","))
+    finally:
+        standin.stop()
+
+    report = dict((r.key, r.to_dict()) for r in results)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    print(format_report(report, baseline))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "settings": vars(args),
+                "results": report
+            }, f, indent=2, sort_keys=True)
+
+    if baseline is not None:
+        regressions = compare(report, baseline, args.threshold)
+        for key, metric, previous, value in regressions:
+            print("REGRESSION %s %s: %.4f -> %.4f" % (
+                key, metric, previous, value))
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,644 @@
+import datetime
+import hashlib
+import hmac
+import json
+import tarfile
+import time
+import urllib
+import urlparse
+import uuid
+from StringIO import StringIO
+
+import gevent
+from gevent.pywsgi import WSGIServer
+
+#Size of chunks request and response bodies are throttled in
+THROTTLE_CHUNK_SIZE = 64 * 1024
+
+#Default maximum number of entries in a listing
+MAX_LISTING_LIMIT = 10000
+
+STATUS_TEXT = {
+    200: "OK",
+    201: "Created",
+    202: "Accepted",
+    204: "No Content",
+    206: "Partial Content",
+    400: "Bad Request",
+    401: "Unauthorized",
+    404: "Not Found",
+    409: "Conflict",
+    412: "Precondition Failed",
+    416: "Requested Range Not Satisfiable",
+    422: "Unprocessable Entity",
+    503: "Service Unavailable"
+}
+
+class StoredObject(object):
+    """Object stored by the stand-in."""
+
+    def __init__(self, data, content_type, metadata=None, slo=False):
+        self.data = data
+        self.content_type = content_type or "application/octet-stream"
+        self.metadata = metadata or {}
+        self.slo = slo
+        self.etag = hashlib.md5(data).hexdigest()
+        self.timestamp = time.time()
+
+    @property
+    def last_modified(self):
+        return datetime.datetime.utcfromtimestamp(self.timestamp)
+
+
+class StoredContainer(object):
+    """Container stored by the stand-in."""
+
+    def __init__(self):
+        self.objects = {}
+        self.metadata = {}
+
+    @property
+    def bytes_used(self):
+        return sum(len(o.data) for o in self.objects.values())
+
+
+class Response(Exception):
+    """Raised by request handlers to return an error response."""
+
+    def __init__(self, status, body="", headers=None):
+        super(Response, self).__init__(status)
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+
+class SwiftStandin(object):
+    """Local in-process stand-in for the identity and cloudfiles apis.
+
+    SwiftStandin is a gevent WSGI server implementing the identity
+    token and service catalog calls, and the cloudfiles account,
+    container, object, static large object, bulk delete and archive
+    extraction calls used by the gevent clients. All state is kept
+    in memory.
+
+    Latency is injected before every request is handled, and request
+    and response bodies are throttled to the given bandwidth, so
+    benchmarks can approximate remote endpoints reproducibly.
+
+    Example usage:
+        standin = SwiftStandin(latency=0.01)
+        standin.start()
+        identity_client = GIdentityServiceClient(
+                username=standin.username,
+                api_key=standin.api_key,
+                endpoint=standin.identity_endpoint)
+        client = GCloudfilesClient(
+                identity_client=identity_client,
+                servicenet=False)
+        ...
+        standin.stop()
+    """
+
+    def __init__(self,
+            host="127.0.0.1",
+            port=0,
+            latency=0,
+            bandwidth=None,
+            region="DFW",
+            username="standin",
+            api_key="standin",
+            token_ttl=3600):
+        """SwiftStandin constructor
+
+        Args:
+            host: host to listen on
+            port: port to listen on, or 0 for an ephemeral port
+            latency: seconds of latency to inject before each request
+            bandwidth: optional bytes per second to throttle request
+                and response bodies to.
+            region: region of the cloudfiles endpoints in the catalog
+            username: username clients must authenticate with
+            api_key: api key or password clients must authenticate with
+            token_ttl: number of seconds issued tokens are valid for
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.region = region
+        self.username = username
+        self.api_key = api_key
+        self.token_ttl = token_ttl
+        self.account = "AUTH_%s" % username
+        self.tokens = {}
+        self.containers = {}
+        self.account_metadata = {}
+        self.request_count = 0
+        self.server = None
+
+    @property
+    def url(self):
+        return "http://%s:%d" % (self.host, self.port)
+
+    @property
+    def identity_endpoint(self):
+        return "%s/v2.0" % self.url
+
+    @property
+    def storage_url(self):
+        return "%s/v1/%s" % (self.url, self.account)
+
+    def start(self):
+        """Start serving in the background."""
+        self.server = WSGIServer((self.host, self.port), self, log=None)
+        self.server.start()
+        self.port = self.server.server_port
+
+    def stop(self):
+        """Stop serving."""
+        if self.server is not None:
+            self.server.stop()
+            self.server = None
+
+    def reset(self):
+        """Discard all stored containers, objects and tokens."""
+        self.tokens = {}
+        self.containers = {}
+        self.account_metadata = {}
+        self.request_count = 0
+
+    def __call__(self, environ, start_response):
+        self.request_count += 1
+        if self.latency:
+            gevent.sleep(self.latency)
+
+        try:
+            status, body, headers = self._dispatch(environ)
+        except Response as response:
+            status, body, headers = \
+                    response.status, response.body, response.headers
+
+        headers.setdefault("Content-Length", str(len(body)))
+        headers.setdefault("Content-Type", "text/plain; charset=utf-8")
+        headers.setdefault("X-Trans-Id", uuid.uuid4().hex)
+        start_response(
+                "%d %s" % (status, STATUS_TEXT.get(status, "")),
+                [(str(k), str(v)) for k, v in headers.items()])
+
+        if environ["REQUEST_METHOD"] == "HEAD":
+            return []
+        return self._throttled_body(body)
+
+    def _dispatch(self, environ):
+        method = environ["REQUEST_METHOD"]
+        path = urllib.unquote(environ.get("PATH_INFO", ""))
+        params = dict(urlparse.parse_qsl(
+            environ.get("QUERY_STRING", ""), keep_blank_values=True))
+
+        if path.startswith("/v2.0"):
+            return self._identity(environ, method, path[5:])
+
+        prefix = "/v1/%s" % self.account
+        if not path.startswith(prefix):
+            raise Response(404)
+        if "temp_url_sig" in params:
+            self._authorize_temp_url(method, path, params)
+        else:
+            self._authorize(environ)
+
+        parts = path[len(prefix):].lstrip("/").split("/", 1)
+        container_name = parts[0]
+        object_name = parts[1] if len(parts) > 1 else None
+
+        if not container_name:
+            return self._account(environ, method, params)
+        elif object_name is None:
+            return self._container(environ, method, params, container_name)
+        else:
+            return self._object(
+                    environ, method, params, container_name, object_name)
+
+    def _identity(self, environ, method, path):
+        if method == "POST" and path.rstrip("/") == "/tokens":
+            return self._authenticate(environ)
+
+        self._authorize(environ)
+        if method == "GET" and path.rstrip("/") == "/users":
+            return self._json(200, {"users": [self._user()]})
+        raise Response(404)
+
+    def _authenticate(self, environ):
+        credentials = json.loads(self._read_body(environ)).get("auth", {})
+        api_credentials = credentials.get("RAX-KSKEY:apiKeyCredentials") \
+                or credentials.get("passwordCredentials") or {}
+        secret = api_credentials.get("apiKey") \
+                or api_credentials.get("password")
+        if api_credentials.get("username") != self.username \
+                or secret != self.api_key:
+            raise Response(401)
+
+        token_id = uuid.uuid4().hex
+        expires = time.time() + self.token_ttl
+        self.tokens[token_id] = expires
+        expires = datetime.datetime.utcfromtimestamp(expires)
+
+        endpoint = {
+            "region": self.region,
+            "tenantId": self.account,
+            "publicURL": self.storage_url,
+            "internalURL": self.storage_url
+        }
+        cdn_endpoint = {
+            "region": self.region,
+            "tenantId": self.account,
+            "publicURL": self.storage_url
+        }
+        return self._json(200, {
+            "access": {
+                "token": {
+                    "id": token_id,
+                    "expires": expires.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                    "tenant": {"id": self.account, "name": self.account}
+                },
+                "user": self._user(),
+                "serviceCatalog": [{
+                    "name": "cloudFiles",
+                    "type": "object-store",
+                    "endpoints": [endpoint]
+                }, {
+                    "name": "cloudFilesCDN",
+                    "type": "rax:object-cdn",
+                    "endpoints": [cdn_endpoint]
+                }]
+            }
+        })
+
+    def _user(self):
+        return {
+            "id": self.username,
+            "name": self.username,
+            "username": self.username,
+            "RAX-AUTH:defaultRegion": self.region,
+            "enabled": True,
+            "roles": []
+        }
+
+    def _authorize(self, environ):
+        expires = self.tokens.get(environ.get("HTTP_X_AUTH_TOKEN"))
+        if expires is None or expires < time.time():
+            raise Response(401)
+
+    def _authorize_temp_url(self, method, path, params):
+        key = self.account_metadata.get("X-Account-Meta-Temp-Url-Key")
+        expires = int(params.get("temp_url_expires") or 0)
+        if method == "HEAD":
+            method = "GET"
+        if key is None or expires < time.time():
+            raise Response(401)
+        signature = hmac.new(key, "%s\n%d\n%s" % (method, expires, path),
+                hashlib.sha1).hexdigest()
+        if signature != params["temp_url_sig"]:
+            raise Response(401)
+
+    def _account(self, environ, method, params):
+        if method in ("GET", "HEAD"):
+            headers = {
+                "X-Account-Container-Count": len(self.containers),
+                "X-Account-Object-Count": sum(
+                    len(c.objects) for c in self.containers.values()),
+                "X-Account-Bytes-Used": sum(
+                    c.bytes_used for c in self.containers.values())
+            }
+            headers.update(self.account_metadata)
+            entries = [{
+                "name": name,
+                "count": len(container.objects),
+                "bytes": container.bytes_used
+            } for name, container in sorted(self.containers.items())]
+            return self._listing(params, entries, headers)
+
+        elif method == "POST" and "bulk-delete" in params:
+            return self._bulk_delete(environ)
+
+        elif method == "POST":
+            self._update_metadata(
+                    environ, self.account_metadata, "X-Account-Meta-")
+            return 204, "", {}
+
+        elif method == "PUT" and "extract-archive" in params:
+            return self._extract_archive(environ, None, params)
+
+        raise Response(400)
+
+    def _container(self, environ, method, params, container_name):
+        container = self.containers.get(container_name)
+
+        if method == "PUT" and "extract-archive" in params:
+            return self._extract_archive(environ, container_name, params)
+
+        elif method == "PUT":
+            if container is not None:
+                return 202, "", {}
+            container = self.containers[container_name] = StoredContainer()
+            self._update_metadata(
+                    environ, container.metadata, "X-Container-Meta-")
+            return 201, "", {}
+
+        if container is None:
+            raise Response(404)
+
+        if method in ("GET", "HEAD"):
+            headers = {
+                "X-Container-Object-Count": len(container.objects),
+                "X-Container-Bytes-Used": container.bytes_used
+            }
+            headers.update(container.metadata)
+            entries = [{
+                "name": name,
+                "hash": o.etag,
+                "bytes": len(o.data),
+                "content_type": o.content_type,
+                "last_modified": o.last_modified.isoformat()
+            } for name, o in sorted(container.objects.items())]
+            return self._listing(params, entries, headers)
+
+        elif method == "POST":
+            self._update_metadata(
+                    environ, container.metadata, "X-Container-Meta-")
+            return 204, "", {}
+
+        elif method == "DELETE":
+            if container.objects:
+                raise Response(409)
+            del self.containers[container_name]
+            return 204, "", {}
+
+        raise Response(400)
+
+    def _object(self, environ, method, params, container_name, object_name):
+        container = self.containers.get(container_name)
+        if container is None:
+            raise Response(404)
+        stored = container.objects.get(object_name)
+
+        if method == "PUT":
+            return self._put_object(
+                    environ, params, container, object_name)
+
+        elif method == "COPY":
+            if stored is None:
+                raise Response(404)
+            destination = urllib.unquote(environ.get("HTTP_DESTINATION", ""))
+            destination_container, destination_name = \
+                    destination.lstrip("/").split("/", 1)
+            return self._copy(environ, stored,
+                    self.containers.get(destination_container),
+                    destination_name)
+
+        if stored is None:
+            raise Response(404)
+
+        if method in ("GET", "HEAD"):
+            return self._get_object(environ, stored)
+
+        elif method == "POST":
+            stored.metadata = {}
+            self._update_metadata(environ, stored.metadata, "X-Object-Meta-")
+            return 202, "", {}
+
+        elif method == "DELETE":
+            del container.objects[object_name]
+            return 204, "", {}
+
+        raise Response(400)
+
+    def _put_object(self, environ, params, container, object_name):
+        copy_from = environ.get("HTTP_X_COPY_FROM")
+        if copy_from:
+            source_container, source_name = \
+                    urllib.unquote(copy_from).lstrip("/").split("/", 1)
+            source = self.containers.get(source_container)
+            stored = source.objects.get(source_name) if source else None
+            if stored is None:
+                raise Response(404)
+            return self._copy(environ, stored, container, object_name)
+
+        data = self._read_body(environ)
+        content_type = environ.get("CONTENT_TYPE")
+        slo = "multipart-manifest" in params
+        if slo:
+            manifest_etag = self._manifest_etag(data)
+            data = self._resolve_manifest(data)
+
+        stored = StoredObject(data, content_type, slo=slo)
+        expected = environ.get("HTTP_ETAG")
+        if not slo and expected and expected.strip('"') != stored.etag:
+            raise Response(422)
+        self._update_metadata(environ, stored.metadata, "X-Object-Meta-")
+        container.objects[object_name] = stored
+
+        etag = stored.etag
+        if slo:
+            etag = '"%s"' % manifest_etag
+        return 201, "", {"ETag": etag}
+
+    def _copy(self, environ, stored, container, object_name):
+        if container is None:
+            raise Response(404)
+        copy = StoredObject(stored.data, stored.content_type)
+        if environ.get("HTTP_X_FRESH_METADATA", "").lower() != "true":
+            copy.metadata.update(stored.metadata)
+        self._update_metadata(environ, copy.metadata, "X-Object-Meta-")
+        container.objects[object_name] = copy
+        return 201, "", {"ETag": copy.etag}
+
+    def _get_object(self, environ, stored):
+        if_match = environ.get("HTTP_IF_MATCH")
+        if if_match and if_match.strip('"') != stored.etag:
+            raise Response(412)
+
+        headers = {
+            "ETag": stored.etag,
+            "Content-Type": stored.content_type,
+            "Last-Modified": stored.last_modified.strftime(
+                "%a, %d %b %Y %H:%M:%S GMT"),
+            "X-Timestamp": "%.5f" % stored.timestamp,
+            "Accept-Ranges": "bytes"
+        }
+        headers.update(stored.metadata)
+
+        data = stored.data
+        byte_range = self._range(environ.get("HTTP_RANGE"), len(data))
+        if byte_range is None:
+            return 200, data, headers
+
+        start, end = byte_range
+        headers["Content-Range"] = "bytes %d-%d/%d" % (start, end, len(data))
+        return 206, data[start:end + 1], headers
+
+    def _range(self, header, size):
+        """Return inclusive (start, end) of a Range header, or None."""
+        if not header or not header.startswith("bytes="):
+            return None
+        start, end = header[6:].split(",")[0].split("-")
+        if not start:
+            start, end = max(0, size - int(end)), size - 1
+        else:
+            start = int(start)
+            end = min(int(end), size - 1) if end else size - 1
+        if start >= size:
+            raise Response(416)
+        return start, end
+
+    def _resolve_manifest(self, data):
+        """Return concatenated data of static large object segments."""
+        result = []
+        for segment in json.loads(data):
+            container_name, name = segment["path"].lstrip("/").split("/", 1)
+            container = self.containers.get(urllib.unquote(container_name))
+            stored = container.objects.get(urllib.unquote(name)) \
+                    if container else None
+            if stored is None or (segment.get("etag")
+                    and segment["etag"].strip('"') != stored.etag):
+                raise Response(400, "invalid manifest segment %s"
+                        % segment["path"])
+            result.append(stored.data)
+        return "".join(result)
+
+    def _manifest_etag(self, data):
+        """Return static large object etag of manifest data."""
+        return hashlib.md5("".join(
+            segment["etag"].strip('"').lower()
+            for segment in json.loads(data))).hexdigest()
+
+    def _bulk_delete(self, environ):
+        result = {
+            "Number Deleted": 0,
+            "Number Not Found": 0,
+            "Errors": [],
+            "Response Status": "200 OK",
+            "Response Body": ""
+        }
+        for path in self._read_body(environ).splitlines():
+            if not path.strip():
+                continue
+            container_name, name = \
+                    urllib.unquote(path).lstrip("/").split("/", 1)
+            container = self.containers.get(container_name)
+            if container is None or name not in container.objects:
+                result["Number Not Found"] += 1
+            else:
+                del container.objects[name]
+                result["Number Deleted"] += 1
+        return self._json(200, result)
+
+    def _extract_archive(self, environ, container_name, params):
+        mode = {"tar": "r:", "tar.gz": "r:gz", "tar.bz2": "r:bz2"}.get(
+                params["extract-archive"])
+        if mode is None:
+            raise Response(400)
+
+        result = {
+            "Number Files Created": 0,
+            "Errors": [],
+            "Response Status": "201 Created",
+            "Response Body": ""
+        }
+        archive = tarfile.open(
+                fileobj=StringIO(self._read_body(environ)), mode=mode)
+        for member in archive:
+            if not member.isfile():
+                continue
+            path = member.name.lstrip("./")
+            if container_name is None:
+                name_container, name = path.split("/", 1)
+            else:
+                name_container, name = container_name, path
+            container = self.containers.setdefault(
+                    name_container, StoredContainer())
+            container.objects[name] = StoredObject(
+                    archive.extractfile(member).read(), None)
+            result["Number Files Created"] += 1
+        return self._json(201, result)
+
+    def _listing(self, params, entries, headers):
+        marker = params.get("marker")
+        end_marker = params.get("end_marker")
+        prefix = params.get("prefix", "")
+        delimiter = params.get("delimiter")
+        limit = min(int(params.get("limit") or MAX_LISTING_LIMIT),
+                MAX_LISTING_LIMIT)
+
+        results = []
+        for entry in entries:
+            name = entry["name"]
+            if marker and name <= marker:
+                continue
+            if end_marker and name >= end_marker:
+                break
+            if not name.startswith(prefix):
+                continue
+            if delimiter:
+                index = name.find(delimiter, len(prefix))
+                if index >= 0:
+                    subdir = name[:index + len(delimiter)]
+                    if marker and subdir <= marker:
+                        continue
+                    if not results or results[-1].get("subdir") != subdir:
+                        results.append({"subdir": subdir})
+                    if len(results) >= limit:
+                        break
+                    continue
+            results.append(entry)
+            if len(results) >= limit:
+                break
+
+        if not results:
+            status = 204
+        else:
+            status = 200
+
+        if params.get("format") == "json":
+            headers["Content-Type"] = "application/json; charset=utf-8"
+            return status, json.dumps(results), headers
+
+        body = "".join("%s\n" % (e.get("name") or e["subdir"])
+                for e in results)
+        return status, body, headers
+
+    def _update_metadata(self, environ, metadata, header_prefix):
+        environ_prefix = "HTTP_" + header_prefix.upper().replace("-", "_")
+        for key, value in environ.items():
+            if key.startswith(environ_prefix):
+                name = key[len(environ_prefix):].replace("_", "-").title()
+                if value:
+                    metadata[header_prefix + name] = value
+                else:
+                    metadata.pop(header_prefix + name, None)
+
+    def _read_body(self, environ):
+        """Read request body throttled to the configured bandwidth."""
+        stream = environ["wsgi.input"]
+        chunks = []
+        while True:
+            chunk = stream.read(THROTTLE_CHUNK_SIZE)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            self._throttle(len(chunk))
+        return "".join(chunks)
+
+    def _throttled_body(self, body):
+        """Yield response body throttled to the configured bandwidth."""
+        for offset in range(0, len(body), THROTTLE_CHUNK_SIZE):
+            chunk = body[offset:offset + THROTTLE_CHUNK_SIZE]
+            self._throttle(len(chunk))
+            yield chunk
+
+    def _throttle(self, size):
+        if self.bandwidth:
+            gevent.sleep(float(size) / self.bandwidth)
+
+    def _json(self, status, data):
+        headers = {"Content-Type": "application/json; charset=utf-8"}
+        return status, json.dumps(data), headers
@@ -0,0 +1,45 @@
+import unittest
+
+import testbase
+
+from benchmark import Benchmark, OPERATIONS, compare
+from standin import SwiftStandin
+
+class TestBenchmark(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.standin = SwiftStandin(latency=0.001)
+        cls.standin.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.standin.stop()
+
+    def test_run(self):
+        benchmark = Benchmark(
+                self.standin,
+                concurrency_levels=(1, 4),
+                object_count=10,
+                object_size=1024,
+                large_object_count=2,
+                large_object_size=3 * 1024 * 1024 + 1)
+        results = benchmark.run()
+        self.assertEqual(len(results), len(OPERATIONS) * 2)
+
+        report = dict((r.key, r.to_dict()) for r in results)
+        self.assertEqual(report["upload@4"]["count"], 10)
+        self.assertEqual(report["download@4"]["count"], 10)
+        self.assertTrue(report["download@4"]["ops_per_sec"] > 0)
+        self.assertEqual(report["request@4"]["count"], 10)
+        for operation in ("segmented_upload", "ranged_read", "chunks"):
+            self.assertEqual(report["%s@4" % operation]["count"], 2)
+            self.assertTrue(report["%s@4" % operation]["mb_per_sec"] > 0)
+        self.assertEqual(self.standin.containers, {})
+
+    def test_compare(self):
+        baseline = {"upload@1": {"ops_per_sec": 100, "p99": 0.01}}
+        report = {"upload@1": {"ops_per_sec": 80, "p99": 0.01}}
+        self.assertEqual(compare(report, baseline, 0.1),
+                [("upload@1", "ops_per_sec", 100, 80)])
+        self.assertEqual(compare(baseline, baseline, 0.1), [])
@@ -1,6 +1,9 @@
 import gevent
 import hashlib
+import hmac
+import json
 import os
+import StringIO
 import time
 import unittest
 import urllib
@@ -10,9 +13,27 @@ import testbase
 from trrackspace_gevent.services.cloudfiles.errors import NoSuchContainer, \
         NoSuchObject, ContainerNotEmpty
 
+from trrackspace_gevent.services.cloudfiles.cache import MetadataCache
 from trrackspace_gevent.services.cloudfiles.client import GCloudfilesClient
+from trrackspace_gevent.services.cloudfiles.endpoint import EndpointSelector
+from trrackspace_gevent.services.cloudfiles.etag import slo_etag
 from trrackspace_gevent.services.cloudfiles.factory import GCloudfilesClientFactory
+from trrackspace_gevent.services.cloudfiles.index import ContainerIndex
+from trrackspace_gevent.services.cloudfiles.replicated import \
+        GReplicatedCloudfilesClient
+from trrackspace_gevent.services.cloudfiles.listing import iter_json_array, \
+        marker_before, ObjectRecord
+from trrackspace_gevent.services.cloudfiles.mapped import MappedBuffer
+from trrackspace_gevent.factory import GPooledFactory
+from trrackspace_gevent.errors import DeadlineExceeded
+from trrackspace_gevent.limiter import AIMDLimiter, SUCCESS, THROTTLED
+from trrackspace_gevent.metrics import Histogram, InMemoryMetrics, Metrics
+from trrackspace_gevent.rest.client import GPooledRestClient
+from trrackspace_gevent.retry import RetryPolicy, deadline
 from trrackspace_gevent.services.cloudfiles.storage_object import StorageObject
+from trrackspace_gevent.services.cloudfiles.tempurl import TempUrlSigner, \
+        public_storage_url
+from trrackspace_gevent.services.cloudfiles.upload import UploadJournal
 
 class TestCloudfiles(unittest.TestCase):
     
@@ -64,6 +85,51 @@ class TestCloudfiles(unittest.TestCase):
         with self.assertRaises(NoSuchContainer):
             self.cloudfiles.get_container("blahblahblah")
 
+    def test_metadata_cache(self):
+        metadata_cache = MetadataCache(size=10, ttl=60)
+        cloudfiles = GCloudfilesClient(
+                username="trdev",
+                password="B88mMJqh",
+                timeout=30,
+                servicenet=False,
+                metadata_cache=metadata_cache)
+
+        greenlets = [gevent.spawn(cloudfiles.get_container,
+            self.container_name) for i in range(5)]
+        gevent.joinall(greenlets, raise_error=True)
+        self.assertEqual(metadata_cache.misses, 5)
+        self.assertEqual(len(metadata_cache.entries), 1)
+
+        container = cloudfiles.get_container(self.container_name)
+        self.assertEqual(metadata_cache.hits, 1)
+
+        obj = container.create_object("cache.txt")
+        obj.write("data")
+        self.assertEqual(container.get_object("cache.txt").read(), "data")
+        self.assertEqual(container.get_object("cache.txt").read(), "data")
+        self.assertEqual(metadata_cache.hits, 2)
+
+        obj.write("data2")
+        obj = container.get_object("cache.txt")
+        self.assertEqual(obj.content_length, 5)
+        self.assertEqual(metadata_cache.hits, 2)
+
+        #cached metadata isn't modified through returned objects
+        obj.metadata["x-object-meta-local"] = "local"
+        obj = container.get_object("cache.txt")
+        self.assertNotIn("x-object-meta-local", obj.metadata)
+
+        new_obj = container.create_object("cache2.txt")
+        new_obj.write("data")
+        container.get_object("cache2.txt")
+        new_obj.copy_from(obj)
+        self.assertEqual(container.get_object("cache2.txt").content_length, 5)
+        new_obj.delete()
+
+        obj.delete()
+        with self.assertRaises(NoSuchObject):
+            container.get_object("cache.txt")
+
     def test_expired_token(self):
         #make sure we're authenticated
         with self.assertRaises(NoSuchContainer):
@@ -76,6 +142,18 @@ class TestCloudfiles(unittest.TestCase):
         with self.assertRaises(NoSuchContainer):
             self.cloudfiles.get_container("blahblahblah")
 
+    def test_close(self):
+        selector = EndpointSelector(probe_interval=60)
+        cloudfiles = GCloudfilesClient(
+                username="trdev",
+                password="B88mMJqh",
+                timeout=30,
+                servicenet=False,
+                endpoint_selector=selector)
+        self.assertTrue(len(cloudfiles.list_containers()))
+        cloudfiles.close()
+        self.assertTrue(selector._prober.dead)
+
 class TestCloudfilesContainer(unittest.TestCase):
     
     @classmethod
@@ -171,8 +249,139 @@ class TestCloudfilesContainer(unittest.TestCase):
         self.assertEqual(len(objects), len(object_names))
         self.assertListEqual(object_names, [o["name"] for o in objects])
 
+        objects = [o for o in self.container.list_all_objects(
+            batch_size=1, prefetch=2)]
+        self.assertListEqual(object_names, [o["name"] for o in objects])
+
+        objects = self.container.list_all_objects(batch_size=1, prefetch=1)
+        self.assertEqual(next(objects)["name"], object_names[0])
+        objects.close()
+
+        self.container.delete_objects(object_names)
+
+    def test_stream_objects(self):
+        object_names = ["a.txt", "tmp/b.txt", "tmp/c.txt"]
+        for name in object_names:
+            object = self.container.create_object(name)
+            object.write("test")
+
+        summary = lambda objects: [(o["name"], o["hash"], o["bytes"])
+                for o in objects]
+        expected = summary(self.container.list_all_objects())
+        for batch_size in [1, 2, 10000]:
+            objects = list(self.container.stream_objects(
+                batch_size=batch_size))
+            self.assertTrue(all(isinstance(o, ObjectRecord) for o in objects))
+            self.assertListEqual(object_names, [o.name for o in objects])
+            self.assertListEqual(expected, summary(objects))
+
+        objects = list(self.container.stream_objects(as_dict=True))
+        self.assertTrue(isinstance(objects[0], dict))
+        self.assertListEqual(expected, summary(objects))
+
+        objects = list(self.container.stream_objects(delimiter="/"))
+        self.assertListEqual(["a.txt", None], [o.get("name") for o in objects])
+        self.assertEqual(objects[1]["subdir"], "tmp/")
+
+        objects = self.container.stream_objects(batch_size=1)
+        self.assertEqual(next(objects)["name"], object_names[0])
+        objects.close()
+
         self.container.delete_objects(object_names)
 
+    def test_scan_objects(self):
+        object_names = ["0.txt", "a.txt", "m.txt", "tmp/b.txt", "tmp/c.txt",
+                "tmp2/d.txt", "z.txt"]
+        for name in object_names:
+            object = self.container.create_object(name)
+            object.write("test")
+
+        objects = self.container.scan_objects(shards=4, batch_size=1)
+        self.assertListEqual(object_names, [o.name for o in objects])
+
+        objects = self.container.scan_objects(
+                boundaries=["a.txt", "m", "tmp/c.txt"], concurrency=2)
+        self.assertListEqual(object_names, [o.name for o in objects])
+
+        #boundaries are sorted and deduplicated
+        objects = self.container.scan_objects(
+                boundaries=["tmp/c.txt", "a.txt", "m", "a.txt"])
+        self.assertListEqual(object_names, [o.name for o in objects])
+
+        objects = self.container.scan_objects(shards=8, ordered=False)
+        self.assertListEqual(object_names, sorted(o.name for o in objects))
+
+        objects = self.container.scan_objects(delimiter="/", as_dict=True)
+        self.assertListEqual(object_names, [o["name"] for o in objects])
+
+        objects = self.container.scan_objects(delimiter="/", ordered=False)
+        self.assertListEqual(object_names, sorted(o.name for o in objects))
+
+        objects = self.container.scan_objects(prefix="tmp", shards=4)
+        self.assertListEqual(object_names[3:6], [o.name for o in objects])
+
+        self.container.delete_objects(object_names)
+
+    def test_create_index(self):
+        object_names = ["a.txt", "tmp/b.txt", "tmp/c.txt", "tmp2/d.txt"]
+        for name in object_names:
+            object = self.container.create_object(name)
+            object.write("test")
+
+        index = self.container.create_index(batch_size=2)
+        self.assertEqual(len(index), 4)
+        self.assertTrue("tmp/b.txt" in index)
+        self.assertFalse("tmp/x.txt" in index)
+        self.assertEqual(index.get("a.txt").bytes, 4)
+        self.assertEqual(index.get("a.txt").hash,
+                hashlib.md5("test").hexdigest())
+        self.assertListEqual(list(index.prefix("tmp/")),
+                ["tmp/b.txt", "tmp/c.txt"])
+        self.assertListEqual(index.list(delimiter="/"),
+                ["a.txt", "tmp/", "tmp2/"])
+        self.assertListEqual(index.list(prefix="tmp/", delimiter="/"),
+                ["tmp/b.txt", "tmp/c.txt"])
+        self.assertFalse(index.refresh())
+
+        #appended objects are listed incrementally
+        self.container.create_object("z.txt").write("test")
+        self.assertTrue(index.drifted())
+        self.assertTrue(index.refresh())
+        self.assertTrue("z.txt" in index)
+
+        #other changes require a new snapshot
+        self.container.delete_object("a.txt")
+        self.assertTrue(index.refresh())
+        self.assertFalse("a.txt" in index)
+        self.assertEqual(len(index), 4)
+
+        path = "/tmp/tr_unittest_index_%d" % os.getpid()
+        index.save(path)
+        loaded = ContainerIndex.load(self.container, path)
+        os.remove(path)
+        self.assertListEqual(list(loaded), list(index))
+        self.assertEqual(loaded.get("z.txt"), index.get("z.txt"))
+        self.assertFalse(loaded.drifted())
+
+        self.container.delete_objects(object_names[1:] + ["z.txt"])
+
+    def test_iter_json_array(self):
+        entries = [{"name": "a%d" % i, "bytes": i} for i in range(20)]
+        for read_size in [1, 7, 1000]:
+            stream = StringIO.StringIO(json.dumps(entries))
+            self.assertListEqual(entries,
+                    list(iter_json_array(stream, read_size=read_size)))
+        self.assertListEqual([],
+                list(iter_json_array(StringIO.StringIO("[]"))))
+
+    def test_marker_before(self):
+        for name in [u"a", "tmp/c.txt", u"a\xe9", u"x\U0001f600", u"a\x00"]:
+            marker = marker_before(name)
+            if isinstance(name, unicode):
+                name = name.encode("utf-8")
+            self.assertTrue(marker.encode("utf-8") < name)
+        self.assertEqual(marker_before("b"), u"a\U0010ffff")
+
     
     def test_create_object(self):
         object_name = "create.txt"
@@ -251,6 +460,27 @@ class TestCloudfilesContainer(unittest.TestCase):
             with self.assertRaises(NoSuchObject):
                 self.container.get_object(object_name)
     
+    def test_delete_all_objects_concurrent(self):
+        object_names = ["a.txt", "b.txt", "c.txt", "d.txt", "e.txt"]
+        object_data = "data"
+        for object_name in object_names:
+            obj = self.container.create_object(object_name)
+            obj.write(object_data)
+
+        progress = []
+        result = self.container.delete_all_objects(
+                batch_size=2,
+                concurrency=2,
+                bulk=False,
+                callback=lambda r: progress.append(r.processed))
+        self.assertEqual(result.deleted, len(object_names))
+        self.assertEqual(len(result.errors), 0)
+        self.assertEqual(len(progress), 3)
+        self.assertEqual(len(self.container.list()), 0)
+
+        result = self.container.delete_objects(["missing.txt"], bulk=False)
+        self.assertEqual(result.not_found, 1)
+
     def test_delete(self):
         container_name = "trunittest_delete"
         container = self.cloudfiles.create_container(container_name)
@@ -387,6 +617,112 @@ class TestCloudfilesContainer(unittest.TestCase):
         self.assertListEqual(self.container.list(), files)
         self.container.delete_all_objects()
 
+    def test_extract_archive_stream(self):
+        path = os.path.join(os.path.dirname(__file__), "data/cloudfiles_archive")
+        result = self.container.extract_archive_stream(path)
+        self.assertEqual(result.get("Number Files Created"), 3)
+        files = ["a.txt", "tmp/b.txt", "tmp/c.txt"]
+        self.assertListEqual(self.container.list(), files)
+        self.container.delete_all_objects()
+
+        entries = ((name, "data") for name in files)
+        result = self.container.extract_archive_stream(entries,
+                format="tar.bz2", max_files=2)
+        self.assertEqual(result.get("Number Files Created"), 3)
+        self.assertListEqual(self.container.list(), files)
+        self.assertEqual(self.container.get_object("tmp/c.txt").read(), "data")
+        self.container.delete_all_objects()
+
+        #archives are split on tar size, including headers and padding
+        entries = [("%d.txt" % i, "x" * 1024) for i in range(4)]
+        result = self.container.extract_archive_stream(entries,
+                format="tar", max_bytes=20 * 1024)
+        self.assertEqual(result.get("Number Files Created"), 4)
+        self.assertEqual(len(self.container.list()), 4)
+        self.container.delete_all_objects()
+
+        with self.assertRaises(ValueError):
+            self.container.extract_archive_stream([("large.txt", "x" * 2048)],
+                    format="tar", max_bytes=2048)
+
+    def test_copy_objects(self):
+        object_names = ["a.txt", "tmp/b.txt", "tmp/c.txt"]
+        for name in object_names:
+            self.container.create_object(name).write("data")
+        destination = self.cloudfiles.create_container(
+                "%s_copy" % self.container_name)
+
+        result = self.container.copy_objects(destination, prefix="tmp/",
+                metadata={"x-object-meta-unittest": "copy"})
+        self.assertEqual(len(result.copied), 2)
+        self.assertEqual(len(result.errors), 0)
+        self.assertListEqual(destination.list(), object_names[1:])
+        obj = destination.get_object("tmp/b.txt")
+        self.assertEqual(obj.read(), "data")
+        self.assertEqual(obj.metadata["x-object-meta-unittest"], "copy")
+
+        result = self.container.copy_objects(destination,
+                object_names=["a.txt", "missing.txt"],
+                rename=lambda name: "renamed/" + name)
+        self.assertListEqual(result.copied.keys(), ["a.txt"])
+        self.assertListEqual(result.errors.keys(), ["missing.txt"])
+        self.assertEqual(destination.get_object("renamed/a.txt").read(), "data")
+
+        #copies within the listed prefix aren't copied again
+        result = self.container.copy_objects(self.container, prefix="tmp/",
+                rename=lambda name: name + ".copy")
+        self.assertEqual(len(result.copied), 2)
+        self.assertListEqual(self.container.list(prefix="tmp/"),
+                ["tmp/b.txt", "tmp/b.txt.copy", "tmp/c.txt", "tmp/c.txt.copy"])
+
+        destination.delete_all_objects()
+        destination.delete()
+        self.container.delete_all_objects()
+
+    def test_sync(self):
+        path = os.path.join(os.path.dirname(__file__), "data/cloudfiles_archive")
+        files = ["sync/a.txt", "sync/tmp/b.txt", "sync/tmp/c.txt"]
+        self.container.create_object("sync/orphan.txt").write("orphan")
+
+        result = self.container.sync(path, prefix="sync/")
+        self.assertEqual(result.uploaded_objects, 3)
+        self.assertEqual(len(result.errors), 0)
+        self.assertListEqual(self.container.list(prefix="sync/"),
+                files[:1] + ["sync/orphan.txt"] + files[1:])
+
+        result = self.container.sync(path, prefix="sync/", delete=True)
+        self.assertEqual(result.uploaded_objects, 0)
+        self.assertEqual(result.uploaded_bytes, 0)
+        self.assertEqual(result.skipped_objects, 3)
+        self.assertEqual(result.deleted_objects, 1)
+        self.assertListEqual(self.container.list(prefix="sync/"), files)
+        self.container.delete_all_objects()
+
+    def test_sync_segmented(self):
+        segment_size = 1024 * 1024
+        path = "/tmp/tr_unittest_sync_%s" % int(time.time())
+        os.mkdir(path)
+        with open(os.path.join(path, "large.bin"), "wb") as f:
+            f.write(os.urandom(segment_size * 2 + 10))
+
+        result = self.container.sync(path, prefix="sync_segmented/",
+                segment_size=segment_size)
+        self.assertEqual(result.uploaded_objects, 1)
+        self.assertEqual(len(result.errors), 0)
+
+        result = self.container.sync(path, prefix="sync_segmented/",
+                segment_size=segment_size)
+        self.assertEqual(result.uploaded_objects, 0)
+        self.assertEqual(result.skipped_objects, 1)
+
+        os.remove(os.path.join(path, "large.bin"))
+        os.rmdir(path)
+        segment_container = self.cloudfiles.get_container(
+                "%s_segments" % self.container_name)
+        self.container.delete_all_objects()
+        segment_container.delete_all_objects()
+        segment_container.delete()
+
 class TestCloudfilesStorageObject(unittest.TestCase):
     
     @classmethod
@@ -448,6 +784,23 @@ class TestCloudfilesStorageObject(unittest.TestCase):
 
         obj.delete()
 
+    def test_temp_urls(self):
+        names = ["temp%d.txt" % i for i in range(3)]
+        objects = [self.container.create_object(name) for name in names]
+        for obj in objects:
+            obj.write(obj.name)
+
+        urls = self.cloudfiles.temp_urls(
+                [(obj, "GET", 60) for obj in objects])
+        self.assertEqual([urllib.urlopen(url).read() for url in urls], names)
+
+        self.cloudfiles.invalidate_temp_url_key()
+        url = objects[0].temp_url("GET", 60)
+        self.assertEqual(urllib.urlopen(url).read(), names[0])
+
+        for obj in objects:
+            obj.delete()
+
     def test_read(self):
         obj = self.container.create_object("test.txt")
         object_data = "data"
@@ -514,6 +867,43 @@ class TestCloudfilesStorageObject(unittest.TestCase):
 
         obj.delete()
 
+    def test_read_concurrent(self):
+        obj = self.container.create_object("test.txt")
+        object_data = "abcdefghijklmnopqrstuvwxyz"
+        obj.write(object_data)
+
+        self.assertEqual(obj.read(concurrency=3, range_size=4), object_data)
+        self.assertEqual(obj.read(size=10, offset=5, concurrency=2,
+            range_size=3), object_data[5:15])
+
+        chunks = [c for c in obj.chunks(chunk_size=13, concurrency=2)]
+        self.assertListEqual([object_data[:13], object_data[13:]], chunks)
+
+        obj.delete()
+
+    def test_download(self):
+        obj = self.container.create_object("test.txt")
+        object_data = "abcdefghijklmnopqrstuvwxyz"
+        obj.write(object_data)
+
+        path = "/tmp/tr_unittest_download_%s" % int(time.time())
+        checkpoint_path = "%s.checkpoint" % path
+        self.assertEqual(obj.download(path, range_size=5), len(object_data))
+        self.assertFalse(os.path.exists(checkpoint_path))
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), object_data)
+
+        #simulate partially completed download
+        with open(checkpoint_path, "w") as f:
+            f.write('{"etag": "%s", "size": %d, "completed": [[0, 20]]}'
+                    % (obj.etag, len(object_data)))
+        self.assertEqual(obj.download(path, range_size=5), 6)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), object_data)
+
+        os.remove(path)
+        obj.delete()
+
     def test_write(self):
         obj = self.container.create_object("test.txt")
         object_data = "data"
@@ -554,6 +944,120 @@ class TestCloudfilesStorageObject(unittest.TestCase):
 
         self.container.delete_all_objects()
 
+    def test_write_file(self):
+        path = os.path.join(os.path.dirname(__file__),
+                "data/cloudfiles_archive.tar.gz")
+        with open(path, "rb") as f:
+            object_data = f.read()
+
+        obj = self.container.create_object("test_file.tar.gz")
+        obj.write_file(path, block_size=100)
+        self.assertEqual(obj.read(), object_data)
+        self.assertEqual(obj.etag.lower(), hashlib.md5(object_data).hexdigest())
+
+        with open(path, "rb") as f:
+            obj.write_file(f.fileno())
+        self.assertEqual(obj.read(), object_data)
+
+        with open(path, "rb") as f:
+            obj.write(f, verify=True)
+        self.assertEqual(obj.read(), object_data)
+
+        obj.write_file(memoryview(object_data))
+        self.assertEqual(obj.read(), object_data)
+
+        #pipes can't be mapped and are streamed instead
+        read_fd, write_fd = os.pipe()
+        os.write(write_fd, object_data[:4096])
+        os.close(write_fd)
+        obj.write_file(read_fd)
+        os.close(read_fd)
+        self.assertEqual(obj.read(), object_data[:4096])
+
+        reader = MappedBuffer(object_data).reader(block_size=100)
+        self.assertEqual(len(reader.read(10)), 10)
+        self.assertEqual(len(next(iter(reader))), 100)
+
+        self.container.delete_all_objects()
+
+    def test_write_segmented(self):
+        obj = self.container.create_object("test_segmented.txt")
+        segment_size = 1024 * 1024
+        object_data = os.urandom(segment_size * 2 + 10)
+        obj.write(object_data,
+                segment_size=segment_size,
+                segment_concurrency=2)
+
+        obj = self.container.get_object("test_segmented.txt")
+        self.assertEqual(obj.content_length, len(object_data))
+        self.assertEqual(obj.read(), object_data)
+
+        segment_etags = [hashlib.md5(object_data[i:i + segment_size]).hexdigest()
+                for i in range(0, len(object_data), segment_size)]
+        self.assertEqual(obj.etag.strip('"').lower(), slo_etag(segment_etags))
+
+        segment_container = self.cloudfiles.get_container(
+                "%s_segments" % self.container_name)
+        self.assertEqual(len(segment_container.list()), 3)
+
+        self.container.delete_all_objects()
+        segment_container.delete_all_objects()
+        segment_container.delete()
+
+    def test_write_segmented_journal(self):
+        obj = self.container.create_object("test_journal.txt")
+        segment_size = 1024 * 1024
+        path = "/tmp/tr_unittest_journal_data_%s" % int(time.time())
+        journal_path = "/tmp/tr_unittest_journal_%s" % int(time.time())
+
+        def interrupted_write(data):
+            #kill the upload once the first segment has been journaled
+            with open(path, "wb") as f:
+                f.write(data)
+            stat_result = os.stat(path)
+            greenlet = gevent.spawn(obj.write_file, path,
+                    segment_size=segment_size,
+                    segment_concurrency=1,
+                    journal_path=journal_path)
+            while not greenlet.ready():
+                journal = UploadJournal.load(journal_path)
+                if journal is not None and journal.segments:
+                    break
+                gevent.sleep(0.1)
+            greenlet.kill()
+            self.assertTrue(os.path.exists(journal_path))
+            return stat_result
+
+        object_data = os.urandom(segment_size * 3)
+        interrupted_write(object_data)
+        obj.write_file(path,
+                segment_size=segment_size,
+                journal_path=journal_path)
+        self.assertFalse(os.path.exists(journal_path))
+        self.assertEqual(obj.read(), object_data)
+
+        segment_container = self.cloudfiles.get_container(
+                "%s_segments" % self.container_name)
+        self.assertEqual(len(segment_container.list()), 3)
+
+        #journaled segments aren't reused if the source changed, even
+        #if its size and modification time are unchanged.
+        segment_container.delete_all_objects()
+        stat_result = interrupted_write(os.urandom(segment_size * 3))
+        object_data = os.urandom(segment_size * 3)
+        with open(path, "wb") as f:
+            f.write(object_data)
+        os.utime(path, (stat_result.st_atime, stat_result.st_mtime))
+        obj.write_file(path,
+                segment_size=segment_size,
+                journal_path=journal_path)
+        self.assertEqual(obj.read(), object_data)
+
+        os.remove(path)
+        self.container.delete_all_objects()
+        segment_container.delete_all_objects()
+        segment_container.delete()
+
     def test_update_metadata(self):
         key = "x-object-meta-unittest"
         remove_key = "x-remove-object-meta-unittest"
@@ -771,6 +1275,372 @@ class TestCloudfilesConnection(unittest.TestCase):
         self.container.delete_objects(object_names)
 
 
+    def test_pooled_connections(self):
+        object_names = ["pool%d.txt" % i for i in range(20)]
+        greenlets = [gevent.spawn(self.container.create_object(name).write,
+            "test") for name in object_names]
+        gevent.joinall(greenlets, raise_error=True)
+
+        greenlets = [gevent.spawn(self.container.get_object, name)
+                for name in object_names]
+        gevent.joinall(greenlets, raise_error=True)
+        self.assertEqual([g.value.read() for g in greenlets],
+                ["test"] * len(object_names))
+
+        rest_client = self.cloudfiles.cloudfiles.rest_client
+        self.assertTrue(rest_client.pool.idle_count > 1)
+        self.assertEqual(rest_client.pool.checked_out_count, 0)
+
+        self.container.delete_objects(object_names)
+
+    def test_pooled_response_close(self):
+        self.container.create_object("close.txt").write("test")
+        rest_client = self.cloudfiles.cloudfiles.rest_client
+
+        response = self.cloudfiles._send_request("GET",
+                "/%s/close.txt" % self.container_name)
+        self.assertEqual(rest_client.pool.checked_out_count, 1)
+        idle_count = rest_client.pool.idle_count
+        response.close()
+        self.assertEqual(rest_client.pool.checked_out_count, 0)
+        self.assertEqual(rest_client.pool.idle_count, idle_count + 1)
+
+        self.container.delete_object("close.txt")
+
+    def test_limiter_streaming(self):
+        limiter = AIMDLimiter(initial_limit=1, min_limit=1, max_limit=1)
+        cloudfiles = GCloudfilesClient(
+                username="trdev",
+                password="B88mMJqh",
+                timeout=30,
+                retries=2,
+                servicenet=False,
+                limiter=limiter)
+        self.container.create_object("stream.txt").write("test")
+
+        #slot is released once headers are received, so requests
+        #can be made while the body is streamed.
+        response = cloudfiles._send_request("GET",
+                "/%s/stream.txt" % self.container_name)
+        self.assertEqual(limiter.in_flight, 0)
+        with gevent.Timeout(10):
+            container = cloudfiles.get_container(self.container_name)
+            container.create_object("stream2.txt").write("test")
+        self.assertEqual(response.read(), "test")
+
+        self.container.delete_objects(["stream.txt", "stream2.txt"])
+
+    def test_metrics(self):
+        metrics = InMemoryMetrics()
+        cloudfiles = GCloudfilesClient(
+                username="trdev",
+                password="B88mMJqh",
+                timeout=30,
+                retries=2,
+                servicenet=False,
+                metrics=metrics)
+        container = cloudfiles.get_container(self.container_name)
+
+        obj = container.create_object("metrics.txt")
+        obj.write("test")
+        self.assertEqual(container.get_object("metrics.txt").read(), "test")
+        obj.delete()
+
+        snapshot = metrics.snapshot()
+        self.assertTrue(snapshot["cloudfiles.bytes_sent"] >= 4)
+        self.assertTrue(snapshot["cloudfiles.bytes_received"] >= 4)
+        self.assertTrue(snapshot["cloudfiles.request.put"]["count"] >= 1)
+        self.assertTrue(snapshot["cloudfiles.pool_wait"]["count"] >= 3)
+
+
+class TestTempUrlSigner(unittest.TestCase):
+
+    def test_sign(self):
+        signer = TempUrlSigner("key", "https://host/v1/AUTH_test")
+        url = signer.sign("/container/a%20b", "GET", 100)
+        signature = hmac.new("key", "GET\n100\n/v1/AUTH_test/container/a b",
+                hashlib.sha1).hexdigest()
+        self.assertEqual(url, "https://host/v1/AUTH_test/container/a%20b"
+                + "?temp_url_sig=%s&temp_url_expires=100" % signature)
+
+        urls = signer.sign_many([("/container/a%20b", "GET", 50)], now=50)
+        self.assertEqual(urls, [url])
+
+    def test_public_storage_url(self):
+        self.assertEqual(public_storage_url("https://snet-host/v1/AUTH_test"),
+                "https://host/v1/AUTH_test")
+        self.assertEqual(public_storage_url("https://host/v1/AUTH_test"),
+                "https://host/v1/AUTH_test")
+
+
+class TestEndpointSelector(unittest.TestCase):
+
+    class Endpoint(object):
+        def __init__(self, delay, status=204):
+            self.delay = delay
+            self.status = status
+
+        def send_request(self, method, path):
+            gevent.sleep(self.delay)
+            return self
+
+        def read(self):
+            return ""
+
+    class Client(object):
+        cloudfiles = None
+        metrics = None
+
+    def test_select(self):
+        metrics = InMemoryMetrics()
+        client = self.Client()
+        endpoints = {
+            "servicenet": self.Endpoint(0.05),
+            "public": self.Endpoint(0.01)
+        }
+        selector = EndpointSelector(probe_interval=None,
+                failure_threshold=2, metrics=metrics)
+        selector.attach(client, endpoints, "servicenet")
+        #endpoints are probed in the background
+        self.assertEqual(selector.current, "servicenet")
+        selector._prober.join()
+        self.assertEqual(selector.current, "public")
+        self.assertTrue(client.cloudfiles is endpoints["public"])
+        self.assertEqual(metrics.counters["cloudfiles.endpoint.switch"], 1)
+
+        #consecutive failures trigger re-evaluation
+        endpoints["public"].status = 503
+        selector.observe("public", error=IOError())
+        selector.observe("public", result=endpoints["public"])
+        selecting = selector._selecting
+        selector.observe("public", error=IOError())
+        self.assertTrue(selector._selecting is selecting)
+        selecting.join()
+        self.assertEqual(selector.current, "servicenet")
+        self.assertTrue(client.cloudfiles is endpoints["servicenet"])
+
+        #failures on other endpoints are ignored
+        selector.observe("public", error=IOError())
+        selector.observe("public", error=IOError())
+        self.assertEqual(selector.failures, 0)
+
+        with self.assertRaises(ValueError):
+            selector.attach(self.Client(), endpoints, "servicenet")
+
+    def test_factories(self):
+        client = self.Client()
+        public = self.Endpoint(0.01)
+        selector = EndpointSelector(probe_interval=60)
+        selector.attach(client, {"servicenet": self.Endpoint(0.05)},
+                "servicenet", factories={"public": lambda: public})
+        self.assertNotIn("public", selector.endpoints)
+
+        #periodic selections don't overlap failure-triggered ones
+        gevent.sleep(0.01)
+        selector.failures = selector.failure_threshold - 1
+        selector.observe("servicenet", error=IOError())
+        self.assertTrue(selector._selecting is None)
+
+        gevent.sleep(0.5)
+        self.assertTrue(selector.endpoints["public"] is public)
+        self.assertTrue(client.cloudfiles is public)
+        selector.close()
+        self.assertTrue(selector._prober.dead)
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_histogram(self):
+        histogram = Histogram(buckets=(1, 2, 4, 8))
+        for value in [0.5, 1.5, 1.5, 3, 100]:
+            histogram.add(value)
+        self.assertEqual(histogram.count, 5)
+        self.assertEqual(histogram.max, 100)
+        self.assertEqual(histogram.percentile(50), 2)
+        self.assertEqual(histogram.percentile(80), 4)
+        self.assertEqual(histogram.percentile(100), 100)
+
+    def test_in_memory(self):
+        metrics = InMemoryMetrics()
+        metrics.count("requests")
+        metrics.count("requests", 2)
+        with metrics.timer("latency"):
+            gevent.sleep(0.01)
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["requests"], 3)
+        self.assertEqual(snapshot["latency"]["count"], 1)
+        self.assertTrue(snapshot["latency"]["min"] >= 0.01)
+
+        #base class is a null sink
+        Metrics().count("requests")
+        Metrics().timing("latency", 1)
+
+    def test_count_retries(self):
+        class RestClient(object):
+            def __init__(self, *args, **kwargs):
+                pass
+
+            def send_request(self, method, path):
+                return None
+
+        metrics = InMemoryMetrics()
+        rest_client = GPooledRestClient(
+                rest_client_class=RestClient,
+                metrics=metrics,
+                metrics_name="test")
+        def send_request(attempts):
+            for i in range(attempts):
+                rest_client.send_request("GET", "/")
+        send_request = rest_client.count_retries(send_request)
+
+        send_request(1)
+        self.assertNotIn("test.retries", metrics.counters)
+        send_request(3)
+        self.assertEqual(metrics.counters["test.retries"], 2)
+
+
+class TestReplicatedCloudfiles(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cloudfiles = GReplicatedCloudfilesClient(
+                regions=["DFW", "ORD"],
+                username="trdev",
+                password="B88mMJqh",
+                timeout=30,
+                servicenet=False)
+
+        cls.container_name = "tr_unittest_%s" % int(time.time())
+        result = cls.cloudfiles.create_container(cls.container_name)
+        gevent.joinall(result.pending.values(), raise_error=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        for client in cls.cloudfiles.clients.values():
+            container = client.get_container(cls.container_name)
+            container.delete_all_objects()
+            container.delete()
+
+    def test_write_read(self):
+        result = self.cloudfiles.write(self.container_name, "a.txt", "test")
+        self.assertEqual(len(result.results) + len(result.pending), 2)
+        gevent.joinall(result.pending.values(), raise_error=True)
+
+        latencies = self.cloudfiles.measure()
+        self.assertTrue(all(l is not None for l in latencies.values()))
+        self.assertEqual(
+                self.cloudfiles.read(self.container_name, "a.txt"), "test")
+
+        for client in self.cloudfiles.clients.values():
+            container = client.get_container(self.container_name)
+            self.assertEqual(container.get_object("a.txt").read(), "test")
+
+        result = self.cloudfiles.delete(self.container_name, "a.txt")
+        gevent.joinall(result.pending.values(), raise_error=True)
+        with self.assertRaises(NoSuchObject):
+            self.cloudfiles.get_object(self.container_name, "a.txt")
+
+    def test_fallback(self):
+        #write to the farthest region only
+        region = self.cloudfiles.nearest()[-1]
+        container = self.cloudfiles.clients[region].get_container(
+                self.container_name)
+        container.create_object("b.txt").write("test")
+
+        #missing objects and body transfers don't affect latencies
+        latencies = dict(self.cloudfiles.latencies)
+        self.assertEqual(
+                self.cloudfiles.read(self.container_name, "b.txt"), "test")
+        self.assertEqual(self.cloudfiles.latencies, latencies)
+        container.delete_object("b.txt")
+
+
+class TestAIMDLimiter(unittest.TestCase):
+
+    def test_limit(self):
+        limiter = AIMDLimiter(initial_limit=4, min_limit=1, max_limit=8)
+        epochs = [limiter.acquire() for i in range(4)]
+        with self.assertRaises(Exception):
+            limiter.acquire(timeout=0.1)
+
+        #only one decrease per congestion event
+        for epoch in epochs[:2]:
+            limiter.release(epoch, THROTTLED)
+        self.assertEqual(limiter.limit, 2)
+
+        for epoch in epochs[2:]:
+            limiter.release(epoch, SUCCESS)
+        self.assertEqual(limiter.in_flight, 0)
+
+        for i in range(20):
+            limiter.release(limiter.acquire(), SUCCESS)
+        self.assertTrue(limiter.limit > 2)
+
+        for i in range(100):
+            limiter.release(limiter.acquire(), SUCCESS)
+        self.assertEqual(limiter.limit, 8)
+
+    def test_slot(self):
+        limiter = AIMDLimiter(initial_limit=4)
+        with self.assertRaises(gevent.Timeout):
+            with limiter.slot():
+                raise gevent.Timeout()
+        self.assertEqual(limiter.limit, 2)
+        self.assertEqual(limiter.in_flight, 0)
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    class Response(object):
+        def __init__(self, status):
+            self.status = status
+            self.closed = False
+
+        def close(self):
+            self.closed = True
+
+    def test_retry(self):
+        policy = RetryPolicy(max_attempts=3, backoff=0.01)
+        responses = [self.Response(503), self.Response(200)]
+        result = policy.execute(lambda: responses.pop(0), method="GET")
+        self.assertEqual(result.status, 200)
+
+        #non-idempotent requests are not retried
+        responses = [self.Response(503), self.Response(200)]
+        result = policy.execute(lambda: responses.pop(0), method="POST")
+        self.assertEqual(result.status, 503)
+
+        attempts = []
+        def attempt():
+            attempts.append(1)
+            raise IOError()
+        with self.assertRaises(IOError):
+            policy.execute(attempt, method="HEAD")
+        self.assertEqual(len(attempts), 3)
+
+    def test_deadline(self):
+        policy = RetryPolicy(max_attempts=10, backoff=0.01)
+        start = time.time()
+        with self.assertRaises(DeadlineExceeded):
+            with deadline(0.2):
+                policy.execute(lambda: gevent.sleep(1), method="GET")
+        self.assertTrue(time.time() - start < 0.5)
+
+    def test_hedge(self):
+        policy = RetryPolicy(hedge_percentile=50, hedge_min_samples=1)
+        policy.latencies.extend([0.05] * 10)
+        slow = self.Response(200)
+        responses = [(1, slow), (0, self.Response(200))]
+        def attempt():
+            delay, response = responses.pop(0)
+            gevent.sleep(delay)
+            return response
+        start = time.time()
+        result = policy.execute(attempt, method="GET")
+        self.assertTrue(result is not slow)
+        self.assertTrue(time.time() - start < 0.5)
+
+
 class TestCloudfilesFactory(unittest.TestCase):
     
     @classmethod
@@ -791,6 +1661,35 @@ class TestCloudfilesFactory(unittest.TestCase):
         client = self.factory.create()
         client.list_containers()
 
+    def test_pooled(self):
+        factory = GPooledFactory(self.factory, size=2)
+        with factory.get() as client:
+            client.list_containers()
+
+        with factory.get() as client2:
+            self.assertIs(client2, client)
+            with factory.get() as client3:
+                self.assertIsNot(client3, client)
+
+        factory = GPooledFactory(self.factory, size=2,
+                validate=lambda client: False)
+        with factory.get() as client:
+            client.list_containers()
+        with factory.get() as client2:
+            self.assertIsNot(client2, client)
+
+    def test_pooled_errors(self):
+        factory = GPooledFactory(self.factory, size=2)
+        with factory.get() as client:
+            self.assertIsNotNone(client._identity_client.token)
+            with self.assertRaises(NoSuchContainer):
+                client.get_container("blahblahblah")
+
+        #application errors don't discard the client
+        with factory.get() as client2:
+            self.assertIs(client2, client)
+        self.assertEqual(factory.pool.idle_count, 1)
+
 
 if __name__ == "__main__":
     unittest.main()
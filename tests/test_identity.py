@@ -3,6 +3,8 @@ import unittest
 import time
 
 import testbase
+from trrackspace_gevent.services.identity.cache import TokenCache, \
+        TokenCacheEntry
 from trrackspace_gevent.services.identity.client import GIdentityServiceClient
 from trrackspace_gevent.services.identity.factory import GIdentityServiceClientFactory
 
@@ -23,6 +25,92 @@ class TestIdentityService(unittest.TestCase):
     def test_list_users(self):
         users = self.identitysvc.list_users()
 
+    def test_shared_token(self):
+        client = GIdentityServiceClient(
+                username="trdev",
+                password="B88mMJqh",
+                timeout=5,
+                debug_level=0)
+        client.list_users()
+        self.assertEqual(client.token.id, self.identitysvc.token.id)
+
+class TestTokenCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = TokenCache(refresh_window=10)
+        self.calls = []
+        self.ttl = 60
+
+    def tearDown(self):
+        self.cache.invalidate()
+
+    def authenticate(self):
+        self.calls.append(1)
+        gevent.sleep(0.1)
+        return TokenCacheEntry(
+                token_id="token%d" % len(self.calls),
+                state={},
+                expires_at=time.time() + self.ttl)
+
+    def test_single_flight(self):
+        greenlets = [gevent.spawn(self.cache.get, "key", self.authenticate)
+                for i in range(10)]
+        gevent.joinall(greenlets, raise_error=True)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(set(g.value.token_id for g in greenlets),
+                set(["token1"]))
+
+    def test_stale_token(self):
+        entry = self.cache.get("key", self.authenticate)
+        greenlets = [gevent.spawn(self.cache.get, "key", self.authenticate,
+            stale_token_id=entry.token_id) for i in range(10)]
+        gevent.joinall(greenlets, raise_error=True)
+        self.assertEqual(len(self.calls), 2)
+
+        entry = self.cache.get("key", self.authenticate,
+                stale_token_id=entry.token_id)
+        self.assertEqual(entry.token_id, "token2")
+        self.assertEqual(len(self.calls), 2)
+
+    def test_proactive_refresh(self):
+        self.cache.refresh_window = 1.5
+        self.ttl = 2
+        entry = self.cache.get("key", self.authenticate)
+        self.assertEqual(self.cache.get("key", self.authenticate), entry)
+
+        #reads within the refresh window return the cached entry
+        #and refresh it in the background
+        gevent.sleep(1.1)
+        self.assertEqual(self.cache.get("key", self.authenticate), entry)
+        gevent.sleep(0.2)
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(self.cache.peek("key").token_id, "token2")
+
+        #entries which aren't read aren't refreshed
+        gevent.sleep(2)
+        self.assertEqual(len(self.calls), 2)
+        self.assertIsNone(self.cache.peek("key"))
+
+    def test_sync_token(self):
+        client = GIdentityServiceClient(
+                username="trdev",
+                password="B88mMJqh",
+                timeout=5,
+                token_cache=self.cache)
+        client.authenticate()
+        self.assertFalse(client.sync_token())
+
+        token_id = client.token.id
+        self.cache.invalidate()
+        other = GIdentityServiceClient(
+                username="trdev",
+                password="B88mMJqh",
+                timeout=5,
+                token_cache=self.cache)
+        other.authenticate()
+        #token isn't modified by authentications on behalf of the cache
+        self.assertEqual(client.token.id, token_id)
+
 class TestIdentityServiceFacotry(unittest.TestCase):
     
     @classmethod
@@ -1 +1,9 @@
 from trrackspace.errors import *
+
+class PoolTimeout(Exception):
+    """Timed out waiting for a pool object to become available."""
+    pass
+
+class DeadlineExceeded(Exception):
+    """Request deadline exceeded."""
+    pass
@@ -0,0 +1,162 @@
+import httplib
+import socket
+from contextlib import contextmanager
+
+import gevent
+
+from trpycore.factory.base import Factory
+from trrackspace_gevent.pool import GPool
+
+#Errors raised within GPooledFactory.get() which discard the object
+DEFAULT_DISCARD_ERRORS = (socket.error, httplib.HTTPException, gevent.Timeout)
+
+def authenticate(obj):
+    """Authenticate a newly created client so it's ready for requests.
+
+    Clients providing ensure_authenticated(), i.e. GCloudfilesClient,
+    or authenticate(), i.e. GIdentityServiceClient, are authenticated.
+    Other objects are left unchanged.
+    """
+    for name in ("ensure_authenticated", "authenticate"):
+        method = getattr(obj, name, None)
+        if method is not None:
+            method()
+            return
+
+class GPooledFactory(Factory):
+    """Factory maintaining a pool of ready objects created by another factory.
+
+    GPooledFactory wraps a factory, i.e. GCloudfilesClientFactory or
+    GIdentityServiceClientFactory, and keeps a bounded pool of the
+    objects it creates, so clients are authenticated and connected once
+    and reused. Objects are prepared, by default authenticated, when
+    they're created, checked out through the get() context manager,
+    validated on checkin, and evicted once idle for longer than
+    idle_timeout seconds.
+
+    create() is passed through to the wrapped factory, so a
+    GPooledFactory can be used anywhere a Factory is expected.
+
+    Example usage:
+        factory = GPooledFactory(GCloudfilesClientFactory(...), size=10)
+        with factory.get() as client:
+            client.get_container("container")
+    """
+
+    def __init__(self,
+            factory,
+            size=10,
+            idle_timeout=300,
+            checkout_timeout=None,
+            validate=None,
+            preload=0,
+            prepare=authenticate,
+            discard_errors=DEFAULT_DISCARD_ERRORS):
+        """GPooledFactory constructor
+
+        Args:
+            factory: Factory to create pooled objects with
+            size: maximum number of pooled objects
+            idle_timeout: optional number of seconds after which an
+                idle object will be evicted. If None, idle objects
+                will not be evicted.
+            checkout_timeout: optional number of seconds to wait for
+                an object to become available before PoolTimeout is
+                raised. If None, checkouts will wait indefinitely.
+            validate: optional callable invoked with objects on checkin.
+                Objects for which it returns False, or raises an
+                exception, are discarded instead of being reused.
+            preload: number of objects to create up front
+            prepare: optional callable invoked with newly created
+                objects before they're checked out. Defaults to
+                authenticating clients.
+            discard_errors: tuple of exception classes which discard
+                the object if raised within get(). Other exceptions,
+                i.e. NoSuchObject, return the object to the pool.
+                Defaults to connection errors and timeouts.
+        """
+        self.factory = factory
+        self.validate = validate
+        self.prepare = prepare
+        self.discard_errors = discard_errors
+        self.pool = GPool(
+                factory=self._create,
+                size=size,
+                idle_timeout=idle_timeout,
+                checkout_timeout=checkout_timeout)
+
+        objects = [self.pool.checkout() for i in range(min(preload, size))]
+        for obj in objects:
+            self.pool.checkin(obj)
+
+    def create(self):
+        """Return new, unpooled, object from the wrapped factory."""
+        return self.factory.create()
+
+    def checkout(self, timeout=None):
+        """Checkout object from the pool.
+
+        Objects must be returned to the pool with checkin().
+
+        Args:
+            timeout: optional number of seconds to wait for an object
+                to become available. Defaults to checkout_timeout.
+        Returns:
+            pooled object
+        Raises:
+            PoolTimeout if an object does not become available in time.
+        """
+        return self.pool.checkout(timeout)
+
+    def checkin(self, obj, discard=False):
+        """Return object to the pool.
+
+        Args:
+            obj: object previously returned by checkout()
+            discard: boolean indicating the object should be
+                discarded instead of reused.
+        """
+        if not discard and self.validate is not None:
+            try:
+                discard = not self.validate(obj)
+            except Exception:
+                discard = True
+        self.pool.checkin(obj, discard=discard)
+
+    @contextmanager
+    def get(self, timeout=None):
+        """Context manager to checkout and checkin a pooled object.
+
+        The object will be discarded if one of discard_errors is
+        raised or the greenlet is killed. It's returned to the pool
+        if any other exception is raised.
+
+        Args:
+            timeout: optional number of seconds to wait for an object
+                to become available. Defaults to checkout_timeout.
+        """
+        obj = self.checkout(timeout)
+        try:
+            yield obj
+        except self.discard_errors:
+            self.checkin(obj, discard=True)
+            raise
+        except Exception:
+            self.checkin(obj)
+            raise
+        except:
+            self.checkin(obj, discard=True)
+            raise
+        else:
+            self.checkin(obj)
+
+    def close(self):
+        """Evict all idle objects."""
+        self.pool.close()
+
+    def _create(self):
+        """Create and prepare a new pooled object."""
+        obj = self.factory.create()
+        if self.prepare is not None:
+            self.prepare(obj)
+        return obj
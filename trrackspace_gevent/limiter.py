@@ -0,0 +1,161 @@
+import socket
+from contextlib import contextmanager
+
+import gevent
+from gevent.event import Event
+
+from trrackspace_gevent.errors import PoolTimeout
+
+#Request outcomes reported to AIMDLimiter.release()
+SUCCESS = "success"
+THROTTLED = "throttled"
+NEUTRAL = "neutral"
+
+#Http statuses cloudfiles uses to indicate overload
+THROTTLE_STATUSES = (429, 498, 503)
+
+def request_outcome(result=None, error=None):
+    """Classify a request outcome for AIMDLimiter.release().
+
+    Results which aren't responses, and errors other than throttling
+    and timeouts, are NEUTRAL and don't adjust the limit.
+
+    Args:
+        result: optional response object with a status attribute
+        error: optional exception raised by the request
+    Returns:
+        SUCCESS, THROTTLED or NEUTRAL
+    """
+    if error is not None:
+        if isinstance(error, (socket.timeout, gevent.Timeout)):
+            return THROTTLED
+        if getattr(error, "status", None) in THROTTLE_STATUSES:
+            return THROTTLED
+        return NEUTRAL
+
+    status = getattr(result, "status", None)
+    if status is None:
+        return NEUTRAL
+    elif status in THROTTLE_STATUSES:
+        return THROTTLED
+    return SUCCESS
+
+
+class AIMDLimiter(object):
+    """Greenlet-safe adaptive concurrency limiter.
+
+    The concurrency limit is adjusted with additive increase,
+    multiplicative decrease (AIMD): each successful request increases
+    the limit by increase / limit, i.e. by increase once a full
+    limit's worth of requests succeed, and each throttled or timed out
+    request multiplies the limit by backoff.
+
+    Only one decrease is applied per congestion event. Throttling
+    reported for requests which started before the most recent
+    decrease is ignored, so a burst of throttled responses doesn't
+    collapse the limit to min_limit.
+
+    Example usage:
+        limiter = AIMDLimiter()
+        with limiter.slot() as slot:
+            response = send_request()
+            slot.outcome = request_outcome(response)
+    """
+
+    def __init__(self,
+            initial_limit=8,
+            min_limit=1,
+            max_limit=64,
+            increase=1.0,
+            backoff=0.5):
+        """AIMDLimiter constructor
+
+        Args:
+            initial_limit: initial concurrency limit
+            min_limit: minimum concurrency limit
+            max_limit: maximum concurrency limit
+            increase: additive increase per limit successful requests
+            backoff: multiplicative decrease factor (0 < backoff < 1)
+        """
+        if not 1 <= min_limit <= initial_limit <= max_limit:
+            raise ValueError(
+                    "min_limit <= initial_limit <= max_limit required")
+        if not 0 < backoff < 1:
+            raise ValueError("backoff must be between 0 and 1")
+
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.backoff = backoff
+        self.current_limit = float(initial_limit)
+        self.in_flight = 0
+        self.epoch = 0
+        self.event = Event()
+
+    @property
+    def limit(self):
+        """Current integer concurrency limit."""
+        return int(self.current_limit)
+
+    def acquire(self, timeout=None):
+        """Acquire a request slot, waiting while the limit is reached.
+
+        Args:
+            timeout: optional number of seconds to wait
+        Returns:
+            epoch token to pass to release()
+        Raises:
+            PoolTimeout if a slot doesn't become available in time.
+        """
+        with gevent.Timeout(timeout, PoolTimeout(
+                "limiter acquire timed out after %ss" % timeout)):
+            while self.in_flight >= self.limit:
+                self.event.clear()
+                self.event.wait()
+        self.in_flight += 1
+        return self.epoch
+
+    def release(self, epoch, outcome=SUCCESS):
+        """Release request slot and adjust the limit.
+
+        Args:
+            epoch: token returned by acquire()
+            outcome: SUCCESS, THROTTLED or NEUTRAL. NEUTRAL
+                releases the slot without adjusting the limit.
+        """
+        self.in_flight -= 1
+        if outcome == SUCCESS:
+            self.current_limit = min(self.max_limit,
+                    self.current_limit + self.increase / self.current_limit)
+        elif outcome == THROTTLED and epoch == self.epoch:
+            self.current_limit = max(self.min_limit,
+                    self.current_limit * self.backoff)
+            self.epoch += 1
+        self.event.set()
+
+    @contextmanager
+    def slot(self, timeout=None):
+        """Context manager to acquire and release a request slot.
+
+        The yielded LimiterSlot's outcome defaults to SUCCESS, or to
+        the classification of the exception raised in the context.
+        """
+        slot = LimiterSlot(self.acquire(timeout))
+        try:
+            yield slot
+        except (Exception, gevent.Timeout) as error:
+            self.release(slot.epoch, request_outcome(error=error))
+            raise
+        except:
+            self.release(slot.epoch, NEUTRAL)
+            raise
+        else:
+            self.release(slot.epoch, slot.outcome)
+
+
+class LimiterSlot(object):
+    """AIMDLimiter request slot."""
+
+    def __init__(self, epoch, outcome=SUCCESS):
+        self.epoch = epoch
+        self.outcome = outcome
@@ -0,0 +1,200 @@
+import bisect
+import time
+from contextlib import contextmanager
+
+from gevent import socket
+
+#Default latency histogram bucket upper bounds in seconds (1ms - 131s)
+DEFAULT_BUCKETS = tuple(0.001 * 2 ** i for i in range(18))
+
+class Metrics(object):
+    """Metrics sink base class.
+
+    Clients given a metrics sink report the following metrics, where
+    service is cloudfiles or identity:
+
+        <service>.request.<method>: request latency (timing)
+        <service>.pool_wait: connection pool wait time (timing)
+        <service>.bytes_sent: request body bytes (count)
+        <service>.bytes_received: response body bytes (count)
+        <service>.errors: requests which raised an exception (count)
+        <service>.throttled: throttled or timed out requests (count)
+        <service>.retries: retried requests (count)
+        <service>.hedges: hedged requests (count)
+        identity.authenticate: identity requests (timing)
+        identity.reauthenticate: re-authentications of rejected
+            or expired tokens (count)
+
+    Clients without a metrics sink skip instrumentation entirely.
+    Subclasses override timing() and count(), which discard metrics
+    by default.
+    """
+
+    def timing(self, name, seconds):
+        """Record a timing.
+
+        Args:
+            name: metric name
+            seconds: duration in seconds
+        """
+        pass
+
+    def count(self, name, value=1):
+        """Increment a counter.
+
+        Args:
+            name: metric name
+            value: increment
+        """
+        pass
+
+    @contextmanager
+    def timer(self, name):
+        """Context manager recording the duration of its block."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.timing(name, time.time() - start)
+
+
+class Histogram(object):
+    """Histogram of values with fixed bucket bounds."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """Histogram constructor
+
+        Args:
+            buckets: sorted bucket upper bounds. Values above the
+                last bound are counted in an overflow bucket.
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, percentile):
+        """Return upper bound of the bucket holding the percentile.
+
+        Args:
+            percentile: percentile, i.e. 99
+        Returns:
+            bucket upper bound, capped at the maximum value,
+            or None if the histogram is empty.
+        """
+        if not self.count:
+            return None
+        rank = self.count * percentile / 100.0
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                if index < len(self.buckets):
+                    return min(self.buckets[index], self.max)
+                break
+        return self.max
+
+
+class InMemoryMetrics(Metrics):
+    """Metrics sink aggregating counters and histograms in memory.
+
+    Example usage:
+        metrics = InMemoryMetrics()
+        client = GCloudfilesClient(..., metrics=metrics)
+        ...
+        print metrics.histograms["cloudfiles.request.get"].percentile(99)
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """InMemoryMetrics constructor
+
+        Args:
+            buckets: histogram bucket upper bounds in seconds
+        """
+        self.buckets = buckets
+        self.counters = {}
+        self.histograms = {}
+
+    def timing(self, name, seconds):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(self.buckets)
+        histogram.add(seconds)
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self):
+        """Return dict summarizing all metrics.
+
+        Returns:
+            dict of counter names to values, and histogram names
+            to dicts of count, mean, min, max, p50, p90 and p99.
+        """
+        result = dict(self.counters)
+        for name, histogram in self.histograms.items():
+            result[name] = {
+                "count": histogram.count,
+                "mean": histogram.mean,
+                "min": histogram.min,
+                "max": histogram.max,
+                "p50": histogram.percentile(50),
+                "p90": histogram.percentile(90),
+                "p99": histogram.percentile(99)
+            }
+        return result
+
+    def reset(self):
+        """Discard all metrics."""
+        self.counters = {}
+        self.histograms = {}
+
+
+class StatsdMetrics(Metrics):
+    """Metrics sink sending metrics to statsd over udp.
+
+    Send errors are ignored, so an unavailable statsd server never
+    fails requests.
+    """
+
+    def __init__(self, host="localhost", port=8125, prefix="trrackspace"):
+        """StatsdMetrics constructor
+
+        Args:
+            host: statsd host
+            port: statsd port
+            prefix: optional prefix prepended to metric names
+        """
+        self.address = (host, port)
+        self.prefix = prefix + "." if prefix else ""
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def timing(self, name, seconds):
+        self._send("%s%s:%d|ms" % (self.prefix, name, seconds * 1000))
+
+    def count(self, name, value=1):
+        self._send("%s%s:%d|c" % (self.prefix, name, value))
+
+    def close(self):
+        self.socket.close()
+
+    def _send(self, data):
+        try:
+            self.socket.sendto(data, self.address)
+        except Exception:
+            pass
@@ -0,0 +1,151 @@
+import collections
+import time
+from contextlib import contextmanager
+
+from gevent.lock import BoundedSemaphore
+
+from trrackspace_gevent.errors import PoolTimeout
+
+class GPool(object):
+    """Greenlet-safe bounded object pool.
+
+    The pool creates objects on demand using a factory up to a maximum
+    size. Checked in objects are kept idle for reuse and are evicted
+    once they've been idle for longer than idle_timeout seconds.
+    Checkouts block while size objects are checked out, for up to
+    checkout_timeout seconds.
+
+    Example usage:
+        pool = GPool(factory=create_connection, size=10)
+        with pool.get() as connection:
+            ...
+    """
+
+    def __init__(self,
+            factory,
+            size=10,
+            idle_timeout=60,
+            checkout_timeout=None,
+            close=None):
+        """GPool constructor
+
+        Args:
+            factory: callable returning a new pool object
+            size: maximum number of objects to create
+            idle_timeout: optional number of seconds after which an idle
+                object will be evicted. If None, idle objects will
+                not be evicted.
+            checkout_timeout: optional number of seconds to wait for
+                an object to become available before PoolTimeout
+                is raised. If None, checkouts will wait indefinitely.
+            close: optional callable invoked with objects which are
+                evicted or discarded from the pool.
+        """
+        if size < 1:
+            raise ValueError("size must be at least 1")
+
+        self.factory = factory
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.close_callback = close
+        self.semaphore = BoundedSemaphore(size)
+        self.idle = collections.deque()
+
+    @property
+    def idle_count(self):
+        """Number of idle objects in the pool."""
+        return len(self.idle)
+
+    @property
+    def checked_out_count(self):
+        """Number of objects currently checked out."""
+        return self.size - self.semaphore.counter
+
+    def checkout(self, timeout=None):
+        """Checkout object from the pool.
+
+        Objects must be returned to the pool with checkin().
+
+        Args:
+            timeout: optional number of seconds to wait for an object
+                to become available. Defaults to checkout_timeout.
+        Returns:
+            pool object
+        Raises:
+            PoolTimeout if an object does not become available in time.
+        """
+        if timeout is None:
+            timeout = self.checkout_timeout
+        if not self.semaphore.acquire(timeout=timeout):
+            raise PoolTimeout("pool checkout timed out after %ss" % timeout)
+
+        try:
+            self.evict_idle()
+            if self.idle:
+                obj, last_used = self.idle.pop()
+            else:
+                obj = self.factory()
+        except Exception:
+            self.semaphore.release()
+            raise
+        return obj
+
+    def checkin(self, obj, discard=False):
+        """Return object to the pool.
+
+        Args:
+            obj: object previously returned by checkout()
+            discard: boolean indicating that the object should be
+                closed instead of being returned to the idle pool,
+                i.e. following an error.
+        """
+        try:
+            if discard:
+                self._close(obj)
+            else:
+                self.idle.append((obj, time.time()))
+        finally:
+            self.semaphore.release()
+
+    @contextmanager
+    def get(self, timeout=None):
+        """Context manager to checkout and checkin a pool object.
+
+        The object will be discarded if an exception is raised.
+
+        Args:
+            timeout: optional number of seconds to wait for an object
+                to become available. Defaults to checkout_timeout.
+        """
+        obj = self.checkout(timeout)
+        try:
+            yield obj
+        except:
+            self.checkin(obj, discard=True)
+            raise
+        else:
+            self.checkin(obj)
+
+    def evict_idle(self):
+        """Close and remove objects idle longer than idle_timeout."""
+        if self.idle_timeout is None:
+            return
+        now = time.time()
+        #idle objects are appended on checkin, so the oldest are first
+        while self.idle and now - self.idle[0][1] > self.idle_timeout:
+            obj, last_used = self.idle.popleft()
+            self._close(obj)
+
+    def close(self):
+        """Close and remove all idle objects."""
+        while self.idle:
+            obj, last_used = self.idle.popleft()
+            self._close(obj)
+
+    def _close(self, obj):
+        if self.close_callback is not None:
+            try:
+                self.close_callback(obj)
+            except Exception:
+                pass
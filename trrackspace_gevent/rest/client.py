@@ -0,0 +1,399 @@
+import functools
+import time
+
+import gevent
+from gevent.local import local
+
+from trhttp_gevent.rest.client import GRestClient
+from trrackspace_gevent.limiter import request_outcome, NEUTRAL, THROTTLED
+from trrackspace_gevent.pool import GPool
+
+#Http methods recognized when applying a retry policy
+HTTP_METHODS = ("GET", "HEAD", "PUT", "POST", "DELETE", "OPTIONS", "COPY")
+
+#Rest client methods executed on a checked out rest client
+REQUEST_METHODS = ("send_request", "request",
+        "get", "head", "put", "post", "delete", "options", "copy")
+
+#Maximum number of unread response bytes drained on close() so the
+#connection can be reused instead of being discarded.
+MAX_DRAIN_BYTES = 64 * 1024
+
+class GPooledRestClient(object):
+    """Greenlet-safe pool of rest clients for a single endpoint.
+
+    GPooledRestClient is a drop-in replacement for a rest client which
+    maintains a GPool of rest clients, each with its own connection,
+    so concurrent requests from many greenlets run in parallel instead
+    of serializing on a single connection.
+
+    Request method calls (REQUEST_METHODS) are executed on a checked
+    out rest client. If a call returns a response object with an
+    unread body, the rest client remains checked out until the
+    response has been fully read or closed, since its connection
+    can't be reused before then. Other attributes and methods are
+    those of a template rest client which doesn't send requests.
+
+    Attributes set on the pooled client, i.e. auth_headers, are
+    applied to every pooled rest client. Dict, list and set attributes
+    read from the pooled client are shared by every pooled rest
+    client, so in place changes, i.e. auth_headers[name] = value,
+    apply to all of them.
+
+    If a limiter is given, every call also holds an AIMDLimiter slot
+    until its response headers have been received, and reports
+    throttling (498/429/503 responses) and timeouts to it. The slot
+    isn't held while a response body is streamed, so requests can be
+    made while reading another response, i.e. piping chunks() into a
+    write, regardless of the limit.
+
+    If a retry_policy is given, each call is executed according to the
+    RetryPolicy, with every attempt on its own checked out rest client.
+
+    If a metrics sink is given, request latency, pool wait time,
+    bytes sent and received, and error, throttle, retry and hedge
+    counts are reported to it with names prefixed by metrics_name.
+    Retries made by callers which repeat calls, rather than through a
+    retry_policy, are counted by wrapping them with count_retries().
+
+    If an observer is given, it's called with the result or error
+    of every call, i.e. to track endpoint health. A callable set with
+    set_before_call() is invoked before every call, i.e. to update
+    auth_headers.
+
+    Constructor arguments not listed below, i.e. endpoint, timeout,
+    keepalive and proxy, are passed unchanged to rest_client_class
+    for each pooled rest client.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """GPooledRestClient constructor
+
+        Args:
+            rest_client_class: optional rest client class for pooled
+                rest clients. Defaults to GRestClient.
+            pool_size: maximum number of rest clients (connections)
+            pool_idle_timeout: optional number of seconds after which
+                idle connections will be closed.
+            pool_checkout_timeout: optional number of seconds to wait
+                for a connection before PoolTimeout is raised.
+            limiter: optional AIMDLimiter, possibly shared with other
+                clients, to adaptively limit concurrent requests.
+            retry_policy: optional RetryPolicy to retry, bound and
+                hedge calls.
+            metrics: optional Metrics sink
+            metrics_name: metric name prefix, i.e. cloudfiles
+            observer: optional callable invoked after each call
+                with result and error keyword arguments.
+            Remaining arguments are passed to rest_client_class.
+        """
+        rest_client_class = kwargs.pop("rest_client_class", GRestClient)
+        pool_size = kwargs.pop("pool_size", 10)
+        pool_idle_timeout = kwargs.pop("pool_idle_timeout", 60)
+        pool_checkout_timeout = kwargs.pop("pool_checkout_timeout", None)
+
+        self.__dict__["_limiter"] = kwargs.pop("limiter", None)
+        self.__dict__["_retry_policy"] = kwargs.pop("retry_policy", None)
+        self.__dict__["_metrics"] = kwargs.pop("metrics", None)
+        self.__dict__["_metrics_name"] = kwargs.pop("metrics_name", "rest")
+        self.__dict__["_observer"] = kwargs.pop("observer", None)
+        self.__dict__["_before_call"] = None
+        self.__dict__["_local"] = local()
+        self.__dict__["_attributes"] = {}
+        self.__dict__["_template"] = rest_client_class(*args, **kwargs)
+        self.__dict__["_pool"] = GPool(
+                factory=lambda: self._create(rest_client_class, args, kwargs),
+                size=pool_size,
+                idle_timeout=pool_idle_timeout,
+                checkout_timeout=pool_checkout_timeout,
+                close=self._close)
+
+    @property
+    def pool(self):
+        """GPool of rest clients."""
+        return self._pool
+
+    @property
+    def limiter(self):
+        """Optional AIMDLimiter."""
+        return self._limiter
+
+    @property
+    def retry_policy(self):
+        """Optional RetryPolicy."""
+        return self._retry_policy
+
+    @property
+    def metrics(self):
+        """Optional Metrics sink."""
+        return self._metrics
+
+    def set_observer(self, observer):
+        """Set callable invoked with the result or error of each call."""
+        self.__dict__["_observer"] = observer
+
+    def set_before_call(self, before_call):
+        """Set callable invoked without arguments before each call."""
+        self.__dict__["_before_call"] = before_call
+
+    def count_retries(self, function):
+        """Wrap function to report its repeated calls as retries.
+
+        Every call made by function, in the calling greenlet, beyond
+        the first is counted as a retry, i.e. for base clients which
+        retry requests with an integer retries argument.
+
+        Args:
+            function: callable making calls on this client
+        Returns:
+            wrapped function
+        """
+        @functools.wraps(function)
+        def counted(*args, **kwargs):
+            outer = getattr(self._local, "calls", None)
+            self._local.calls = 0
+            try:
+                return function(*args, **kwargs)
+            finally:
+                calls, self._local.calls = self._local.calls, outer
+                if self._metrics is not None and calls > 1:
+                    self._count("retries", calls - 1)
+        return counted
+
+    def close(self):
+        """Close idle pooled rest clients and the template rest client."""
+        self._pool.close()
+        self._close(self._template)
+
+    def __getattr__(self, name):
+        value = getattr(self._template, name)
+        if name not in REQUEST_METHODS or not callable(value):
+            if isinstance(value, (dict, list, set)) \
+                    and not name.startswith("_"):
+                self._attributes[name] = value
+            return value
+
+        def pooled_call(*args, **kwargs):
+            if self._retry_policy is None:
+                return self._call(name, args, kwargs)
+
+            on_retry = on_hedge = None
+            if self._metrics is not None:
+                on_retry = lambda: self._count("retries")
+                on_hedge = lambda: self._count("hedges")
+            return self._retry_policy.execute(
+                    lambda: self._call(name, args, kwargs),
+                    method=self._request_method(args, kwargs),
+                    body=self._request_body(args, kwargs),
+                    on_retry=on_retry,
+                    on_hedge=on_hedge)
+
+        pooled_call.__name__ = name
+        return pooled_call
+
+    def __setattr__(self, name, value):
+        self._attributes[name] = value
+        setattr(self._template, name, value)
+        for rest_client, last_used in self._pool.idle:
+            setattr(rest_client, name, value)
+
+    def _call(self, name, args, kwargs):
+        """Execute method name on a checked out rest client."""
+        if self._before_call is not None:
+            self._before_call()
+        if getattr(self._local, "calls", None) is not None:
+            self._local.calls += 1
+
+        metrics = self._metrics
+        if metrics is not None:
+            start = time.time()
+
+        epoch = None
+        if self._limiter is not None:
+            epoch = self._limiter.acquire(self._pool.checkout_timeout)
+        try:
+            rest_client = self._pool.checkout()
+        except Exception as error:
+            self._release(None, epoch, request_outcome(error=error))
+            raise
+
+        if metrics is not None:
+            checked_out = time.time()
+            self._timing("pool_wait", checked_out - start)
+
+        self._apply_attributes(rest_client)
+        try:
+            result = getattr(rest_client, name)(*args, **kwargs)
+        except (Exception, gevent.Timeout) as error:
+            outcome = request_outcome(error=error)
+            self._release(rest_client, epoch, outcome, discard=True)
+            if metrics is not None:
+                self._count("errors")
+                if outcome is THROTTLED:
+                    self._count("throttled")
+            if self._observer is not None:
+                self._observer(error=error)
+            raise
+        except:
+            self._release(rest_client, epoch, NEUTRAL, discard=True)
+            raise
+
+        outcome = request_outcome(result=result)
+        if self._observer is not None:
+            self._observer(result=result)
+        if metrics is not None:
+            self._record(name, args, kwargs, outcome,
+                    time.time() - checked_out)
+
+        if hasattr(result, "read") and hasattr(result, "isclosed") \
+                and not result.isclosed():
+            self._release(None, epoch, outcome)
+            def release(discard):
+                self._release(rest_client, None, outcome, discard)
+                if metrics is not None:
+                    self._count("bytes_received", response.bytes_read)
+            response = PooledResponse(result, release)
+            return response
+
+        self._release(rest_client, epoch, outcome)
+        if metrics is not None and hasattr(result, "getheader") \
+                and self._request_method(args, kwargs) != "HEAD":
+            self._count("bytes_received",
+                    int(result.getheader("content-length", 0) or 0))
+        return result
+
+    def _record(self, name, args, kwargs, outcome, latency):
+        """Report metrics for a completed call."""
+        method = self._request_method(args, kwargs) or name
+        self._timing("request.%s" % method.lower(), latency)
+        if outcome is THROTTLED:
+            self._count("throttled")
+
+        body = self._request_body(args, kwargs)
+        size = None
+        if isinstance(body, basestring):
+            size = len(body)
+        else:
+            headers = kwargs.get("headers") or {}
+            for header in ("Content-Length", "content-length"):
+                if header in headers:
+                    size = int(headers[header])
+        if size:
+            self._count("bytes_sent", size)
+
+    def _timing(self, name, seconds):
+        self._metrics.timing("%s.%s" % (self._metrics_name, name), seconds)
+
+    def _count(self, name, value=1):
+        self._metrics.count("%s.%s" % (self._metrics_name, name), value)
+
+    def _request_method(self, args, kwargs):
+        """Return http method of a rest client call, or None."""
+        method = kwargs.get("method")
+        if method is None and args and isinstance(args[0], basestring):
+            method = args[0]
+        if isinstance(method, basestring) \
+                and method.upper() in HTTP_METHODS:
+            return method.upper()
+        return None
+
+    def _request_body(self, args, kwargs):
+        """Return request body of a rest client call, or None."""
+        body = kwargs.get("data", kwargs.get("body"))
+        if body is None and len(args) > 2:
+            body = args[2]
+        return body
+
+    def _create(self, rest_client_class, args, kwargs):
+        rest_client = rest_client_class(*args, **kwargs)
+        self._apply_attributes(rest_client)
+        return rest_client
+
+    def _apply_attributes(self, rest_client):
+        for name, value in self._attributes.items():
+            setattr(rest_client, name, value)
+
+    def _release(self, rest_client, epoch, outcome, discard=False):
+        """Checkin rest_client and release limiter slot.
+
+        Either may be None if it has already been released.
+        """
+        try:
+            if rest_client is not None:
+                self._pool.checkin(rest_client, discard=discard)
+        finally:
+            if self._limiter is not None and epoch is not None:
+                self._limiter.release(epoch, outcome)
+
+    def _close(self, rest_client):
+        close = getattr(rest_client, "close", None)
+        if close is not None:
+            close()
+
+
+class PooledResponse(object):
+    """Response wrapper releasing its rest client once it's been read.
+
+    The release callable is invoked with discard=False once the
+    response body has been fully read, or once it's closed with no
+    more than max_drain unread bytes, which are read and dropped so
+    the connection can be reused. It's invoked with discard=True if
+    the response is closed with more unread bytes, or garbage
+    collected before it's been read.
+    """
+
+    def __init__(self, response, release, max_drain=MAX_DRAIN_BYTES):
+        self._response = response
+        self._release_callback = release
+        self.max_drain = max_drain
+        self.bytes_read = 0
+
+    def read(self, *args, **kwargs):
+        try:
+            data = self._response.read(*args, **kwargs)
+        except:
+            self._release(discard=True)
+            raise
+        self.bytes_read += len(data)
+        if self._response.isclosed():
+            self._release()
+        return data
+
+    def close(self):
+        if self._release_callback is not None:
+            self._drain()
+        self._response.close()
+        self._release(discard=True)
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def __del__(self):
+        self._release(discard=True)
+
+    def _drain(self):
+        """Read and drop up to max_drain unread bytes.
+
+        The rest client is released for reuse if the body was fully
+        read. Errors are ignored, since the rest client will then be
+        discarded by close().
+        """
+        length = self._response.getheader("content-length")
+        try:
+            if length is None or int(length) - self.bytes_read \
+                    > self.max_drain:
+                return
+            while not self._response.isclosed():
+                data = self._response.read(self.max_drain)
+                self.bytes_read += len(data)
+                if not data:
+                    break
+        except Exception:
+            return
+        if self._response.isclosed():
+            self._release()
+
+    def _release(self, discard=False):
+        release, self._release_callback = self._release_callback, None
+        if release is not None:
+            release(discard)
@@ -0,0 +1,286 @@
+import collections
+import httplib
+import itertools
+import random
+import socket
+import time
+from contextlib import contextmanager
+
+import gevent
+from gevent.local import local
+
+from trrackspace_gevent.errors import DeadlineExceeded
+
+#Methods which can safely be retried
+IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")
+
+#Methods which can be hedged
+HEDGE_METHODS = ("GET", "HEAD")
+
+#Response statuses which are retried
+RETRY_STATUSES = (408, 429, 498, 500, 502, 503, 504)
+
+#Greenlet local deadline set by deadline()
+_deadline_local = local()
+
+@contextmanager
+def deadline(seconds):
+    """Context manager bounding the total time of requests.
+
+    All requests made by the current greenlet within the context,
+    including retries and backoff, must complete within seconds or
+    DeadlineExceeded will be raised. Nested deadlines can only
+    shorten the enclosing deadline.
+
+    Example usage:
+        with deadline(5):
+            obj = container.get_object("name")
+    """
+    previous = getattr(_deadline_local, "deadline", None)
+    absolute = time.time() + seconds
+    if previous is not None:
+        absolute = min(absolute, previous)
+    _deadline_local.deadline = absolute
+    try:
+        yield
+    finally:
+        _deadline_local.deadline = previous
+
+
+class RetryPolicy(object):
+    """Retry policy with exponential backoff, jitter, deadlines and hedging.
+
+    Failed requests are retried with exponential backoff, capped at
+    max_backoff, with full jitter. Only idempotent methods, with bodies
+    which can be rewound, are retried. Connection errors, timeouts and
+    RETRY_STATUSES responses are retried.
+
+    The total time across all attempts and backoff is bounded by the
+    policy's deadline and by any deadline() context of the calling
+    greenlet.
+
+    If hedge_percentile is given, GET and HEAD requests which haven't
+    completed after that percentile of recently observed latencies
+    are duplicated, and the first successful response is used.
+
+    RetryPolicy objects may be passed as the retries argument of
+    the gevent clients and factories.
+    """
+
+    def __init__(self,
+            max_attempts=3,
+            backoff=0.1,
+            max_backoff=5,
+            jitter=True,
+            deadline=None,
+            idempotent_methods=IDEMPOTENT_METHODS,
+            retry_statuses=RETRY_STATUSES,
+            hedge_percentile=None,
+            hedge_min_samples=20,
+            hedge_window=200):
+        """RetryPolicy constructor
+
+        Args:
+            max_attempts: maximum number of attempts per request,
+                including the first one.
+            backoff: backoff in seconds before the first retry, which
+                doubles for each subsequent retry.
+            max_backoff: maximum backoff in seconds
+            jitter: boolean indicating full jitter should be applied,
+                i.e. the backoff is chosen uniformly from [0, backoff].
+            deadline: optional number of seconds bounding the total
+                time of a request across all attempts.
+            idempotent_methods: http methods which may be retried
+            retry_statuses: response statuses which are retried
+            hedge_percentile: optional latency percentile, i.e. 95,
+                after which GET and HEAD requests are hedged.
+            hedge_min_samples: minimum number of latency samples
+                required before requests are hedged.
+            hedge_window: number of recent latency samples to
+                compute the percentile over.
+        """
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.deadline = deadline
+        self.idempotent_methods = idempotent_methods
+        self.retry_statuses = retry_statuses
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.latencies = collections.deque(maxlen=hedge_window)
+
+    def execute(self, attempt, method=None, body=None,
+            on_retry=None, on_hedge=None):
+        """Execute request attempt callable according to the policy.
+
+        Args:
+            attempt: callable executing a single request attempt and
+                returning the response.
+            method: optional http method of the request. Requests
+                with unknown methods are not retried.
+            body: optional request body. Requests with file-like bodies
+                are only retried if they can be rewound with seek(),
+                otherwise they're sent once.
+            on_retry: optional callable invoked before each retry
+            on_hedge: optional callable invoked for each hedged request
+        Returns:
+            response returned by the final attempt
+        Raises:
+            DeadlineExceeded if the deadline is exceeded, or the error
+            raised by the final attempt.
+        """
+        request_deadline = self._deadline()
+        retryable = self._retryable(method, body)
+        position = None
+        if retryable and hasattr(body, "read"):
+            position = self._position(body)
+            retryable = position is not None
+
+        for attempt_number in itertools.count(1):
+            result = error = None
+            try:
+                result = self._attempt(
+                        attempt, method, request_deadline, on_hedge)
+            except (Exception, gevent.Timeout) as e:
+                error = e
+
+            delay = self.backoff_delay(attempt_number)
+            retry = retryable and attempt_number < self.max_attempts
+            if retry and error is not None:
+                retry = self.retry_error(error)
+            elif retry:
+                retry = self.retry_result(result)
+            if retry and request_deadline is not None:
+                retry = time.time() + delay < request_deadline
+
+            if not retry:
+                if error is not None:
+                    raise error
+                return result
+
+            self._discard(result)
+            if position is not None:
+                body.seek(position)
+            if on_retry is not None:
+                on_retry()
+            gevent.sleep(delay)
+
+    def backoff_delay(self, attempt_number):
+        """Return backoff in seconds following the given attempt number."""
+        delay = min(self.max_backoff,
+                self.backoff * (2 ** (attempt_number - 1)))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+    def retry_error(self, error):
+        """Return True if the request error should be retried."""
+        if isinstance(error, DeadlineExceeded):
+            return False
+        if getattr(error, "status", None) in self.retry_statuses:
+            return True
+        return isinstance(error, (socket.error, IOError,
+            httplib.HTTPException, gevent.Timeout))
+
+    def retry_result(self, result):
+        """Return True if the request result should be retried."""
+        return getattr(result, "status", None) in self.retry_statuses
+
+    def hedge_delay(self):
+        """Return number of seconds after which to hedge, or None."""
+        if self.hedge_percentile is None \
+                or len(self.latencies) < self.hedge_min_samples:
+            return None
+        latencies = sorted(self.latencies)
+        index = int(len(latencies) * self.hedge_percentile / 100.0)
+        return latencies[min(index, len(latencies) - 1)]
+
+    def _deadline(self):
+        """Return absolute deadline for a request, or None."""
+        result = getattr(_deadline_local, "deadline", None)
+        if self.deadline is not None:
+            policy_deadline = time.time() + self.deadline
+            result = policy_deadline if result is None \
+                    else min(result, policy_deadline)
+        return result
+
+    def _retryable(self, method, body):
+        if method is None or method.upper() not in self.idempotent_methods:
+            return False
+        if hasattr(body, "read"):
+            return hasattr(body, "seek") and hasattr(body, "tell")
+        return True
+
+    def _position(self, body):
+        """Return position of file-like body, or None if it can't be rewound.
+
+        Pipes and sockets may have seek() and tell() but raise
+        'Illegal seek' when called.
+        """
+        try:
+            return body.tell()
+        except (IOError, OSError):
+            return None
+
+    def _attempt(self, attempt, method, request_deadline, on_hedge=None):
+        """Execute a single, possibly hedged, attempt within the deadline."""
+        timeout = None
+        if request_deadline is not None:
+            timeout = max(0, request_deadline - time.time())
+
+        with gevent.Timeout(timeout, DeadlineExceeded(
+                "request deadline exceeded")):
+            if method is not None and method.upper() in HEDGE_METHODS:
+                return self._hedged(attempt, on_hedge)
+            return self._timed(attempt)
+
+    def _hedged(self, attempt, on_hedge=None):
+        """Execute attempt, hedging it if it's slower than hedge_delay()."""
+        delay = self.hedge_delay()
+        if delay is None:
+            return self._timed(attempt)
+
+        first = gevent.spawn(self._timed, attempt)
+        first.join(delay)
+        if first.ready():
+            return first.get()
+
+        if on_hedge is not None:
+            on_hedge()
+        greenlets = [first, gevent.spawn(self._timed, attempt)]
+        winner = None
+        try:
+            for greenlet in gevent.iwait(greenlets):
+                if greenlet.successful():
+                    winner = greenlet
+                    break
+        finally:
+            for greenlet in greenlets:
+                if greenlet is not winner:
+                    greenlet.link_value(lambda g: self._discard(g.value))
+                    greenlet.kill(block=False)
+
+        if winner is None:
+            return first.get()
+        return winner.get()
+
+    def _timed(self, attempt):
+        """Execute attempt recording its latency."""
+        start = time.time()
+        result = attempt()
+        if not self.retry_result(result):
+            self.latencies.append(time.time() - start)
+        return result
+
+    def _discard(self, result):
+        """Close response which won't be returned."""
+        close = getattr(result, "close", None)
+        if close is not None:
+            try:
+                close()
+            except Exception:
+                pass
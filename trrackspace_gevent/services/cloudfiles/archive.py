@@ -0,0 +1,303 @@
+import json
+import os
+import StringIO
+import tarfile
+import time
+import urllib
+
+import gevent
+from gevent.queue import Queue
+
+#Maximum number of files cloudfiles will extract from a single archive.
+MAX_ARCHIVE_FILES = 10000
+
+#Maximum size of a single cloudfiles request body (5GB). Archives are
+#split on the number of bytes tarfile writes, including headers and
+#padding, so they will always be below this limit.
+MAX_ARCHIVE_BYTES = 5 * 1024 * 1024 * 1024
+
+#Fraction of the uncompressed size allowed for compression overhead,
+#since incompressible data grows slightly when compressed.
+COMPRESSION_OVERHEAD = 0.01
+
+ARCHIVE_FORMATS = {
+    "tar": "w|",
+    "tar.gz": "w|gz",
+    "tar.bz2": "w|bz2"
+}
+
+#Maximum number of archive blocks buffered between the archive
+#builder and the request.
+ARCHIVE_QUEUE_SIZE = 16
+
+class ArchiveEntry(object):
+    """Archive file entry.
+
+    Attributes:
+        name: archive member name
+        fileobj: file-like object containing member data
+        size: member size in bytes
+        info: TarInfo for the member
+    """
+
+    def __init__(self, name, data):
+        """ArchiveEntry constructor
+
+        Args:
+            name: archive member name
+            data: string or file-like object
+        """
+        self.name = name
+        if isinstance(data, basestring):
+            self.fileobj = StringIO.StringIO(data)
+            self.size = len(data)
+        elif hasattr(data, "fileno"):
+            self.fileobj = data
+            self.size = os.fstat(data.fileno()).st_size - data.tell()
+        elif hasattr(data, "seek") and hasattr(data, "tell"):
+            position = data.tell()
+            data.seek(0, os.SEEK_END)
+            self.size = data.tell() - position
+            data.seek(position)
+            self.fileobj = data
+        else:
+            data = data.read()
+            self.fileobj = StringIO.StringIO(data)
+            self.size = len(data)
+
+        self.info = tarfile.TarInfo(name)
+        self.info.size = self.size
+        self.info.mtime = time.time()
+        self.info.mode = 0o644
+
+    @property
+    def archive_size(self):
+        """Number of bytes tarfile writes for the member.
+
+        This includes the member's header blocks and padding.
+        """
+        header = self.info.tobuf(tarfile.DEFAULT_FORMAT, tarfile.ENCODING,
+                "strict")
+        blocks = (self.size + tarfile.BLOCKSIZE - 1) // tarfile.BLOCKSIZE
+        return len(header) + blocks * tarfile.BLOCKSIZE
+
+
+class ArchivePipe(object):
+    """Greenlet pipe connecting the archive builder to the request body.
+
+    The archive builder writes to the pipe from a producer greenlet
+    while the request reads from it. The archive size is not known
+    before it's sent, so the request is sent with chunked transfer
+    encoding. httplib doesn't frame chunks, so each write is framed
+    as a chunk and closing the pipe writes the terminating chunk.
+
+    If the builder fails, the pipe is closed with its error, which is
+    raised to the reader so the request is aborted instead of sending
+    a truncated archive.
+    """
+
+    def __init__(self, maxsize=ARCHIVE_QUEUE_SIZE):
+        self.queue = Queue(maxsize=maxsize)
+        self.buffer = ""
+        self.finished = False
+        self.bytes_written = 0
+
+    def write(self, data):
+        if data:
+            self.bytes_written += len(data)
+            self.queue.put("%x\r\n%s\r\n" % (len(data), data))
+
+    def close(self, error=None):
+        if error is None:
+            self.queue.put("0\r\n\r\n")
+        self.queue.put(error or StopIteration)
+
+    def read(self, size=-1):
+        while not self.finished and (size < 0 or len(self.buffer) < size):
+            data = self.queue.get()
+            if data is StopIteration:
+                self.finished = True
+            elif isinstance(data, Exception):
+                self.finished = True
+                raise data
+            else:
+                self.buffer += data
+
+        if size < 0:
+            data, self.buffer = self.buffer, ""
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+class StreamingArchive(object):
+    """Streaming bulk archive extraction.
+
+    Archives are built on the fly in a producer greenlet and streamed
+    directly into the cloudfiles bulk extract request without a
+    temporary file. Input which exceeds the per-request file or size
+    limits is split across multiple archives and requests.
+    """
+
+    def __init__(self,
+            container,
+            format="tar.gz",
+            prefix=None,
+            max_files=MAX_ARCHIVE_FILES,
+            max_bytes=MAX_ARCHIVE_BYTES):
+        """StreamingArchive constructor
+
+        Args:
+            container: GContainer to extract archives to
+            format: archive format, 'tar', 'tar.gz' or 'tar.bz2'
+            prefix: optional object name prefix for extracted files
+            max_files: maximum number of files per archive
+            max_bytes: maximum size in bytes of each archive as sent,
+                including tar headers and padding, and for compressed
+                formats an allowance for compression overhead.
+        """
+        if format not in ARCHIVE_FORMATS:
+            raise ValueError("format must be one of %s"
+                    % ", ".join(sorted(ARCHIVE_FORMATS)))
+
+        self.container = container
+        self.client = container.client
+        self.format = format
+        self.prefix = prefix
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+
+    def extract(self, source):
+        """Build archives from source and extract them into the container.
+
+        Args:
+            source: local directory path, or iterable of
+                (name, data) tuples where data is a string or
+                file-like object.
+        Returns:
+            dict in the cloudfiles bulk extract result format, with
+            'Number Files Created' and 'Errors' totaled across archives.
+        Raises:
+            ValueError if a single file is too large for an archive.
+        """
+        result = {
+            "Number Files Created": 0,
+            "Errors": []
+        }
+
+        self._entries = self.entries(source)
+        self._next_entry = next(self._entries, None)
+        while self._next_entry is not None:
+            entry = self._next_entry
+            if self._archive_size(entry.archive_size) > self.max_bytes:
+                raise ValueError("%s (%d bytes) exceeds max_bytes"
+                        % (entry.name, entry.size))
+            response = self._extract(self._archive_entries())
+            result["Number Files Created"] += \
+                    response.get("Number Files Created", 0)
+            result["Errors"].extend(response.get("Errors") or [])
+            for key in ("Response Status", "Response Body"):
+                if key in response:
+                    result[key] = response[key]
+        return result
+
+    def entries(self, source):
+        """Generator yielding ArchiveEntry objects for source."""
+        if isinstance(source, basestring):
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                for filename in sorted(files):
+                    path = os.path.join(root, filename)
+                    name = "/".join(
+                            os.path.relpath(path, source).split(os.sep))
+                    with open(path, "rb") as f:
+                        yield ArchiveEntry(name, f)
+        else:
+            for name, data in source:
+                yield ArchiveEntry(name, data)
+
+    def _archive_entries(self):
+        """Generator yielding entries for the next archive.
+
+        Entries are yielded until the archive would exceed max_files
+        or max_bytes, leaving the remaining entry in _next_entry.
+        """
+        count = 0
+        size = 0
+        while self._next_entry is not None:
+            entry = self._next_entry
+            entry_size = entry.archive_size
+            if count and (count >= self.max_files
+                    or self._archive_size(size + entry_size) > self.max_bytes):
+                return
+            yield entry
+            count += 1
+            size += entry_size
+            self._next_entry = next(self._entries, None)
+
+    def _archive_size(self, members_size):
+        """Return maximum archive size for members of members_size bytes.
+
+        tarfile ends archives with two zero blocks and pads them to a
+        multiple of its record size.
+        """
+        size = members_size + 2 * tarfile.BLOCKSIZE
+        records = (size + tarfile.RECORDSIZE - 1) // tarfile.RECORDSIZE
+        size = records * tarfile.RECORDSIZE
+        if self.format != "tar":
+            size += int(size * COMPRESSION_OVERHEAD) + tarfile.RECORDSIZE
+        return size
+
+    def _extract(self, entries):
+        """Stream a single archive into a bulk extract request.
+
+        The request isn't retried, since the archive can't be rewound.
+
+        Returns:
+            dict bulk extract result
+        Raises:
+            RuntimeError if the extract request fails.
+        """
+        path = "/%s" % urllib.quote(self.container.name)
+        if self.prefix:
+            path += "/%s" % urllib.quote(self.prefix)
+        headers = {
+            "Transfer-Encoding": "chunked",
+            "Accept": "application/json"
+        }
+
+        pipe = ArchivePipe()
+        builder = gevent.spawn(self._build, entries, pipe)
+        try:
+            response = self.client._send_request(
+                    "PUT",
+                    path,
+                    data=pipe,
+                    params={"extract-archive": self.format},
+                    headers=headers,
+                    retry=False)
+            builder.get()
+            data = response.read()
+            if response.status >= 300:
+                raise RuntimeError("extract archive status %d: %s"
+                        % (response.status, data))
+            return json.loads(data)
+        finally:
+            builder.kill()
+
+    def _build(self, entries, pipe):
+        """Write archive of entries to pipe.
+
+        The pipe is closed with the error if building fails so the
+        request will be aborted. It's not closed if the builder is
+        killed, since the pipe may be full with no reader left.
+        """
+        try:
+            tar = tarfile.open(fileobj=pipe, mode=ARCHIVE_FORMATS[self.format])
+            for entry in entries:
+                tar.addfile(entry.info, entry.fileobj)
+            tar.close()
+        except Exception as error:
+            pipe.close(error)
+            raise
+        pipe.close()
@@ -0,0 +1,138 @@
+import urllib
+
+from gevent.pool import Pool
+
+DEFAULT_COPY_CONCURRENCY = 8
+
+class CopyResult(object):
+    """Result of a BulkCopy.
+
+    Attributes:
+        copied: dict of {source_object_name: destination_object_name}
+            for objects copied.
+        errors: dict of {source_object_name: error} for objects which
+            could not be copied.
+    """
+
+    def __init__(self):
+        self.copied = {}
+        self.errors = {}
+
+    @property
+    def processed(self):
+        """Total number of objects processed."""
+        return len(self.copied) + len(self.errors)
+
+    def __repr__(self):
+        return "CopyResult(copied=%d, errors=%d)" % (
+                len(self.copied), len(self.errors))
+
+
+class BulkCopy(object):
+    """Concurrent server-side copy of objects between containers.
+
+    Each object is copied with a server-side copy request (PUT with
+    X-Copy-From), so no data passes through this host, from a bounded
+    gevent pool. Failures are recorded per object in the CopyResult
+    rather than aborting the run.
+    """
+
+    def __init__(self,
+            container,
+            destination,
+            concurrency=DEFAULT_COPY_CONCURRENCY,
+            metadata=None,
+            fresh_metadata=False,
+            rename=None,
+            callback=None):
+        """BulkCopy constructor
+
+        Args:
+            container: source GContainer
+            destination: destination GContainer, which may be the
+                source container if rename is given.
+            concurrency: maximum number of concurrent copy requests
+            metadata: optional dict of object metadata headers, i.e.
+                {"x-object-meta-release": "1.0"}, to set on copies.
+            fresh_metadata: boolean indicating that copies should not
+                retain the source object's metadata.
+            rename: optional callable returning the destination object
+                name for a source object name.
+            callback: optional callable invoked with (object_name,
+                CopyResult) after each object is processed.
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+
+        self.container = container
+        self.destination = destination
+        self.client = container.client
+        self.concurrency = concurrency
+        self.metadata = metadata or {}
+        self.fresh_metadata = fresh_metadata
+        self.rename = rename
+        self.callback = callback
+        self.result = CopyResult()
+
+    def copy_all(self, prefix=None):
+        """Copy all objects, optionally limited to those with prefix.
+
+        Object names are listed lazily while copying, unless copying
+        within the same container, in which case the names are listed
+        up front so the listing doesn't include the copies.
+
+        Returns:
+            CopyResult object
+        """
+        objects = self.container.list_all_objects(prefix=prefix, prefetch=1)
+        object_names = (o["name"] for o in objects)
+        if self.destination.name == self.container.name:
+            object_names = list(object_names)
+        return self.copy(object_names)
+
+    def copy(self, object_names):
+        """Copy objects.
+
+        Args:
+            object_names: iterable of source object names
+        Returns:
+            CopyResult object
+        """
+        pool = Pool(self.concurrency)
+        try:
+            for name in object_names:
+                pool.spawn(self._copy_object, name)
+            pool.join()
+        finally:
+            pool.kill()
+        return self.result
+
+    def _copy_object(self, name):
+        """Server-side copy of a single object."""
+        destination_name = self.rename(name) if self.rename else name
+        headers = {
+            "X-Copy-From": "/%s/%s" % (
+                urllib.quote(self.container.name),
+                urllib.quote(name)),
+            "Content-Length": "0"
+        }
+        if self.fresh_metadata:
+            headers["X-Fresh-Metadata"] = "true"
+        headers.update(self.metadata)
+
+        try:
+            response = self.client._send_request(
+                    "PUT",
+                    "/%s/%s" % (
+                        urllib.quote(self.destination.name),
+                        urllib.quote(destination_name)),
+                    headers=headers)
+            response.read()
+            if response.status >= 300:
+                raise RuntimeError("copy status %d" % response.status)
+            self.result.copied[name] = destination_name
+        except Exception as error:
+            self.result.errors[name] = error
+
+        if self.callback is not None:
+            self.callback(name, self.result)
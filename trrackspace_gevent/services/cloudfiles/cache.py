@@ -0,0 +1,116 @@
+import collections
+import copy
+import time
+
+from gevent.event import AsyncResult
+
+DEFAULT_METADATA_CACHE_SIZE = 1000
+DEFAULT_METADATA_CACHE_TTL = 60
+
+class MetadataCache(object):
+    """Greenlet-safe LRU cache with TTL for container and object metadata.
+
+    Cached values are GContainer and GStorageObject objects loaded
+    with a HEAD request. Concurrent lookups of the same key share a
+    single HEAD request, and callers are handed copies, including
+    copies of their dict attributes such as headers and metadata, so
+    the cached objects are never modified.
+
+    Keys are ("container", container_name) and
+    ("object", container_name, object_name) tuples.
+
+    Attributes:
+        hits: number of lookups returned from the cache
+        misses: number of lookups which required a request
+    """
+
+    def __init__(self,
+            size=DEFAULT_METADATA_CACHE_SIZE,
+            ttl=DEFAULT_METADATA_CACHE_TTL):
+        """MetadataCache constructor
+
+        Args:
+            size: maximum number of cached entries
+            ttl: number of seconds entries remain valid
+        """
+        if size < 1:
+            raise ValueError("size must be at least 1")
+
+        self.size = size
+        self.ttl = ttl
+        self.entries = collections.OrderedDict()
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def container_key(container_name):
+        return ("container", container_name)
+
+    @staticmethod
+    def object_key(container_name, object_name):
+        return ("object", container_name, object_name)
+
+    def get(self, key, load):
+        """Get cached value, loading it on a miss.
+
+        Args:
+            key: cache key
+            load: callable returning the value to cache. It will be
+                invoked at most once concurrently for a given key.
+        Returns:
+            copy of the cached value
+        """
+        entry = self.entries.pop(key, None)
+        if entry is not None and entry[1] > time.time():
+            self.entries[key] = entry
+            self.hits += 1
+            return self._copy(entry[0])
+
+        self.misses += 1
+        pending = self.pending.get(key)
+        if pending is None:
+            pending = self.pending[key] = AsyncResult()
+            try:
+                value = load()
+                #don't cache values invalidated while they were loading
+                if self.pending.get(key) is pending:
+                    self._put(key, value)
+                pending.set(value)
+            except Exception as error:
+                pending.set_exception(error)
+                raise
+            finally:
+                if self.pending.get(key) is pending:
+                    del self.pending[key]
+        return self._copy(pending.get())
+
+    def invalidate(self, key):
+        """Remove cached entry for key."""
+        self.entries.pop(key, None)
+        self.pending.pop(key, None)
+
+    def invalidate_container(self, container_name):
+        """Remove cached entries for container and all its objects."""
+        for key in list(self.entries) + list(self.pending):
+            if key[1] == container_name:
+                self.invalidate(key)
+
+    def clear(self):
+        """Remove all cached entries."""
+        self.entries.clear()
+        self.pending.clear()
+
+    def _put(self, key, value):
+        self.entries[key] = (value, time.time() + self.ttl)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def _copy(self, value):
+        """Return shallow copy of value with copies of its dict attributes."""
+        value = copy.copy(value)
+        attributes = getattr(value, "__dict__", {})
+        for name, attribute in attributes.items():
+            if isinstance(attribute, dict):
+                attributes[name] = copy.copy(attribute)
+        return value
@@ -1,7 +1,23 @@
+import functools
+import inspect
+import uuid
+
+from gevent.event import AsyncResult
+
 from trhttp_gevent.rest.client import GRestClient
 from trrackspace.services.cloudfiles.client import CloudfilesClient
+from trrackspace_gevent.rest.client import GPooledRestClient
+from trrackspace_gevent.retry import RetryPolicy
+from trrackspace_gevent.services.cloudfiles.container import GContainer
+from trrackspace_gevent.services.cloudfiles.endpoint import SERVICENET, PUBLIC
+from trrackspace_gevent.services.cloudfiles.errors import TempUrlKeyError
+from trrackspace_gevent.services.cloudfiles.tempurl import TempUrlSigner, \
+        TEMP_URL_KEY_HEADER, public_storage_url
 from trrackspace_gevent.services.identity.client import GIdentityServiceClient
 
+#Http header carrying the identity token
+AUTH_TOKEN_HEADER = "X-Auth-Token"
+
 class GCloudfilesClient(CloudfilesClient):
     """GEvent Rackspace Cloudfiles API Client
 
@@ -10,6 +26,14 @@ class GCloudfilesClient(CloudfilesClient):
     lookups. If an identity_client is not explicitly passed to the construtor
     one will be created for you using the username and password/api_key.
 
+    Containers returned by this client are GContainer objects, and objects
+    returned by those containers are GStorageObject objects, which add
+    concurrent gevent operations to the base classes.
+
+    Tokens proactively refreshed by the identity client's token cache
+    are applied before each request, so requests don't fail with 401
+    responses when the previous token expires.
+
     Example usage:
         client = GCloudfilesClient(username="user", password="...")
         or
@@ -32,7 +56,14 @@ class GCloudfilesClient(CloudfilesClient):
             keepalive=True,
             proxy=None,
             rest_client_class=GRestClient,
-            debug_level=0):
+            debug_level=0,
+            pool_size=10,
+            pool_idle_timeout=60,
+            pool_checkout_timeout=None,
+            metadata_cache=None,
+            limiter=None,
+            metrics=None,
+            endpoint_selector=None):
         """GCloudfilesClient constructor
 
         Args:
@@ -62,7 +93,8 @@ class GCloudfilesClient(CloudfilesClient):
             retries: Number of times to try a request with an unexpected
                 error before an exception is raised. Note that a value of 2
                 means to try each api request twice (not 3 times) before
-                raising an exception.
+                raising an exception. Alternatively a RetryPolicy can be
+                given for deadline-aware retries with backoff and jitter.
             keepalive: boolean indicating whether connections to the
                 cloudfiles servers should be maintained between requests.
                 If false, connections will be closed immediately following
@@ -73,7 +105,98 @@ class GCloudfilesClient(CloudfilesClient):
             debug_level: httplib debug level. Setting this to 1 will log
                 http requests and responses which is very useful for 
                 debugging.
+            pool_size: maximum number of concurrent connections per
+                cloudfiles endpoint. Connections are pooled so requests
+                from concurrent greenlets run in parallel. If None,
+                a single rest client is used for each endpoint.
+            pool_idle_timeout: optional number of seconds after which
+                idle pooled connections will be closed.
+            pool_checkout_timeout: optional number of seconds to wait
+                for a pooled connection before PoolTimeout is raised.
+            metadata_cache: optional MetadataCache to cache
+                get_container() and get_object() results in. Cached
+                entries are invalidated by writes, deletes and metadata
+                updates made through this client and its containers and
+                objects. Changes made by other clients, or with
+                _send_request(), are seen once entries expire.
+            limiter: optional AIMDLimiter, which may be shared between
+                clients, to adaptively limit concurrent requests based
+                on throttling responses and timeouts. Requires pool_size.
+            metrics: optional Metrics sink to report request latency,
+                bytes transferred, pool wait time, and retry, throttle
+                and re-authentication counts to.
+            endpoint_selector: optional EndpointSelector to route
+                requests to the faster of the servicenet and public
+                endpoints, which are probed in the background after
+                construction, periodically and following consecutive
+                failures. The servicenet argument selects the initial
+                endpoint, and the other endpoint's client is created in
+                the background. The selector is stopped by close().
         """
+        self.metadata_cache = metadata_cache
+        self.limiter = limiter
+        self.metrics = metrics
+        self.pool_size = pool_size
+        self.pool_idle_timeout = pool_idle_timeout
+        self.pool_checkout_timeout = pool_checkout_timeout
+        self.retry_policy = None
+        self._temp_url_signer = None
+        self._temp_url_pending = None
+        self.endpoint_selector = endpoint_selector
+
+        #Arguments for the client of the alternate endpoint
+        alternate_arguments = dict(
+                region=region,
+                servicenet=not servicenet,
+                timeout=timeout,
+                retries=retries,
+                keepalive=keepalive,
+                proxy=proxy,
+                rest_client_class=rest_client_class,
+                debug_level=debug_level,
+                pool_size=pool_size or 1,
+                pool_idle_timeout=pool_idle_timeout,
+                pool_checkout_timeout=pool_checkout_timeout,
+                limiter=limiter,
+                metrics=metrics)
+
+        if identity_client is None and (metrics is not None
+                or endpoint_selector is not None
+                or isinstance(retries, RetryPolicy)):
+            #Share the identity client with the alternate endpoint client,
+            #and the retry policy and metrics with the identity client
+            identity_arguments = dict(
+                    username=username,
+                    api_key=api_key,
+                    password=password,
+                    timeout=timeout,
+                    retries=retries,
+                    keepalive=keepalive,
+                    proxy=proxy,
+                    rest_client_class=rest_client_class,
+                    debug_level=debug_level)
+            if metrics is not None \
+                    and _accepts_argument(identity_client_class, "metrics"):
+                identity_arguments["metrics"] = metrics
+            identity_client = identity_client_class(**identity_arguments)
+
+        if isinstance(retries, RetryPolicy):
+            #The policy replaces the base client's immediate retries
+            self.retry_policy = retries
+            retries = 1
+
+        if pool_size or self.retry_policy is not None or metrics is not None \
+                or endpoint_selector is not None:
+            rest_client_class = functools.partial(
+                    GPooledRestClient,
+                    rest_client_class=rest_client_class,
+                    pool_size=pool_size or 1,
+                    pool_idle_timeout=pool_idle_timeout,
+                    pool_checkout_timeout=pool_checkout_timeout,
+                    limiter=limiter,
+                    retry_policy=self.retry_policy,
+                    metrics=metrics,
+                    metrics_name="cloudfiles")
         
         super(GCloudfilesClient, self).__init__(
                 username=username,
@@ -89,3 +212,264 @@ class GCloudfilesClient(CloudfilesClient):
                 proxy=proxy,
                 rest_client_class=rest_client_class,
                 debug_level=debug_level)
+
+        self._identity_client = identity_client \
+                or getattr(self, "identity_client", None)
+        rest_client = self.cloudfiles.rest_client
+        self._sync_on_send = not hasattr(rest_client, "set_before_call")
+        if not self._sync_on_send:
+            rest_client.set_before_call(self._sync_token)
+        if metrics is not None and self.retry_policy is None \
+                and hasattr(rest_client, "count_retries"):
+            #Count the base client's immediate retries
+            self.cloudfiles.send_request = rest_client.count_retries(
+                    self.cloudfiles.send_request)
+
+        self._cloudfiles = self.cloudfiles
+        if endpoint_selector is not None:
+            current, other = (SERVICENET, PUBLIC) if servicenet \
+                    else (PUBLIC, SERVICENET)
+            endpoint_selector.attach(self, {current: self.cloudfiles},
+                    current, factories={
+                        other: lambda: GCloudfilesClient(
+                            identity_client=identity_client,
+                            **alternate_arguments).cloudfiles
+                    })
+
+    def close(self):
+        """Stop the endpoint selector and close pooled connections.
+
+        The client can't be used once it's been closed.
+        """
+        if self.endpoint_selector is not None:
+            self.endpoint_selector.close()
+        close = getattr(self._cloudfiles.rest_client, "close", None)
+        if close is not None:
+            close()
+
+    def ensure_authenticated(self):
+        """Authenticate with the identity service if needed.
+
+        The token is applied to the auth headers, so the first request
+        doesn't have to wait for authentication.
+        """
+        identity_client = self._identity_client
+        if identity_client is None:
+            return
+        if getattr(identity_client, "token", None) is None:
+            identity_client.authenticate()
+        elif hasattr(identity_client, "sync_token"):
+            identity_client.sync_token()
+
+        token = identity_client.token
+        token_id = getattr(token, "id", token)
+        rest_client = self.cloudfiles.rest_client
+        auth_headers = getattr(rest_client, "auth_headers", None) or {}
+        if auth_headers.get(AUTH_TOKEN_HEADER) != token_id:
+            auth_headers = dict(auth_headers)
+            auth_headers[AUTH_TOKEN_HEADER] = token_id
+            rest_client.auth_headers = auth_headers
+
+    def create_container(self, container_name, *args, **kwargs):
+        """Create container.
+
+        Args:
+            container_name: container name
+            Remaining arguments are passed to CloudfilesClient.create_container().
+        Returns:
+            GContainer object
+        """
+        super(GCloudfilesClient, self).create_container(
+                container_name, *args, **kwargs)
+        if self.metadata_cache is not None:
+            self.metadata_cache.invalidate_container(container_name)
+        return self.get_container(container_name)
+
+    def delete_container(self, container_name, *args, **kwargs):
+        """Delete container.
+
+        Args:
+            container_name: container name
+            Remaining arguments are passed to CloudfilesClient.delete_container().
+        """
+        try:
+            return super(GCloudfilesClient, self).delete_container(
+                    container_name, *args, **kwargs)
+        finally:
+            if self.metadata_cache is not None:
+                self.metadata_cache.invalidate_container(container_name)
+
+    def get_container(self, container_name):
+        """Get container.
+
+        Args:
+            container_name: container name
+        Returns:
+            GContainer object
+        Raises:
+            NoSuchContainer if container does not exist.
+        """
+        if self.metadata_cache is None:
+            return GContainer(self, container_name, exists=True)
+
+        return self.metadata_cache.get(
+                self.metadata_cache.container_key(container_name),
+                lambda: GContainer(self, container_name, exists=True))
+
+    def temp_url_signer(self):
+        """Return TempUrlSigner for the account.
+
+        The account temp url key is fetched, or created if the account
+        doesn't have one, on first use and cached until
+        invalidate_temp_url_key() is called. Concurrent first calls
+        share a single fetch.
+
+        Urls are always signed for the public storage url, which is
+        cached with the key, so they're usable outside the servicenet
+        regardless of the endpoint requests are currently routed to.
+
+        Returns:
+            TempUrlSigner object
+        """
+        signer = self._temp_url_signer
+        if signer is not None:
+            return signer
+
+        pending = self._temp_url_pending
+        if pending is not None:
+            return pending.get()
+
+        pending = self._temp_url_pending = AsyncResult()
+        try:
+            key = self._load_temp_url_key()
+            signer = TempUrlSigner(key,
+                    public_storage_url(self.cloudfiles.rest_client.endpoint))
+            self._temp_url_signer = signer
+            pending.set(signer)
+            return signer
+        except Exception as error:
+            pending.set_exception(error)
+            raise
+        finally:
+            self._temp_url_pending = None
+
+    def temp_urls(self, requests):
+        """Return temp urls for many objects without network requests.
+
+        Args:
+            requests: iterable of (object, method, seconds) tuples where
+                object is a GStorageObject or url quoted object path,
+                i.e. /container/object, method is the http method the
+                url is valid for, and seconds is the number of seconds
+                the url is valid for.
+        Returns:
+            list of temp urls in request order
+        """
+        return self.temp_url_signer().sign_many(requests)
+
+    def set_temp_url_key(self, key):
+        """Set the account temp url key.
+
+        Note that this invalidates all previously issued temp urls.
+
+        Args:
+            key: new temp url key
+        Raises:
+            TempUrlKeyError if the key could not be set.
+        """
+        self._post_temp_url_key(key)
+        self.invalidate_temp_url_key()
+
+    def invalidate_temp_url_key(self):
+        """Discard the cached temp url key."""
+        self._temp_url_signer = None
+
+    def _load_temp_url_key(self):
+        """Return account temp url key, creating it if needed."""
+        response = self._send_request("HEAD", "/")
+        response.read()
+        key = response.getheader(TEMP_URL_KEY_HEADER.lower())
+        if not key:
+            key = uuid.uuid4().hex
+            self._post_temp_url_key(key)
+        return key
+
+    def _post_temp_url_key(self, key):
+        """Set account temp url key, raising TempUrlKeyError on failure."""
+        response = self._send_request("POST", "/",
+                headers={TEMP_URL_KEY_HEADER: key})
+        response.read()
+        if response.status >= 300:
+            raise TempUrlKeyError(
+                    "set temp url key status %d" % response.status,
+                    status=response.status)
+
+    def _send_request(self, method, path, data=None, params=None, headers=None,
+            retry=True):
+        """Send authenticated request to the cloudfiles api.
+
+        This is a thin wrapper around the authenticated cloudfiles
+        rest client for api calls which are not exposed through the
+        base CloudfilesClient (i.e. SLO manifests, bulk operations).
+
+        Args:
+            method: http method, i.e. GET
+            path: url quoted path relative to the cloudfiles
+                storage endpoint, i.e. /container/object
+            data: optional request body, string or file-like object
+            params: optional dict of query parameters
+            headers: optional dict of http headers
+            retry: boolean indicating the request may be retried.
+                If False, the request is sent once directly on the
+                rest client, i.e. for bodies which can't be rewound.
+        Returns:
+            http response object
+        """
+        if not retry:
+            self.ensure_authenticated()
+            return self.cloudfiles.rest_client.send_request(
+                    method,
+                    path,
+                    data=data,
+                    params=params,
+                    headers=headers)
+
+        if self._sync_on_send:
+            self._sync_token()
+        return self.cloudfiles.send_request(
+                method,
+                path,
+                data=data,
+                params=params,
+                headers=headers)
+
+    def _sync_token(self):
+        """Apply the identity client's current token to auth headers.
+
+        Auth headers are only updated if they hold another token, so
+        clients which haven't authenticated yet, or whose headers have
+        been cleared, authenticate as usual.
+        """
+        sync_token = getattr(self._identity_client, "sync_token", None)
+        if sync_token is None:
+            return
+        sync_token()
+
+        token = getattr(self._identity_client, "token", None)
+        token_id = getattr(token, "id", token)
+        rest_client = self.cloudfiles.rest_client
+        auth_headers = getattr(rest_client, "auth_headers", None) or {}
+        if token_id is not None \
+                and auth_headers.get(AUTH_TOKEN_HEADER) not in (None, token_id):
+            auth_headers = dict(auth_headers)
+            auth_headers[AUTH_TOKEN_HEADER] = token_id
+            rest_client.auth_headers = auth_headers
+
+
+def _accepts_argument(cls, name):
+    """Return True if cls's constructor accepts keyword argument name."""
+    try:
+        spec = inspect.getargspec(cls.__init__)
+    except TypeError:
+        return False
+    return name in spec.args or spec.keywords is not None
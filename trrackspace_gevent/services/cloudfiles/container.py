@@ -1 +1,453 @@
 from trrackspace.services.cloudfiles.container import *
+from trrackspace.services.cloudfiles.container import Container
+from trrackspace_gevent.services.cloudfiles.archive import StreamingArchive, \
+        MAX_ARCHIVE_BYTES, MAX_ARCHIVE_FILES
+from trrackspace_gevent.services.cloudfiles.bulk_copy import BulkCopy, \
+        DEFAULT_COPY_CONCURRENCY
+from trrackspace_gevent.services.cloudfiles.delete import BulkDelete, \
+        DEFAULT_DELETE_BATCH_SIZE, DEFAULT_DELETE_CONCURRENCY
+from trrackspace_gevent.services.cloudfiles.index import ContainerIndex
+from trrackspace_gevent.services.cloudfiles.listing import PrefetchingLister, \
+        ShardedLister, StreamingLister, DEFAULT_LISTING_BATCH_SIZE, \
+        DEFAULT_LISTING_CONCURRENCY, DEFAULT_LISTING_SHARDS, MAX_LISTING_LIMIT
+from trrackspace_gevent.services.cloudfiles.storage_object import GStorageObject
+from trrackspace_gevent.services.cloudfiles.sync import ContainerSync, \
+        DEFAULT_SYNC_CONCURRENCY
+
+class GContainer(Container):
+    """GEvent Rackspace Cloudfiles container.
+
+    GContainer extends Container with concurrent operations and
+    returns GStorageObject objects.
+    """
+
+    def list_all_objects(self, batch_size=DEFAULT_LISTING_BATCH_SIZE,
+            prefetch=None, **kwargs):
+        """Generator yielding all objects in the container.
+
+        If prefetch is not given, pages are fetched on demand exactly
+        as Container.list_all_objects(). Otherwise, up to prefetch
+        pages are fetched ahead by a background greenlet while the
+        caller processes the current page.
+
+        Args:
+            batch_size: number of objects per listing request
+            prefetch: optional number of pages to fetch ahead
+            Remaining arguments, i.e. prefix and delimiter,
+            are passed to Container.list_objects().
+        Returns:
+            generator yielding object dicts
+        """
+        if prefetch is None:
+            return super(GContainer, self).list_all_objects(
+                    batch_size=batch_size, **kwargs)
+
+        lister = PrefetchingLister(
+                container=self,
+                batch_size=batch_size,
+                prefetch=prefetch,
+                **kwargs)
+        return lister.objects()
+
+    def stream_objects(self, batch_size=MAX_LISTING_LIMIT, as_dict=False,
+            **kwargs):
+        """Generator yielding all objects in the container as they're parsed.
+
+        Unlike list_all_objects(), listing pages are parsed
+        incrementally from the response body and entries are yielded
+        as compact ObjectRecord (and SubdirRecord for delimiter
+        listings) objects, so large batch sizes don't require holding
+        a page of dicts in memory. Records support dict style access,
+        i.e. record["name"], and as_dict().
+
+        Args:
+            batch_size: number of objects per listing request
+            as_dict: boolean indicating dicts should be yielded
+                instead of records.
+            Remaining arguments, i.e. prefix, delimiter, marker and
+            end_marker, are passed as listing query parameters.
+        Returns:
+            generator yielding ObjectRecord and SubdirRecord objects,
+            or dicts if as_dict is True.
+        """
+        lister = StreamingLister(
+                container=self,
+                batch_size=batch_size,
+                as_dict=as_dict,
+                **kwargs)
+        return lister.objects()
+
+    def scan_objects(self,
+            boundaries=None,
+            shards=DEFAULT_LISTING_SHARDS,
+            delimiter=None,
+            concurrency=DEFAULT_LISTING_CONCURRENCY,
+            ordered=True,
+            prefix=None,
+            batch_size=MAX_LISTING_LIMIT,
+            as_dict=False):
+        """Generator yielding all objects in the container, listed in parallel.
+
+        The keyspace is split into ranges which are listed
+        concurrently with marker/end_marker, so full scans of very
+        large containers aren't limited by a single marker chain.
+
+        Args:
+            boundaries: optional sorted list of names to split the
+                keyspace at, i.e. ["c", "m", "t"].
+            shards: number of evenly spaced alphanumeric ranges to
+                split the keyspace into if boundaries aren't given.
+            delimiter: optional delimiter. If given, each pseudo
+                directory of a delimiter listing is listed as a range
+                instead, which suits containers with many top level
+                pseudo directories.
+            concurrency: maximum number of ranges listed concurrently
+            ordered: boolean indicating objects should be yielded in
+                name order. Otherwise they're yielded as they arrive.
+            prefix: optional prefix of object names to list
+            batch_size: number of objects per listing request
+            as_dict: boolean indicating dicts should be yielded
+                instead of ObjectRecord objects.
+        Returns:
+            generator yielding ObjectRecord objects, or dicts if
+            as_dict is True.
+        """
+        lister = ShardedLister(
+                container=self,
+                boundaries=boundaries,
+                shards=shards,
+                delimiter=delimiter,
+                concurrency=concurrency,
+                ordered=ordered,
+                prefix=prefix,
+                batch_size=batch_size,
+                as_dict=as_dict)
+        return lister.objects()
+
+    def create_index(self, batch_size=MAX_LISTING_LIMIT):
+        """Create local index of the container listing.
+
+        Args:
+            batch_size: number of objects per listing request
+        Returns:
+            ContainerIndex containing a snapshot of the container
+        """
+        index = ContainerIndex(self, batch_size=batch_size)
+        index.snapshot()
+        return index
+
+    def delete_objects(self, object_names,
+            concurrency=DEFAULT_DELETE_CONCURRENCY,
+            bulk=True,
+            callback=None):
+        """Delete objects.
+
+        Objects are deleted using the bulk delete endpoint if available,
+        otherwise concurrently from a bounded gevent pool.
+
+        Args:
+            object_names: iterable of object names
+            concurrency: maximum number of concurrent delete requests
+            bulk: boolean indicating that the bulk delete endpoint
+                should be used if it's available.
+            callback: optional callable invoked with the DeleteResult
+                after each batch of objects is deleted.
+        Returns:
+            DeleteResult object with per-object errors.
+        """
+        delete = BulkDelete(
+                container=self,
+                concurrency=concurrency,
+                bulk=bulk,
+                callback=callback)
+        try:
+            return delete.delete(object_names)
+        finally:
+            self.invalidate_metadata(all_objects=True)
+
+    def delete_all_objects(self,
+            batch_size=DEFAULT_DELETE_BATCH_SIZE,
+            concurrency=DEFAULT_DELETE_CONCURRENCY,
+            bulk=True,
+            callback=None):
+        """Delete all objects in the container.
+
+        Listing of the next batch of objects overlaps with deletion
+        of the current one.
+
+        Args:
+            batch_size: number of objects to list and delete per batch
+            concurrency: maximum number of concurrent delete requests
+            bulk: boolean indicating that the bulk delete endpoint
+                should be used if it's available.
+            callback: optional callable invoked with the DeleteResult
+                after each batch of objects is deleted.
+        Returns:
+            DeleteResult object with per-object errors.
+        """
+        delete = BulkDelete(
+                container=self,
+                batch_size=batch_size,
+                concurrency=concurrency,
+                bulk=bulk,
+                callback=callback)
+        try:
+            return delete.delete_all()
+        finally:
+            self.invalidate_metadata(all_objects=True)
+
+    def create_object(self, object_name, *args, **kwargs):
+        """Create object.
+
+        Note that the object will not exist on the server until
+        it is written to.
+
+        Args:
+            object_name: object name
+            Remaining arguments are passed to the GStorageObject constructor.
+        Returns:
+            GStorageObject object
+        """
+        return GStorageObject(self, object_name, *args, **kwargs)
+
+    def get_object(self, object_name):
+        """Get object.
+
+        Args:
+            object_name: object name
+        Returns:
+            GStorageObject object
+        Raises:
+            NoSuchObject if object does not exist.
+        """
+        metadata_cache = self.client.metadata_cache
+        if metadata_cache is None:
+            return GStorageObject(self, object_name, exists=True)
+
+        return metadata_cache.get(
+                metadata_cache.object_key(self.name, object_name),
+                lambda: GStorageObject(self, object_name, exists=True))
+
+    def delete_object(self, object_name):
+        """Delete object.
+
+        Args:
+            object_name: object name
+        Raises:
+            NoSuchObject if object does not exist.
+        """
+        try:
+            super(GContainer, self).delete_object(object_name)
+        finally:
+            self.invalidate_metadata(object_name)
+
+    def update_metadata(self, *args, **kwargs):
+        """Update container metadata.
+
+        Arguments are passed to Container.update_metadata().
+        """
+        try:
+            return super(GContainer, self).update_metadata(*args, **kwargs)
+        finally:
+            self.invalidate_metadata()
+
+    def enable_object_versioning(self, *args, **kwargs):
+        """Enable object versioning.
+
+        Arguments are passed to Container.enable_object_versioning().
+        """
+        try:
+            return super(GContainer, self).enable_object_versioning(
+                    *args, **kwargs)
+        finally:
+            self.invalidate_metadata()
+
+    def disable_object_versioning(self, *args, **kwargs):
+        """Disable object versioning.
+
+        Arguments are passed to Container.disable_object_versioning().
+        """
+        try:
+            return super(GContainer, self).disable_object_versioning(
+                    *args, **kwargs)
+        finally:
+            self.invalidate_metadata()
+
+    def enable_log_retention(self, *args, **kwargs):
+        """Enable access log retention.
+
+        Arguments are passed to Container.enable_log_retention().
+        """
+        try:
+            return super(GContainer, self).enable_log_retention(
+                    *args, **kwargs)
+        finally:
+            self.invalidate_metadata()
+
+    def disable_log_retention(self, *args, **kwargs):
+        """Disable access log retention.
+
+        Arguments are passed to Container.disable_log_retention().
+        """
+        try:
+            return super(GContainer, self).disable_log_retention(
+                    *args, **kwargs)
+        finally:
+            self.invalidate_metadata()
+
+    def extract_archive(self, *args, **kwargs):
+        """Extract archive into the container.
+
+        Arguments are passed to Container.extract_archive().
+        """
+        try:
+            return super(GContainer, self).extract_archive(*args, **kwargs)
+        finally:
+            self.invalidate_metadata(all_objects=True)
+
+    def delete(self, *args, **kwargs):
+        """Delete container.
+
+        Arguments are passed to Container.delete().
+        """
+        try:
+            return super(GContainer, self).delete(*args, **kwargs)
+        finally:
+            self.invalidate_metadata(all_objects=True)
+
+    def invalidate_metadata(self, object_name=None, all_objects=False):
+        """Invalidate cached container metadata.
+
+        Object changes also invalidate the container, since its
+        object count and bytes used will change.
+
+        Args:
+            object_name: optional object name to invalidate
+            all_objects: boolean indicating that all of the
+                container's objects should be invalidated.
+        """
+        metadata_cache = self.client.metadata_cache
+        if metadata_cache is None:
+            return
+        if all_objects:
+            metadata_cache.invalidate_container(self.name)
+            return
+        metadata_cache.invalidate(metadata_cache.container_key(self.name))
+        if object_name is not None:
+            metadata_cache.invalidate(
+                    metadata_cache.object_key(self.name, object_name))
+
+    def sync(self, path,
+            prefix="",
+            delete=False,
+            concurrency=DEFAULT_SYNC_CONCURRENCY,
+            segment_size=None,
+            callback=None):
+        """Incrementally sync local directory to the container.
+
+        Only files which are new, or differ from the remote object in
+        size or ETag, are uploaded.
+
+        Args:
+            path: local directory to sync from
+            prefix: optional object name prefix, i.e. 'assets/'
+            delete: boolean indicating that remote objects under prefix
+                with no corresponding local file should be deleted.
+            concurrency: maximum number of concurrent uploads
+            segment_size: optional segment size in bytes. Files larger
+                than segment_size are uploaded as segmented objects.
+            callback: optional callable invoked with (object_name,
+                SyncResult) after each file is processed.
+        Returns:
+            SyncResult object with bytes and objects transferred.
+        """
+        container_sync = ContainerSync(
+                container=self,
+                path=path,
+                prefix=prefix,
+                delete=delete,
+                concurrency=concurrency,
+                segment_size=segment_size,
+                callback=callback)
+        try:
+            return container_sync.sync()
+        finally:
+            self.invalidate_metadata(all_objects=True)
+
+    def extract_archive_stream(self, source,
+            format="tar.gz",
+            prefix=None,
+            max_files=MAX_ARCHIVE_FILES,
+            max_bytes=MAX_ARCHIVE_BYTES):
+        """Extract archive built on the fly into the container.
+
+        Streaming variant of extract_archive() which builds the archive
+        while it's being uploaded, without a temporary file. Input
+        exceeding max_files or max_bytes is split across multiple
+        archives.
+
+        Args:
+            source: local directory path, or iterable of
+                (name, data) tuples where data is a string or
+                file-like object, i.e. a generator.
+            format: archive format, 'tar', 'tar.gz' or 'tar.bz2'
+            prefix: optional object name prefix for extracted files
+            max_files: maximum number of files per archive
+            max_bytes: maximum size in bytes of each archive as sent
+        Returns:
+            dict in the extract_archive() result format, with
+            'Number Files Created' and 'Errors' totaled across archives.
+        """
+        archive = StreamingArchive(
+                container=self,
+                format=format,
+                prefix=prefix,
+                max_files=max_files,
+                max_bytes=max_bytes)
+        try:
+            return archive.extract(source)
+        finally:
+            self.invalidate_metadata(all_objects=True)
+
+    def copy_objects(self, destination,
+            object_names=None,
+            prefix=None,
+            concurrency=DEFAULT_COPY_CONCURRENCY,
+            metadata=None,
+            fresh_metadata=False,
+            rename=None,
+            callback=None):
+        """Concurrent server-side copy of objects to another container.
+
+        Args:
+            destination: destination GContainer
+            object_names: optional iterable of object names to copy.
+                If not given, all objects with prefix are copied.
+            prefix: optional prefix of objects to copy if
+                object_names is not given.
+            concurrency: maximum number of concurrent copy requests
+            metadata: optional dict of object metadata headers, i.e.
+                {"x-object-meta-release": "1.0"}, to set on copies.
+            fresh_metadata: boolean indicating that copies should not
+                retain the source object's metadata.
+            rename: optional callable returning the destination object
+                name for a source object name.
+            callback: optional callable invoked with (object_name,
+                CopyResult) after each object is processed.
+        Returns:
+            CopyResult object with per-object results.
+        """
+        bulk_copy = BulkCopy(
+                container=self,
+                destination=destination,
+                concurrency=concurrency,
+                metadata=metadata,
+                fresh_metadata=fresh_metadata,
+                rename=rename,
+                callback=callback)
+        try:
+            if object_names is None:
+                return bulk_copy.copy_all(prefix=prefix)
+            return bulk_copy.copy(object_names)
+        finally:
+            destination.invalidate_metadata(all_objects=True)
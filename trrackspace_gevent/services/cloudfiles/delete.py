@@ -0,0 +1,217 @@
+import json
+import urllib
+
+import gevent
+from gevent.pool import Pool
+from gevent.queue import Queue
+
+from trrackspace_gevent.services.cloudfiles.errors import NoSuchObject
+
+#Maximum number of objects cloudfiles allows in a single bulk delete.
+MAX_BULK_DELETE = 10000
+
+#Bulk delete response statuses indicating bulk delete isn't supported.
+BULK_UNSUPPORTED_STATUSES = (404, 405, 501)
+
+DEFAULT_DELETE_BATCH_SIZE = 1000
+DEFAULT_DELETE_CONCURRENCY = 4
+
+class DeleteResult(object):
+    """Result of a BulkDelete.
+
+    Attributes:
+        deleted: number of objects deleted
+        not_found: number of objects which did not exist
+        errors: dict of {object_name: error} for objects which
+            could not be deleted.
+    """
+
+    def __init__(self):
+        self.deleted = 0
+        self.not_found = 0
+        self.errors = {}
+
+    @property
+    def processed(self):
+        """Total number of objects processed."""
+        return self.deleted + self.not_found + len(self.errors)
+
+    def __repr__(self):
+        return "DeleteResult(deleted=%d, not_found=%d, errors=%d)" % (
+                self.deleted, self.not_found, len(self.errors))
+
+
+class BulkDelete(object):
+    """Pipelined, concurrent container object deletion.
+
+    Object names are consumed in batches from a producer greenlet,
+    so listing the next page of a container overlaps with deleting
+    the current one. Each batch is deleted with a single request to
+    the cloudfiles bulk delete endpoint if available. Otherwise, or if
+    bulk is False, objects are deleted individually from a bounded
+    gevent pool.
+
+    Failures are recorded per object in the DeleteResult rather than
+    aborting the run.
+    """
+
+    def __init__(self,
+            container,
+            batch_size=DEFAULT_DELETE_BATCH_SIZE,
+            concurrency=DEFAULT_DELETE_CONCURRENCY,
+            bulk=True,
+            callback=None):
+        """BulkDelete constructor
+
+        Args:
+            container: GContainer to delete objects from
+            batch_size: number of objects per batch. This is also the
+                listing page size used by delete_all().
+            concurrency: maximum number of concurrent delete requests
+            bulk: boolean indicating that the bulk delete endpoint
+                should be used if it's available.
+            callback: optional callable invoked with the DeleteResult
+                after each batch completes for progress reporting.
+        """
+        if batch_size < 1 or batch_size > MAX_BULK_DELETE:
+            raise ValueError("batch_size must be between 1 and %d"
+                    % MAX_BULK_DELETE)
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+
+        self.container = container
+        self.client = container.client
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.bulk = bulk
+        self.callback = callback
+        self.result = DeleteResult()
+        self.object_pool = Pool(concurrency)
+
+    def delete_all(self):
+        """Delete all objects in the container.
+
+        Returns:
+            DeleteResult object
+        Raises:
+            Listing errors. Delete errors are reported in the result.
+        """
+        objects = self.container.list_all_objects(batch_size=self.batch_size)
+        return self.delete(o["name"] for o in objects)
+
+    def delete(self, object_names):
+        """Delete objects.
+
+        Args:
+            object_names: iterable of object names
+        Returns:
+            DeleteResult object
+        Raises:
+            Errors raised by object_names iteration. Delete errors
+            are reported in the result.
+        """
+        queue = Queue(maxsize=self.concurrency)
+        producer = gevent.spawn(self._produce, object_names, queue)
+        pool = Pool(self.concurrency)
+        try:
+            for batch in queue:
+                pool.spawn(self._delete_batch, batch)
+            pool.join()
+            self.object_pool.join()
+            producer.get()
+        finally:
+            producer.kill()
+            pool.kill()
+            self.object_pool.kill()
+        return self.result
+
+    def _produce(self, object_names, queue):
+        """Put batches of object names on queue followed by StopIteration.
+
+        StopIteration is also put if iteration fails so the consumer
+        will stop and raise the error. It's not put if the producer is
+        killed, since the queue may be full with no consumer left.
+        """
+        try:
+            batch = []
+            for name in object_names:
+                batch.append(name)
+                if len(batch) >= self.batch_size:
+                    queue.put(batch)
+                    batch = []
+            if batch:
+                queue.put(batch)
+        except Exception:
+            queue.put(StopIteration)
+            raise
+        queue.put(StopIteration)
+
+    def _delete_batch(self, batch):
+        """Delete batch of objects."""
+        if not self.bulk or not self._bulk_delete(batch):
+            greenlets = [self.object_pool.spawn(self._delete_object, name)
+                    for name in batch]
+            gevent.joinall(greenlets)
+
+        if self.callback is not None:
+            self.callback(self.result)
+
+    def _bulk_delete(self, batch):
+        """Delete batch of objects using the bulk delete endpoint.
+
+        If the endpoint isn't available bulk deletes are disabled for
+        the rest of the run. If the request fails for any other reason,
+        or the response body reports a failure without per object
+        errors, only this batch falls back to individual deletes.
+
+        Returns:
+            True if the batch was processed, False if it should be
+            deleted with individual requests.
+        """
+        paths = ["/%s/%s" % (
+            urllib.quote(self.container.name),
+            urllib.quote(name)) for name in batch]
+        headers = {
+            "Content-Type": "text/plain",
+            "Accept": "application/json"
+        }
+
+        try:
+            response = self.client._send_request(
+                    "POST",
+                    "/",
+                    data="\n".join(paths),
+                    params={"bulk-delete": ""},
+                    headers=headers)
+            data = response.read()
+            if response.status in BULK_UNSUPPORTED_STATUSES:
+                self.bulk = False
+                return False
+            elif response.status >= 300:
+                return False
+            body = json.loads(data)
+        except Exception:
+            return False
+
+        errors = body.get("Errors") or []
+        response_status = body.get("Response Status") or "200 OK"
+        if not response_status.startswith("2") and not errors:
+            return False
+
+        names = dict(zip(paths, batch))
+        for path, status in errors:
+            name = names.get(path, urllib.unquote(path))
+            self.result.errors[name] = status
+        self.result.deleted += body.get("Number Deleted", 0)
+        self.result.not_found += body.get("Number Not Found", 0)
+        return True
+
+    def _delete_object(self, name):
+        """Delete single object."""
+        try:
+            self.container.delete_object(name)
+            self.result.deleted += 1
+        except NoSuchObject:
+            self.result.not_found += 1
+        except Exception as error:
+            self.result.errors[name] = error
@@ -0,0 +1,330 @@
+import collections
+import json
+import os
+
+import gevent
+from gevent.pool import Pool
+
+from trrackspace_gevent.services.cloudfiles.errors import RangedDownloadError, \
+        ObjectChanged
+
+DEFAULT_RANGE_SIZE = 16 * 1024 * 1024
+DEFAULT_RANGE_CONCURRENCY = 4
+
+class RangedDownload(object):
+    """Concurrent ranged download.
+
+    The requested byte range of the storage object is split into
+    ranges of range_size bytes which are fetched concurrently with
+    Range GET requests, each in its own greenlet. Ranges are returned
+    in order, and at most concurrency ranges are in flight (or buffered)
+    at any time, which bounds memory to roughly
+    concurrency * range_size bytes.
+    """
+
+    def __init__(self,
+            storage_object,
+            range_size=DEFAULT_RANGE_SIZE,
+            concurrency=DEFAULT_RANGE_CONCURRENCY):
+        """RangedDownload constructor
+
+        Args:
+            storage_object: GStorageObject to download
+            range_size: size in bytes of each Range request
+            concurrency: maximum number of ranges in flight
+        """
+        if range_size < 1:
+            raise ValueError("range_size must be at least 1")
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+
+        self.storage_object = storage_object
+        self.range_size = range_size
+        self.concurrency = concurrency
+
+    def chunks(self, size=None, offset=0):
+        """Generator yielding object data in order, one range at a time.
+
+        Args:
+            size: optional number of bytes to read. If not given,
+                data will be read until the end of the object.
+            offset: optional byte offset to start reading from
+        Returns:
+            generator yielding strings of at most range_size bytes
+        Raises:
+            RangedDownloadError if a range request returns fewer
+            bytes than expected.
+        """
+        pending = collections.deque()
+        try:
+            for range_offset, range_size in self.ranges(size, offset):
+                if len(pending) >= self.concurrency:
+                    yield pending.popleft().get()
+                pending.append(gevent.spawn(
+                    self._read_range, range_offset, range_size))
+            while pending:
+                yield pending.popleft().get()
+        finally:
+            gevent.killall(list(pending))
+
+    def read(self, size=None, offset=0, output=None, output_chunk_size=None):
+        """Read object data.
+
+        Args:
+            size: optional number of bytes to read. If not given,
+                data will be read until the end of the object.
+            offset: optional byte offset to start reading from
+            output: optional file-like object to write data to. If
+                given, data is written to output in order instead of
+                being returned.
+            output_chunk_size: optional maximum size of each write
+                to output. Defaults to range_size.
+        Returns:
+            object data as a string if output is not given,
+            otherwise None.
+        """
+        if output is None:
+            return "".join(self.chunks(size, offset))
+
+        for data in self.chunks(size, offset):
+            if output_chunk_size is None:
+                output.write(data)
+            else:
+                for index in range(0, len(data), output_chunk_size):
+                    output.write(data[index:index + output_chunk_size])
+
+    def ranges(self, size=None, offset=0):
+        """Return list of (offset, size) tuples to request.
+
+        Args:
+            size: optional number of bytes to read. If not given,
+                data will be read until the end of the object.
+            offset: optional byte offset to start reading from
+        Returns:
+            list of (offset, size) tuples
+        """
+        if self.storage_object.content_length is None:
+            self.storage_object.load()
+
+        end = self.storage_object.content_length
+        if size is not None:
+            end = min(end, offset + size)
+
+        result = []
+        for range_offset in range(offset, end, self.range_size):
+            result.append(
+                (range_offset, min(self.range_size, end - range_offset)))
+        return result
+
+    def _read_range(self, offset, size):
+        """Read a single range of the object."""
+        data = self.storage_object.read(size=size, offset=offset)
+        if len(data) != size:
+            raise RangedDownloadError(
+                    "range %d-%d returned %d bytes"
+                    % (offset, offset + size - 1, len(data)))
+        return data
+
+
+class DownloadCheckpoint(object):
+    """On-disk record of the completed byte ranges of a download.
+
+    The checkpoint is stored as JSON in a sidecar file next to the
+    download, and is replaced atomically on each save.
+
+    Attributes:
+        path: checkpoint file path
+        etag: etag of the object being downloaded
+        size: size of the object being downloaded
+        completed: sorted list of non-overlapping [start, end)
+            byte ranges which have been written.
+    """
+
+    def __init__(self, path, etag=None, size=None, completed=None):
+        self.path = path
+        self.etag = etag
+        self.size = size
+        self.completed = completed or []
+
+    @classmethod
+    def load(cls, path):
+        """Load checkpoint from path.
+
+        Returns:
+            DownloadCheckpoint, or None if path doesn't exist or
+            can't be parsed.
+        """
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            return cls(path,
+                    etag=data["etag"],
+                    size=data["size"],
+                    completed=[tuple(r) for r in data["completed"]])
+        except (IOError, ValueError, KeyError, TypeError):
+            return None
+
+    def save(self):
+        """Atomically write checkpoint to disk."""
+        data = {
+            "etag": self.etag,
+            "size": self.size,
+            "completed": self.completed
+        }
+        temp_path = "%s.tmp" % self.path
+        with open(temp_path, "w") as f:
+            json.dump(data, f)
+        os.rename(temp_path, self.path)
+
+    def delete(self):
+        """Remove checkpoint from disk."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def add(self, start, end):
+        """Record [start, end) byte range as completed."""
+        ranges = sorted(self.completed + [(start, end)])
+        merged = [ranges[0]]
+        for range_start, range_end in ranges[1:]:
+            if range_start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], range_end))
+            else:
+                merged.append((range_start, range_end))
+        self.completed = merged
+
+    def missing(self):
+        """Return list of [start, end) byte ranges not yet completed."""
+        result = []
+        position = 0
+        for start, end in self.completed:
+            if start > position:
+                result.append((position, start))
+            position = max(position, end)
+        if position < self.size:
+            result.append((position, self.size))
+        return result
+
+
+class ResumableDownload(object):
+    """Resumable download to a local file.
+
+    Completed byte ranges are recorded in a sidecar checkpoint file,
+    so a failed download can be retried without re-fetching data
+    which has already been written. If the object's etag or size no
+    longer match the checkpoint, the download restarts from the
+    beginning. Ranges are requested with If-Match on the object's
+    etag, so if the object changes mid-transfer the download fails
+    safely with ObjectChanged rather than mixing data from different
+    versions.
+    """
+
+    def __init__(self,
+            storage_object,
+            path,
+            range_size=DEFAULT_RANGE_SIZE,
+            concurrency=DEFAULT_RANGE_CONCURRENCY,
+            checkpoint_path=None):
+        """ResumableDownload constructor
+
+        Args:
+            storage_object: GStorageObject to download
+            path: local file path to download to
+            range_size: size in bytes of each Range request, which is
+                also the checkpoint granularity.
+            concurrency: maximum number of ranges in flight
+            checkpoint_path: optional checkpoint file path. Defaults
+                to '<path>.checkpoint'.
+        """
+        if range_size < 1:
+            raise ValueError("range_size must be at least 1")
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+
+        self.storage_object = storage_object
+        self.client = storage_object.container.client
+        self.path = path
+        self.range_size = range_size
+        self.concurrency = concurrency
+        self.checkpoint_path = checkpoint_path or "%s.checkpoint" % path
+
+    def download(self):
+        """Download object to file, resuming from the checkpoint if valid.
+
+        Returns:
+            number of bytes fetched by this call
+        Raises:
+            ObjectChanged if the object changes during this call. The
+            checkpoint is discarded so the next attempt restarts.
+        """
+        self.storage_object.load()
+        etag = self.storage_object.etag
+        size = self.storage_object.content_length
+
+        checkpoint = DownloadCheckpoint.load(self.checkpoint_path)
+        if checkpoint is None \
+                or checkpoint.etag != etag \
+                or checkpoint.size != size \
+                or not os.path.exists(self.path):
+            checkpoint = DownloadCheckpoint(
+                    self.checkpoint_path, etag=etag, size=size)
+            with open(self.path, "wb") as f:
+                f.truncate(size)
+            checkpoint.save()
+
+        ranges = []
+        for start, end in checkpoint.missing():
+            for offset in range(start, end, self.range_size):
+                ranges.append((offset, min(offset + self.range_size, end)))
+
+        self.fetched = 0
+        pool = Pool(self.concurrency)
+        with open(self.path, "r+b") as f:
+            try:
+                for start, end in ranges:
+                    pool.spawn(self._fetch, f, checkpoint, start, end)
+                pool.join(raise_error=True)
+            except ObjectChanged:
+                checkpoint.delete()
+                raise
+            finally:
+                pool.kill()
+
+        checkpoint.delete()
+        return self.fetched
+
+    def _fetch(self, f, checkpoint, start, end):
+        """Fetch [start, end) byte range, write it to f and checkpoint it.
+
+        Data is flushed to disk before the checkpoint is saved, so
+        the checkpoint never records data which hasn't been written.
+        The fsync runs in the hub's threadpool so it doesn't block
+        other greenlets.
+        """
+        data = self._read_range(checkpoint.etag, start, end)
+        f.seek(start)
+        f.write(data)
+        f.flush()
+        gevent.get_hub().threadpool.apply(os.fsync, (f.fileno(),))
+        checkpoint.add(start, end)
+        checkpoint.save()
+        self.fetched += len(data)
+
+    def _read_range(self, etag, start, end):
+        """Read [start, end) byte range if the object still matches etag."""
+        headers = {
+            "Range": "bytes=%d-%d" % (start, end - 1),
+            "If-Match": etag
+        }
+        response = self.client._send_request(
+                "GET",
+                self.storage_object.path,
+                headers=headers)
+        data = response.read()
+        if response.status == 412:
+            raise ObjectChanged("%s changed during download"
+                    % self.storage_object.name)
+        if len(data) != end - start:
+            raise RangedDownloadError(
+                    "range %d-%d returned %d bytes"
+                    % (start, end - 1, len(data)))
+        return data
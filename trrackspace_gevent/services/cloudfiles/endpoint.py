@@ -0,0 +1,249 @@
+import functools
+import httplib
+import socket
+import time
+
+import gevent
+from gevent.lock import BoundedSemaphore
+
+#Endpoint names
+SERVICENET = "servicenet"
+PUBLIC = "public"
+
+DEFAULT_PROBE_INTERVAL = 300
+DEFAULT_PROBE_COUNT = 3
+DEFAULT_PROBE_TIMEOUT = 5
+DEFAULT_FAILURE_THRESHOLD = 3
+
+class EndpointSelector(object):
+    """Latency-based selection between servicenet and public endpoints.
+
+    The selector probes each cloudfiles endpoint of a client with
+    lightweight account HEAD requests and routes the client's requests
+    to the fastest healthy endpoint. Endpoints are first evaluated in
+    the background once the selector is attached, then every
+    probe_interval seconds, and immediately after failure_threshold
+    consecutive failed requests (connection errors, timeouts and 5xx
+    responses) on the current endpoint. Evaluations never overlap.
+
+    A selector routes a single client, and is stopped by close().
+
+    The current endpoint and probe latencies are exposed as attributes
+    and, if a metrics sink is given, reported as:
+
+        cloudfiles.endpoint.probe.<endpoint>: probe latency (timing)
+        cloudfiles.endpoint.selected.<endpoint>: selections (count)
+        cloudfiles.endpoint.switch: endpoint changes (count)
+        cloudfiles.endpoint.failures: failed requests (count)
+
+    Example usage:
+        selector = EndpointSelector()
+        client = GCloudfilesClient(..., endpoint_selector=selector)
+        selector.current
+    """
+
+    def __init__(self,
+            probe_interval=DEFAULT_PROBE_INTERVAL,
+            probe_count=DEFAULT_PROBE_COUNT,
+            probe_timeout=DEFAULT_PROBE_TIMEOUT,
+            failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+            metrics=None):
+        """EndpointSelector constructor
+
+        Args:
+            probe_interval: optional number of seconds between periodic
+                re-evaluations. If None, endpoints are evaluated once
+                when attached, then only following failures or calls
+                to select().
+            probe_count: number of probe requests per endpoint. The
+                median latency is used.
+            probe_timeout: number of seconds after which a probe
+                request is considered failed.
+            failure_threshold: number of consecutive failed requests
+                on the current endpoint which trigger re-evaluation.
+            metrics: optional Metrics sink. Defaults to the metrics
+                sink of the attached client.
+        """
+        self.probe_interval = probe_interval
+        self.probe_count = probe_count
+        self.probe_timeout = probe_timeout
+        self.failure_threshold = failure_threshold
+        self.metrics = metrics
+        self.client = None
+        self.endpoints = {}
+        self.factories = {}
+        self.current = None
+        self.latencies = {}
+        self.failures = 0
+        self.selected_at = None
+        self._lock = BoundedSemaphore(1)
+        self._created = []
+        self._selecting = None
+        self._prober = None
+
+    def attach(self, client, endpoints, current, factories=None):
+        """Attach selector to a client.
+
+        attach() doesn't block. Endpoints are created and probed, and
+        the client routed, by a background greenlet.
+
+        Args:
+            client: GCloudfilesClient to route
+            endpoints: dict of {endpoint name: cloudfiles endpoint}
+                where endpoints provide send_request() and rest_client
+                like CloudfilesClient.cloudfiles.
+            current: name of the client's current endpoint
+            factories: optional dict of {endpoint name: callable}
+                returning endpoints which are created in the background
+                before they're first probed, i.e. since creating them
+                requires authentication. Created endpoints are closed
+                by close().
+        Raises:
+            ValueError if the selector is already attached.
+        """
+        if self.client is not None:
+            raise ValueError("endpoint selector is already attached")
+
+        self.client = client
+        self.endpoints = dict(endpoints)
+        self.factories = dict(factories or {})
+        self.current = current
+        if self.metrics is None:
+            self.metrics = getattr(client, "metrics", None)
+        for name, endpoint in self.endpoints.items():
+            self._observe(name, endpoint)
+        self._prober = gevent.spawn(self._probe_periodically)
+
+    def close(self):
+        """Stop periodic and pending re-evaluations.
+
+        Endpoints created from factories are closed, so the selector
+        should be closed along with its client.
+        """
+        for greenlet in (self._prober, self._selecting):
+            if greenlet is not None:
+                greenlet.kill()
+        for endpoint in self._created:
+            rest_client = getattr(endpoint, "rest_client", None)
+            close = getattr(rest_client, "close", None)
+            if close is not None:
+                close()
+        self._created = []
+
+    def probe(self, name):
+        """Return median probe latency of endpoint, or None if it failed."""
+        endpoint = self.endpoints[name]
+        latencies = []
+        for i in range(self.probe_count):
+            start = time.time()
+            try:
+                with gevent.Timeout(self.probe_timeout):
+                    response = endpoint.send_request("HEAD", "/")
+                    response.read()
+            except (Exception, gevent.Timeout):
+                return None
+            if response.status >= 500:
+                return None
+            latencies.append(time.time() - start)
+
+        latency = sorted(latencies)[len(latencies) // 2]
+        if self.metrics is not None:
+            self.metrics.timing("cloudfiles.endpoint.probe.%s" % name, latency)
+        return latency
+
+    def select(self):
+        """Probe all endpoints and route the client to the fastest.
+
+        Endpoints which haven't been created from their factories yet
+        are created first. If every probe fails, the current endpoint
+        is kept. Concurrent calls are serialized.
+
+        Returns:
+            name of the selected endpoint
+        """
+        with self._lock:
+            return self._select()
+
+    def _select(self):
+        self._create_endpoints()
+        names = sorted(self.endpoints)
+        greenlets = [gevent.spawn(self.probe, name) for name in names]
+        gevent.joinall(greenlets)
+        self.latencies = dict((name, greenlet.value)
+                for name, greenlet in zip(names, greenlets))
+
+        healthy = [(latency, name) for name, latency in self.latencies.items()
+                if latency is not None]
+        selected = min(healthy)[1] if healthy else self.current
+
+        if selected != self.current and self.metrics is not None:
+            self.metrics.count("cloudfiles.endpoint.switch")
+        if self.metrics is not None:
+            self.metrics.count("cloudfiles.endpoint.selected.%s" % selected)
+
+        self.current = selected
+        self.failures = 0
+        self.selected_at = time.time()
+        self.client.cloudfiles = self.endpoints[selected]
+        return selected
+
+    def observe(self, name, result=None, error=None):
+        """Observe the outcome of a request to endpoint name.
+
+        Args:
+            name: endpoint name
+            result: optional response
+            error: optional exception raised by the request
+        """
+        if name != self.current:
+            return
+
+        if error is not None:
+            failed = isinstance(error, (socket.error, IOError,
+                httplib.HTTPException, gevent.Timeout))
+        else:
+            failed = getattr(result, "status", 0) >= 500
+
+        if not failed:
+            self.failures = 0
+            return
+
+        self.failures += 1
+        if self.metrics is not None:
+            self.metrics.count("cloudfiles.endpoint.failures")
+        #an evaluation already spawned or in progress will handle the
+        #failures. The lock isn't taken until the spawned greenlet runs.
+        if self.failures >= self.failure_threshold \
+                and (self._selecting is None or self._selecting.ready()) \
+                and not self._lock.locked():
+            self._selecting = gevent.spawn(self.select)
+
+    def _observe(self, name, endpoint):
+        """Observe the outcome of requests to endpoint."""
+        rest_client = getattr(endpoint, "rest_client", None)
+        if hasattr(rest_client, "set_observer"):
+            rest_client.set_observer(functools.partial(self.observe, name))
+
+    def _create_endpoints(self):
+        """Create endpoints from factories, retrying failures later."""
+        for name, factory in self.factories.items():
+            if name in self.endpoints:
+                continue
+            try:
+                endpoint = factory()
+            except Exception:
+                continue
+            self.endpoints[name] = endpoint
+            self._created.append(endpoint)
+            self._observe(name, endpoint)
+
+    def _probe_periodically(self):
+        """Select an endpoint now and every probe_interval seconds."""
+        while True:
+            try:
+                self.select()
+            except Exception:
+                pass
+            if not self.probe_interval:
+                return
+            gevent.sleep(self.probe_interval)
@@ -1 +1,50 @@
 from trrackspace.services.cloudfiles.errors import *
+
+class SegmentedUploadError(Exception):
+    """Segmented (large object) upload failed."""
+    pass
+
+class RangedDownloadError(Exception):
+    """Concurrent ranged download failed."""
+    pass
+
+class EtagMismatch(Exception):
+    """Etag returned by cloudfiles does not match the data sent."""
+    pass
+
+class ObjectChanged(Exception):
+    """Object changed during a resumable transfer."""
+    pass
+
+class ReplicationError(Exception):
+    """Replicated operation failed to reach its quorum.
+
+    Attributes:
+        errors: dict of {region: exception} for failed regions
+        pending: dict of {region: greenlet} for regions which hadn't
+            completed when the quorum became unreachable.
+    """
+    def __init__(self, message, errors=None, pending=None):
+        super(ReplicationError, self).__init__(message)
+        self.errors = errors or {}
+        self.pending = pending or {}
+
+class TempUrlKeyError(Exception):
+    """Account temp url key could not be set.
+
+    Attributes:
+        status: http status of the failed request
+    """
+    def __init__(self, message, status=None):
+        super(TempUrlKeyError, self).__init__(message)
+        self.status = status
+
+class ObjectWriteError(Exception):
+    """Object, segment or manifest PUT was rejected by cloudfiles.
+
+    Attributes:
+        status: http status of the failed request
+    """
+    def __init__(self, message, status=None):
+        super(ObjectWriteError, self).__init__(message)
+        self.status = status
@@ -0,0 +1,93 @@
+import hashlib
+import os
+
+from trrackspace_gevent.services.cloudfiles.errors import EtagMismatch
+
+#Size of reads when rehashing data following a seek.
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def normalize_etag(etag):
+    """Return lower case etag without surrounding quotes."""
+    if etag is None:
+        return None
+    return etag.strip('"').lower()
+
+def slo_etag(segment_etags):
+    """Return the etag cloudfiles computes for a static large object.
+
+    The etag of a static large object manifest is the MD5 of the
+    concatenated etags of its segments.
+
+    Args:
+        segment_etags: list of segment etags in manifest order
+    """
+    return hashlib.md5(
+            "".join(normalize_etag(e) for e in segment_etags)).hexdigest()
+
+def verify_etag(name, expected, actual):
+    """Verify etags match.
+
+    Args:
+        name: object name for the error message
+        expected: locally computed etag
+        actual: etag returned by cloudfiles
+    Raises:
+        EtagMismatch if the etags differ.
+    """
+    if normalize_etag(expected) != normalize_etag(actual):
+        raise EtagMismatch("%s etag mismatch: expected %s, received %s"
+                % (name, expected, actual))
+
+
+class HashingReader(object):
+    """File-like reader computing the MD5 of data as it's read.
+
+    Wrapping a streamed upload source in a HashingReader allows its
+    etag to be verified without buffering or re-reading the data.
+
+    If the source supports seek() and tell(), so does the reader, and
+    the hash is recomputed from the starting position following a
+    seek, i.e. when a request is retried, so it always covers the
+    data as it will be sent.
+    """
+
+    def __init__(self, fileobj):
+        """HashingReader constructor
+
+        Args:
+            fileobj: file-like object to read from
+        """
+        self.fileobj = fileobj
+        self.md5 = hashlib.md5()
+        self.size = 0
+        if hasattr(fileobj, "seek") and hasattr(fileobj, "tell"):
+            try:
+                self.start = fileobj.tell()
+            except (IOError, OSError):
+                #pipes and sockets can't be rewound
+                return
+            self.seek = self._seek
+            self.tell = fileobj.tell
+
+    def read(self, *args, **kwargs):
+        data = self.fileobj.read(*args, **kwargs)
+        self.md5.update(data)
+        self.size += len(data)
+        return data
+
+    def hexdigest(self):
+        """Return MD5 hex digest of the data read so far."""
+        return self.md5.hexdigest()
+
+    def _seek(self, offset, whence=os.SEEK_SET):
+        """Seek source and rehash data from the start to the new position."""
+        self.fileobj.seek(offset, whence)
+        position = self.fileobj.tell()
+        self.fileobj.seek(self.start)
+        self.md5 = hashlib.md5()
+        self.size = 0
+        while self.start + self.size < position:
+            data = self.read(min(HASH_CHUNK_SIZE,
+                position - self.start - self.size))
+            if not data:
+                break
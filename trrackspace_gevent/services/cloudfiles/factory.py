@@ -19,7 +19,13 @@ class GCloudfilesClientFactory(Factory):
             keepalive=True,
             proxy=None,
             rest_client_class=GRestClient,
-            debug_level=0):
+            debug_level=0,
+            pool_size=10,
+            pool_idle_timeout=60,
+            pool_checkout_timeout=None,
+            metadata_cache=None,
+            limiter=None,
+            metrics=None):
         """GCloudfilesClientFactory constructor
 
         Args:
@@ -49,7 +55,8 @@ class GCloudfilesClientFactory(Factory):
             retries: Number of times to try a request with an unexpected
                 error before an exception is raised. Note that a value of 2
                 means to try each api request twice (not 3 times) before
-                raising an exception.
+                raising an exception. Alternatively a RetryPolicy can be
+                given for deadline-aware retries with backoff and jitter.
             keepalive: boolean indicating whether connections to the
                 cloudfiles servers should be maintained between requests.
                 If false, connections will be closed immediately following
@@ -60,6 +67,18 @@ class GCloudfilesClientFactory(Factory):
             debug_level: httplib debug level. Setting this to 1 will log
                 http requests and responses which is very useful for 
                 debugging.
+            pool_size: maximum number of concurrent connections per
+                cloudfiles endpoint. If None, a single rest client
+                is used for each endpoint.
+            pool_idle_timeout: optional number of seconds after which
+                idle pooled connections will be closed.
+            pool_checkout_timeout: optional number of seconds to wait
+                for a pooled connection before PoolTimeout is raised.
+            metadata_cache: optional MetadataCache shared by created
+                clients to cache container and object metadata in.
+            limiter: optional AIMDLimiter shared by created clients to
+                adaptively limit concurrent requests.
+            metrics: optional Metrics sink shared by created clients.
         """
         self.username = username
         self.api_key = api_key
@@ -74,6 +93,12 @@ class GCloudfilesClientFactory(Factory):
         self.proxy = proxy
         self.rest_client_class = rest_client_class
         self.debug_level = debug_level
+        self.pool_size = pool_size
+        self.pool_idle_timeout = pool_idle_timeout
+        self.pool_checkout_timeout = pool_checkout_timeout
+        self.metadata_cache = metadata_cache
+        self.limiter = limiter
+        self.metrics = metrics
         self.username = username
 
     def create(self):
@@ -91,4 +116,10 @@ class GCloudfilesClientFactory(Factory):
                 keepalive=self.keepalive,
                 proxy=self.proxy,
                 rest_client_class=self.rest_client_class,
-                debug_level=self.debug_level)
+                debug_level=self.debug_level,
+                pool_size=self.pool_size,
+                pool_idle_timeout=self.pool_idle_timeout,
+                pool_checkout_timeout=self.pool_checkout_timeout,
+                metadata_cache=self.metadata_cache,
+                limiter=self.limiter,
+                metrics=self.metrics)
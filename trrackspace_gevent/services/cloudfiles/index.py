@@ -0,0 +1,321 @@
+import array
+import binascii
+import bisect
+import json
+import os
+import urllib
+
+from trrackspace_gevent.services.cloudfiles.errors import NoSuchContainer
+from trrackspace_gevent.services.cloudfiles.etag import normalize_etag
+from trrackspace_gevent.services.cloudfiles.listing import ObjectRecord, \
+        MAX_LISTING_LIMIT
+
+#Index file format version
+INDEX_VERSION = 2
+
+#Placeholder for object hashes which aren't MD5 hex digests
+NULL_HASH = "\0" * 16
+
+class NameArray(object):
+    """Append-only array of names in a single contiguous buffer.
+
+    Names are stored UTF-8 encoded back to back in a bytearray, with
+    an array of offsets marking where each name starts, so an index
+    of millions of names costs a few bytes of overhead per name rather
+    than a Python object each. Items are the encoded names, which sort
+    in the same order as cloudfiles listings, so the array can be
+    searched with the bisect module.
+
+    Attributes:
+        data: bytearray of concatenated UTF-8 encoded names
+        offsets: array of len(self) + 1 offsets into data
+    """
+
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array.array("l", [0])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        """Return UTF-8 encoded name at index."""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("name index out of range")
+        return str(self.data[self.offsets[index]:self.offsets[index + 1]])
+
+    def name(self, index):
+        """Return decoded name at index."""
+        return self[index].decode("utf-8")
+
+    def append(self, name):
+        """Append UTF-8 encoded name."""
+        self.data.extend(name)
+        self.offsets.append(len(self.data))
+
+
+class ContainerIndex(object):
+    """Local sorted index of a container listing.
+
+    The index holds a snapshot of the container's object names, sizes
+    and hashes in compact sorted arrays, names in a NameArray, and
+    answers membership, prefix and delimiter queries locally with
+    binary search.
+
+    refresh() compares the container's object count and bytes used
+    to the index to detect drift. Drift is first resolved by listing
+    only the objects after the last indexed name, which is sufficient
+    for append-only containers, and otherwise by a full snapshot.
+    Note that overwrites which don't change an object's size can't
+    be detected from the container totals.
+
+    Indexes can be saved to disk and loaded at startup, then refreshed.
+
+    Example usage:
+        index = container.create_index()
+        "name" in index
+        index.list(prefix="tmp/", delimiter="/")
+        index.save("/var/tmp/container.index")
+        ...
+        index = ContainerIndex.load(container, "/var/tmp/container.index")
+        index.refresh()
+    """
+
+    def __init__(self, container, batch_size=MAX_LISTING_LIMIT):
+        """ContainerIndex constructor
+
+        The index is empty until snapshot() or refresh() is called.
+
+        Args:
+            container: GContainer to index
+            batch_size: number of objects per listing request
+        """
+        self.container = container
+        self.batch_size = batch_size
+        self.names = NameArray()
+        self.sizes = array.array("l")
+        self.hashes = bytearray()
+        self.indexed_bytes = 0
+        self.object_count = 0
+        self.bytes_used = 0
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return self._find(name) is not None
+
+    def __iter__(self):
+        for index in xrange(len(self.names)):
+            yield self.names.name(index)
+
+    def get(self, name):
+        """Return ObjectRecord for object name, or None.
+
+        Only name, bytes and hash are populated.
+        """
+        index = self._find(name)
+        if index is None:
+            return None
+        digest = str(self.hashes[index * 16:(index + 1) * 16])
+        return ObjectRecord(
+                name=name,
+                bytes=self.sizes[index],
+                hash=None if digest == NULL_HASH else binascii.hexlify(digest))
+
+    def prefix(self, prefix):
+        """Generator yielding indexed names starting with prefix."""
+        prefix = _encode(prefix)
+        index = bisect.bisect_left(self.names, prefix)
+        while index < len(self.names) and self.names[index].startswith(prefix):
+            yield self.names.name(index)
+            index += 1
+
+    def list(self, prefix="", delimiter=None, marker=None, limit=None):
+        """Return names as a cloudfiles listing would.
+
+        Args:
+            prefix: optional name prefix
+            delimiter: optional delimiter. Names containing the
+                delimiter after the prefix are rolled up into a single
+                pseudo directory entry ending with the delimiter.
+            marker: optional name to list after
+            limit: optional maximum number of entries
+        Returns:
+            list of names and pseudo directories
+        """
+        prefix = _encode(prefix)
+        delimiter = _encode(delimiter) if delimiter else None
+        marker = _encode(marker) if marker is not None else None
+
+        results = []
+        index = bisect.bisect_left(self.names, prefix)
+        if marker is not None:
+            index = max(index, bisect.bisect_right(self.names, marker))
+
+        while index < len(self.names):
+            if limit is not None and len(results) >= limit:
+                break
+            name = self.names[index]
+            if not name.startswith(prefix):
+                break
+
+            position = name.find(delimiter, len(prefix)) \
+                    if delimiter else -1
+            if position < 0:
+                results.append(name.decode("utf-8"))
+                index += 1
+                continue
+
+            subdir = name[:position + len(delimiter)]
+            if marker is None or subdir > marker:
+                results.append(subdir.decode("utf-8"))
+            #skip every name within the pseudo directory. 0xff never
+            #occurs in UTF-8 so the last byte can always be incremented.
+            index = bisect.bisect_left(self.names,
+                    subdir[:-1] + chr(ord(subdir[-1]) + 1))
+        return results
+
+    def snapshot(self):
+        """Replace the index with a full listing of the container."""
+        object_count, bytes_used = self._totals()
+        index = ContainerIndex(self.container, self.batch_size)
+        for record in self._list():
+            index._append(record)
+
+        self.names = index.names
+        self.sizes = index.sizes
+        self.hashes = index.hashes
+        self.indexed_bytes = index.indexed_bytes
+        self.object_count = object_count
+        self.bytes_used = bytes_used
+
+    def drifted(self):
+        """Return True if the container totals differ from the index."""
+        return self._totals() != (len(self.names), self.indexed_bytes)
+
+    def refresh(self):
+        """Bring the index up to date with the container.
+
+        Returns:
+            True if the index changed, False otherwise.
+        """
+        totals = self._totals()
+        if totals == (len(self.names), self.indexed_bytes):
+            self.object_count, self.bytes_used = totals
+            return False
+
+        marker = self.names.name(-1) if len(self.names) else None
+        for record in self._list(marker=marker):
+            self._append(record)
+
+        if totals != (len(self.names), self.indexed_bytes):
+            self.snapshot()
+        else:
+            self.object_count, self.bytes_used = totals
+        return True
+
+    def save(self, path):
+        """Atomically write the index to disk.
+
+        Args:
+            path: index file path
+        """
+        header = {
+            "version": INDEX_VERSION,
+            "container_name": self.container.name,
+            "count": len(self.names),
+            "names_size": len(self.names.data),
+            "size_itemsize": self.sizes.itemsize,
+            "object_count": self.object_count,
+            "bytes_used": self.bytes_used
+        }
+        temp_path = "%s.tmp" % path
+        with open(temp_path, "wb") as f:
+            f.write(json.dumps(header) + "\n")
+            f.write(str(self.names.data))
+            self.names.offsets.tofile(f)
+            self.sizes.tofile(f)
+            f.write(str(self.hashes))
+        os.rename(temp_path, path)
+
+    @classmethod
+    def load(cls, container, path, batch_size=MAX_LISTING_LIMIT):
+        """Load index from disk.
+
+        Args:
+            container: GContainer the index was created for
+            path: index file path
+            batch_size: number of objects per listing request
+        Returns:
+            ContainerIndex, or None if path doesn't exist, can't be
+            parsed, or is the index of another container.
+        """
+        index = cls(container, batch_size)
+        try:
+            with open(path, "rb") as f:
+                header = json.loads(f.readline())
+                if header["version"] != INDEX_VERSION \
+                        or header["container_name"] != container.name \
+                        or header["size_itemsize"] != index.sizes.itemsize:
+                    return None
+                count = header["count"]
+                index.names.data = bytearray(f.read(header["names_size"]))
+                index.names.offsets = array.array("l")
+                index.names.offsets.fromfile(f, count + 1)
+                index.sizes.fromfile(f, count)
+                index.hashes = bytearray(f.read(count * 16))
+        except (IOError, EOFError, ValueError, KeyError, TypeError):
+            return None
+
+        index.indexed_bytes = sum(index.sizes)
+
+        if len(index.names) != count or len(index.hashes) != count * 16 \
+                or index.names.offsets[-1] != len(index.names.data):
+            return None
+        index.object_count = header["object_count"]
+        index.bytes_used = header["bytes_used"]
+        return index
+
+    def _find(self, name):
+        name = _encode(name)
+        index = bisect.bisect_left(self.names, name)
+        if index < len(self.names) and self.names[index] == name:
+            return index
+        return None
+
+    def _list(self, marker=None):
+        return self.container.stream_objects(
+                batch_size=self.batch_size, marker=marker)
+
+    def _append(self, record):
+        """Append listing record, which must sort after indexed names."""
+        self.names.append(_encode(record.name))
+        self.sizes.append(record.bytes or 0)
+        self.indexed_bytes += record.bytes or 0
+        try:
+            digest = binascii.unhexlify(normalize_etag(record.hash) or "")
+        except (TypeError, ValueError):
+            digest = ""
+        self.hashes.extend(digest if len(digest) == 16 else NULL_HASH)
+
+    def _totals(self):
+        """Return (object count, bytes used) from the container headers."""
+        response = self.container.client._send_request(
+                "HEAD", "/%s" % urllib.quote(self.container.name))
+        response.read()
+        if response.status == 404:
+            raise NoSuchContainer(self.container.name)
+        elif response.status >= 300:
+            raise RuntimeError("container status %d" % response.status)
+        return (int(response.getheader("x-container-object-count", 0)),
+                int(response.getheader("x-container-bytes-used", 0)))
+
+
+def _encode(name):
+    """Return UTF-8 encoded name."""
+    if isinstance(name, unicode):
+        return name.encode("utf-8")
+    return name
@@ -0,0 +1,588 @@
+import json
+import urllib
+
+import gevent
+from gevent.pool import Pool
+from gevent.queue import Queue
+
+from trrackspace_gevent.services.cloudfiles.errors import NoSuchContainer
+
+#Maximum number of objects cloudfiles returns in a single listing.
+MAX_LISTING_LIMIT = 10000
+
+DEFAULT_LISTING_BATCH_SIZE = 1000
+DEFAULT_LISTING_PREFETCH = 1
+DEFAULT_LISTING_SHARDS = 16
+DEFAULT_LISTING_CONCURRENCY = 8
+
+#Number of bytes of listing response read at a time when streaming
+DEFAULT_LISTING_READ_SIZE = 64 * 1024
+
+#Greatest unicode code point, appended to markers preceding a name
+MAX_CODE_POINT = 0x10ffff
+
+#Range of UTF-16 surrogate code points, which can't be encoded in names
+SURROGATES = (0xd800, 0xdfff)
+
+def listing_marker(obj):
+    """Return listing marker for object listing entry.
+
+    Delimiter listings return {"subdir": ...} entries for
+    pseudo directories in place of objects.
+    """
+    return obj.get("name") or obj.get("subdir")
+
+def marker_before(name):
+    """Return exclusive listing marker which includes name.
+
+    Listing markers are exclusive, so to list from name inclusively
+    the marker is name with its last code point decremented and the
+    greatest code point appended. Only names beginning with the marker
+    followed by further characters, which would require names
+    containing U+10FFFF, sort between the marker and name.
+
+    Args:
+        name: utf-8 or unicode object name
+    Returns:
+        unicode marker, which sorts before name in utf-8 byte order.
+    """
+    if isinstance(name, str):
+        name = name.decode("utf-8")
+    head, code_point = name[:-1], ord(name[-1])
+    #combine surrogate pairs of narrow python builds
+    if 0xdc00 <= code_point <= SURROGATES[1] and head \
+            and SURROGATES[0] <= ord(head[-1]) < 0xdc00:
+        code_point = 0x10000 + ((ord(head[-1]) - SURROGATES[0]) << 10) \
+                + (code_point - 0xdc00)
+        head = head[:-1]
+
+    if code_point == 0:
+        return head
+    code_point -= 1
+    if SURROGATES[0] <= code_point <= SURROGATES[1]:
+        code_point = SURROGATES[0] - 1
+    return head + _unichr(code_point) + _unichr(MAX_CODE_POINT)
+
+def _unichr(code_point):
+    """Return unicode character for code_point, including on narrow builds."""
+    return ("\\U%08x" % code_point).decode("unicode-escape")
+
+def iter_json_array(stream, decoder=None, read_size=DEFAULT_LISTING_READ_SIZE):
+    """Generator yielding the elements of a JSON array as they're read.
+
+    Only read_size bytes plus the element being decoded are buffered,
+    so the first elements are yielded before the rest of the array
+    has been received.
+
+    Args:
+        stream: file-like object to read the JSON array from
+        decoder: optional json.JSONDecoder for elements
+        read_size: number of bytes to read at a time
+    """
+    decoder = decoder or json.JSONDecoder()
+    buffer = ""
+    index = 0
+    eof = False
+    while True:
+        while index < len(buffer) and buffer[index] in "[, \t\r\n":
+            index += 1
+
+        if index < len(buffer):
+            if buffer[index] == "]":
+                return
+            try:
+                value, index = decoder.raw_decode(buffer, index)
+                yield value
+                continue
+            except ValueError:
+                #incomplete element, unless the stream is exhausted
+                if eof:
+                    raise
+        elif eof:
+            return
+
+        data = stream.read(read_size)
+        eof = not data
+        buffer = buffer[index:] + data
+        index = 0
+
+
+class ObjectRecord(object):
+    """Compact object listing entry.
+
+    ObjectRecord supports the read-only dict access of the listing
+    dicts it replaces, i.e. record["name"] and record.get("hash"),
+    and as_dict() returns an equivalent dict.
+    """
+
+    __slots__ = ("name", "bytes", "hash", "last_modified", "content_type")
+
+    def __init__(self, name, bytes=0, hash=None, last_modified=None,
+            content_type=None):
+        self.name = name
+        self.bytes = bytes
+        self.hash = hash
+        self.last_modified = last_modified
+        self.content_type = content_type
+
+    def get(self, key, default=None):
+        if key in self.__slots__:
+            return getattr(self, key)
+        return default
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def __eq__(self, other):
+        return isinstance(other, ObjectRecord) \
+                and self.as_dict() == other.as_dict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "ObjectRecord(%r)" % self.name
+
+    def as_dict(self):
+        return dict((key, getattr(self, key)) for key in self.__slots__)
+
+
+class SubdirRecord(object):
+    """Compact delimiter listing entry for a pseudo directory."""
+
+    __slots__ = ("subdir",)
+
+    def __init__(self, subdir):
+        self.subdir = subdir
+
+    def get(self, key, default=None):
+        return self.subdir if key == "subdir" else default
+
+    def __getitem__(self, key):
+        if key != "subdir":
+            raise KeyError(key)
+        return self.subdir
+
+    def __contains__(self, key):
+        return key == "subdir"
+
+    def __eq__(self, other):
+        return isinstance(other, SubdirRecord) and self.subdir == other.subdir
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "SubdirRecord(%r)" % self.subdir
+
+    def as_dict(self):
+        return {"subdir": self.subdir}
+
+
+def listing_record(entry):
+    """Return ObjectRecord or SubdirRecord for a listing entry dict."""
+    if "subdir" in entry:
+        return SubdirRecord(entry["subdir"])
+    return ObjectRecord(
+            name=entry.get("name"),
+            bytes=entry.get("bytes", 0),
+            hash=entry.get("hash"),
+            last_modified=entry.get("last_modified"),
+            content_type=entry.get("content_type"))
+
+
+class PrefetchingLister(object):
+    """Container listing with read-ahead.
+
+    Listing pages are fetched by a background greenlet, so page N+1
+    is requested while the caller processes page N. Up to prefetch
+    pages are buffered ahead of the caller. Closing the generators
+    early kills the background greenlet.
+    """
+
+    def __init__(self,
+            container,
+            batch_size=DEFAULT_LISTING_BATCH_SIZE,
+            prefetch=DEFAULT_LISTING_PREFETCH,
+            **kwargs):
+        """PrefetchingLister constructor
+
+        Args:
+            container: GContainer to list
+            batch_size: number of objects per listing request
+            prefetch: maximum number of pages to buffer ahead
+            Remaining arguments, i.e. prefix and delimiter,
+            are passed to Container.list_objects().
+        """
+        if batch_size < 1 or batch_size > MAX_LISTING_LIMIT:
+            raise ValueError("batch_size must be between 1 and %d"
+                    % MAX_LISTING_LIMIT)
+        if prefetch < 1:
+            raise ValueError("prefetch must be at least 1")
+
+        self.container = container
+        self.batch_size = batch_size
+        self.prefetch = prefetch
+        self.kwargs = kwargs
+
+    def pages(self):
+        """Generator yielding listing pages (lists of dicts)."""
+        queue = Queue(maxsize=self.prefetch)
+        producer = gevent.spawn(self._produce, queue)
+        try:
+            for page in queue:
+                yield page
+            producer.get()
+        finally:
+            producer.kill()
+
+    def objects(self):
+        """Generator yielding listing entries (dicts)."""
+        for page in self.pages():
+            for obj in page:
+                yield obj
+
+    def _produce(self, queue):
+        """Put listing pages on queue followed by StopIteration.
+
+        StopIteration is also put if listing fails so the consumer
+        will stop and raise the error. It's not put if the producer is
+        killed, since the queue may be full with no consumer left.
+        """
+        try:
+            marker = None
+            while True:
+                page = self.container.list_objects(
+                        limit=self.batch_size,
+                        marker=marker,
+                        **self.kwargs)
+                if page:
+                    queue.put(page)
+                if len(page) < self.batch_size:
+                    break
+                marker = listing_marker(page[-1])
+        except Exception:
+            queue.put(StopIteration)
+            raise
+        queue.put(StopIteration)
+
+
+class StreamingLister(object):
+    """Container listing parsed incrementally from the response body.
+
+    Each listing page is decoded entry by entry as it's received,
+    and entries are yielded as compact ObjectRecord and SubdirRecord
+    objects, so neither the page's dicts nor its full body are held
+    in memory and the first entry is available before the page has
+    been received. Pass as_dict=True to yield dicts instead.
+    """
+
+    def __init__(self,
+            container,
+            batch_size=MAX_LISTING_LIMIT,
+            as_dict=False,
+            read_size=DEFAULT_LISTING_READ_SIZE,
+            **kwargs):
+        """StreamingLister constructor
+
+        Args:
+            container: GContainer to list
+            batch_size: number of objects per listing request
+            as_dict: boolean indicating entries should be yielded
+                as dicts rather than records.
+            read_size: number of bytes of response to read at a time
+            Remaining arguments, i.e. prefix, delimiter, marker and
+            end_marker, are passed as listing query parameters.
+        """
+        if batch_size < 1 or batch_size > MAX_LISTING_LIMIT:
+            raise ValueError("batch_size must be between 1 and %d"
+                    % MAX_LISTING_LIMIT)
+
+        self.container = container
+        self.batch_size = batch_size
+        self.read_size = read_size
+        self.kwargs = kwargs
+        self.decoder = json.JSONDecoder(
+                object_hook=None if as_dict else listing_record)
+
+    def objects(self):
+        """Generator yielding listing entries."""
+        marker = self.kwargs.get("marker")
+        while True:
+            count = 0
+            last = None
+            for entry in self._page(marker):
+                count += 1
+                last = entry
+                yield entry
+            if count < self.batch_size:
+                break
+            marker = listing_marker(last)
+
+    def _page(self, marker):
+        """Generator yielding the entries of a single listing page."""
+        params = dict((key, value) for key, value in self.kwargs.items()
+                if value is not None)
+        params.update({"format": "json", "limit": self.batch_size})
+        if marker is not None:
+            params["marker"] = marker
+
+        response = self.container.client._send_request(
+                "GET",
+                "/%s" % urllib.quote(self.container.name),
+                params=params)
+        if response.status == 404:
+            response.read()
+            raise NoSuchContainer(self.container.name)
+        elif response.status >= 300:
+            response.read()
+            raise RuntimeError("listing status %d" % response.status)
+
+        complete = False
+        try:
+            if response.status != 204:
+                for entry in iter_json_array(
+                        response, self.decoder, self.read_size):
+                    yield entry
+            response.read()
+            complete = True
+        finally:
+            if not complete:
+                response.close()
+
+
+class ShardedLister(object):
+    """Parallel container listing over disjoint ranges of the keyspace.
+
+    The keyspace is split into ranges of names [start, end), each
+    listed with marker/end_marker by its own greenlet, so very large
+    containers are listed with concurrent marker chains instead of a
+    single sequential one.
+
+    Ranges are defined by explicit boundaries, or by evenly spaced
+    alphanumeric boundaries following the prefix. Alternatively, if
+    a delimiter is given, the pseudo directories of a delimiter
+    listing are each listed by their own greenlet.
+
+    Since ranges are disjoint and sorted, ordered output is produced
+    by draining each range in turn while later ranges are listed
+    ahead, up to prefetch pages each. Unordered output yields pages
+    from all ranges as they arrive.
+    """
+
+    #Characters evenly spaced shard boundaries are chosen from
+    BOUNDARY_CHARACTERS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+    def __init__(self,
+            container,
+            boundaries=None,
+            shards=DEFAULT_LISTING_SHARDS,
+            delimiter=None,
+            concurrency=DEFAULT_LISTING_CONCURRENCY,
+            ordered=True,
+            prefix=None,
+            batch_size=MAX_LISTING_LIMIT,
+            prefetch=DEFAULT_LISTING_PREFETCH,
+            as_dict=False):
+        """ShardedLister constructor
+
+        Args:
+            container: GContainer to list
+            boundaries: optional list of names to split the keyspace
+                at. Each boundary starts a new range. Boundaries are
+                sorted and duplicates are removed.
+            shards: number of ranges to split the keyspace into if
+                boundaries and delimiter aren't given.
+            delimiter: optional delimiter to discover ranges with.
+                Each pseudo directory of the delimiter listing is
+                listed as a range.
+            concurrency: maximum number of ranges listed concurrently
+            ordered: boolean indicating entries should be yielded in
+                name order. Otherwise they're yielded as they arrive.
+            prefix: optional prefix of names to list
+            batch_size: number of objects per listing request
+            prefetch: maximum number of pages buffered per range
+            as_dict: boolean indicating entries should be yielded
+                as dicts rather than records.
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+
+        self.container = container
+        self.boundaries = boundaries
+        self.shards = shards
+        self.delimiter = delimiter
+        self.concurrency = concurrency
+        self.ordered = ordered
+        self.prefix = prefix or ""
+        self.batch_size = batch_size
+        self.prefetch = prefetch
+        self.as_dict = as_dict
+
+    def ranges(self):
+        """Return list of (start, end) name ranges to list.
+
+        start is inclusive and end is exclusive, and None
+        indicates the range is unbounded.
+        """
+        boundaries = self.boundaries
+        if boundaries is None:
+            characters = self.BOUNDARY_CHARACTERS
+            step = float(len(characters)) / max(self.shards, 1)
+            boundaries = (self.prefix + characters[int(i * step)]
+                for i in range(1, max(self.shards, 1)))
+        #empty boundaries would start the keyspace a second time
+        boundaries = sorted(set(b for b in boundaries if b))
+
+        starts = [None] + list(boundaries)
+        ends = list(boundaries) + [None]
+        return zip(starts, ends)
+
+    def objects(self):
+        """Generator yielding listing entries."""
+        pool = Pool(self.concurrency)
+        producers = []
+        if self.ordered:
+            queue = Queue(maxsize=self.concurrency)
+        else:
+            queue = Queue(maxsize=self.prefetch * self.concurrency)
+        spawner = gevent.spawn(self._spawn, pool, queue, producers)
+
+        try:
+            if self.ordered:
+                entries = self._ordered(queue)
+            else:
+                entries = self._unordered(queue, producers)
+            for entry in entries:
+                yield entry
+            spawner.get()
+        finally:
+            spawner.kill()
+            pool.kill()
+
+    def _spawn(self, pool, queue, producers):
+        """Spawn a producer greenlet for each range.
+
+        For ordered listings, (entries, range_queue, producer) items
+        are put on queue in name order, where entries are yielded
+        directly and range_queue receives the pages of a range.
+        For unordered listings, producers put pages directly on queue.
+
+        StopIteration is put once all ranges have been spawned, or
+        if spawning fails.
+        """
+        try:
+            for entries, start, end, prefix in self._discover():
+                if entries and self.ordered:
+                    queue.put((entries, None, None))
+                elif entries:
+                    queue.put(entries)
+                if start is None and end is None and prefix is None:
+                    continue
+
+                range_queue = Queue(maxsize=self.prefetch) \
+                        if self.ordered else queue
+                producer = pool.spawn(self._produce,
+                        range_queue, start, end, prefix)
+                producers.append(producer)
+                if self.ordered:
+                    queue.put(([], range_queue, producer))
+        except Exception:
+            queue.put(StopIteration)
+            raise
+        queue.put(StopIteration)
+
+    def _discover(self):
+        """Generator yielding (entries, start, end, prefix) tuples.
+
+        entries are listing entries to yield ahead of the range with
+        the given start, end and prefix, which are all None if there
+        is no range to list.
+        """
+        if not self.delimiter:
+            for start, end in self.ranges():
+                yield [], start, end, self.prefix
+            return
+
+        lister = StreamingLister(
+                container=self.container,
+                batch_size=self.batch_size,
+                as_dict=self.as_dict,
+                prefix=self.prefix or None,
+                delimiter=self.delimiter)
+        entries = []
+        for entry in lister.objects():
+            if "subdir" in entry:
+                yield entries, None, None, entry["subdir"]
+                entries = []
+            else:
+                entries.append(entry)
+                if len(entries) >= self.batch_size:
+                    yield entries, None, None, None
+                    entries = []
+        yield entries, None, None, None
+
+    def _ordered(self, queue):
+        """Generator yielding entries from ranges in name order."""
+        for entries, range_queue, producer in queue:
+            for entry in entries:
+                yield entry
+            if range_queue is not None:
+                for page in range_queue:
+                    for entry in page:
+                        yield entry
+                producer.get()
+
+    def _unordered(self, queue, producers):
+        """Generator yielding entries from ranges as they arrive.
+
+        Each producer, and the spawner, put a single StopIteration,
+        so the listing is complete once the spawner's and every
+        spawned producer's StopIteration have been received.
+        """
+        stops = 0
+        while stops < len(producers) + 1:
+            page = queue.get()
+            if page is StopIteration:
+                stops += 1
+                for producer in producers:
+                    if producer.ready() and not producer.successful():
+                        producer.get()
+            else:
+                for entry in page:
+                    yield entry
+        for producer in producers:
+            producer.get()
+
+    def _produce(self, queue, start, end, prefix):
+        """Put pages of a range on queue followed by StopIteration."""
+        try:
+            page = []
+            for entry in self._list_range(start, end, prefix):
+                page.append(entry)
+                if len(page) >= self.batch_size:
+                    queue.put(page)
+                    page = []
+            if page:
+                queue.put(page)
+        except Exception:
+            queue.put(StopIteration)
+            raise
+        queue.put(StopIteration)
+
+    def _list_range(self, start, end, prefix):
+        """Generator yielding entries of a single range."""
+        lister = StreamingLister(
+                container=self.container,
+                batch_size=self.batch_size,
+                as_dict=self.as_dict,
+                prefix=prefix or None,
+                marker=marker_before(start) if start is not None else None,
+                end_marker=end)
+        for entry in lister.objects():
+            yield entry
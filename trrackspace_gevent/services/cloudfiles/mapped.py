@@ -0,0 +1,154 @@
+import mmap
+import os
+import stat
+from contextlib import contextmanager
+
+#Size of the slices yielded by iterating over a MappedReader.
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+class MappedBuffer(object):
+    """Zero-copy view of a memory mapped file or buffer.
+
+    Slicing a MappedBuffer, or reading from its reader(), returns views
+    of the underlying memory rather than string copies, so data can be
+    passed to socket.sendall() without per-chunk copies in Python.
+    """
+
+    def __init__(self, data, offset=0, size=None, mtime=None):
+        """MappedBuffer constructor
+
+        Args:
+            data: object supporting the buffer protocol, i.e. an mmap,
+                memoryview or string.
+            offset: offset of the view into data
+            size: optional size of the view. Defaults to the
+                remainder of data.
+            mtime: optional modification time of the mapped file
+        """
+        self.data = data
+        self.offset = offset
+        self.mtime = mtime
+        if size is None:
+            size = len(data) - offset
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def view(self, offset=0, size=None):
+        """Return zero-copy view of the buffer.
+
+        Args:
+            offset: offset relative to this buffer
+            size: optional size. Defaults to the remainder of the buffer.
+        Returns:
+            memoryview, or buffer for objects which only support the
+            old buffer protocol (i.e. mmap).
+        """
+        if size is None:
+            size = self.size - offset
+        start = self.offset + offset
+        try:
+            return memoryview(self.data)[start:start + size]
+        except TypeError:
+            return buffer(self.data, start, size)
+
+    def slice(self, offset, size):
+        """Return MappedBuffer for a range of this buffer."""
+        size = max(0, min(size, self.size - offset))
+        return MappedBuffer(self.data, self.offset + offset, size)
+
+    def reader(self, block_size=DEFAULT_BLOCK_SIZE):
+        """Return file-like MappedReader for the buffer."""
+        return MappedReader(self, block_size)
+
+
+class MappedReader(object):
+    """File-like reader returning zero-copy views of a MappedBuffer.
+
+    read(size) returns at most size bytes, as with files. Iterating
+    over the reader yields block_size views, so senders which iterate
+    over the body issue fewer, larger sendall() calls.
+    """
+
+    def __init__(self, mapped_buffer, block_size=DEFAULT_BLOCK_SIZE):
+        self.mapped_buffer = mapped_buffer
+        self.block_size = block_size
+        self.position = 0
+
+    def __len__(self):
+        return len(self.mapped_buffer)
+
+    def __iter__(self):
+        return iter(lambda: self.read(self.block_size), "")
+
+    def read(self, size=-1):
+        remaining = len(self.mapped_buffer) - self.position
+        size = remaining if size is None or size < 0 \
+                else min(remaining, size)
+        if size <= 0:
+            return ""
+        view = self.mapped_buffer.view(self.position, size)
+        self.position += size
+        return view
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += len(self.mapped_buffer)
+        self.position = offset
+
+
+def mappable(source):
+    """Return True if source can be passed to mapped().
+
+    File descriptors and file objects must refer to regular files,
+    since pipes, sockets and devices can't be memory mapped and don't
+    report their size.
+    """
+    if isinstance(source, (int, long)) or hasattr(source, "fileno"):
+        fd = source if isinstance(source, (int, long)) else source.fileno()
+        return stat.S_ISREG(os.fstat(fd).st_mode)
+    return True
+
+@contextmanager
+def mapped(source):
+    """Context manager returning a MappedBuffer for source.
+
+    Files are memory mapped read-only in their entirety, regardless
+    of the current file position, for the duration of the context.
+
+    Args:
+        source: file path, file descriptor, file object with fileno(),
+            or an object supporting the buffer protocol, i.e. an mmap
+            or memoryview.
+    Raises:
+        ValueError if source is a file descriptor or file object
+        which isn't a regular file (see mappable()).
+    """
+    if isinstance(source, MappedBuffer):
+        yield source
+    elif isinstance(source, basestring):
+        with open(source, "rb") as f:
+            with mapped(f.fileno()) as result:
+                yield result
+    elif isinstance(source, (int, long)) or hasattr(source, "fileno"):
+        fd = source if isinstance(source, (int, long)) else source.fileno()
+        if not mappable(fd):
+            raise ValueError("only regular files can be memory mapped")
+        stat_result = os.fstat(fd)
+        size = stat_result.st_size
+        if size == 0:
+            yield MappedBuffer("", mtime=stat_result.st_mtime)
+        else:
+            mapping = mmap.mmap(fd, size, access=mmap.ACCESS_READ)
+            try:
+                yield MappedBuffer(mapping, mtime=stat_result.st_mtime)
+            finally:
+                mapping.close()
+    else:
+        yield MappedBuffer(source)
@@ -0,0 +1,320 @@
+import functools
+import httplib
+import socket
+import time
+
+import gevent
+
+from trrackspace_gevent.services.cloudfiles.client import GCloudfilesClient
+from trrackspace_gevent.services.cloudfiles.errors import ReplicationError
+from trrackspace_gevent.services.identity.client import GIdentityServiceClient
+
+#Weight of the latest sample in region latency estimates
+LATENCY_SMOOTHING = 0.3
+
+#Seconds added to a region's latency estimate when a request fails
+#to connect or times out
+FAILURE_PENALTY = 1.0
+
+#Errors indicating a region is unreachable or slow, as opposed to
+#errors such as NoSuchObject which may be caused by replication lag
+CONNECTION_ERRORS = (socket.error, httplib.HTTPException, gevent.Timeout)
+
+class ReplicatedResult(object):
+    """Result of a replicated operation.
+
+    Attributes:
+        results: dict of {region: result} for regions which succeeded
+        errors: dict of {region: exception} for regions which failed
+        pending: dict of {region: greenlet} for regions which hadn't
+            completed when the quorum was reached.
+    """
+    def __init__(self):
+        self.results = {}
+        self.errors = {}
+        self.pending = {}
+
+
+class GReplicatedCloudfilesClient(object):
+    """Cloudfiles client replicating objects across regions.
+
+    Writes and deletes are sent to every region concurrently and
+    return once write_quorum regions have succeeded, while the
+    remaining regions complete in the background. Reads are served
+    by the region with the lowest measured latency, falling back to
+    the next nearest region on error, i.e. if an object hasn't been
+    replicated to the nearest region yet.
+
+    Latency estimates are updated by measure() and by requests without
+    a body, so transfer time doesn't count against a region. Requests
+    which fail to connect or time out add FAILURE_PENALTY to the
+    region's estimate, while other errors leave it unchanged.
+
+    All regions share a single identity client, so authentication
+    and the service catalog lookup are performed once.
+
+    Example usage:
+        client = GReplicatedCloudfilesClient(
+                regions=["DFW", "ORD"],
+                username="user",
+                api_key="...")
+        client.write("container", "name", "data")
+        data = client.read("container", "name")
+    """
+
+    def __init__(self,
+            regions,
+            username=None,
+            api_key=None,
+            password=None,
+            identity_client=None,
+            write_quorum=None,
+            client_class=GCloudfilesClient,
+            **kwargs):
+        """GReplicatedCloudfilesClient constructor
+
+        Args:
+            regions: list of datacenter regions, i.e. ["DFW", "ORD"]
+            username: Username to use for authentication with the Rackspace
+                Identity Service. This argument is not required if 
+                an identity_client argument is used.
+            api_key: Api key to use for authentication with the Rackspace
+                Identity Service. This argument is not required if a
+                password or identity_client argument is used.
+            password: Password to use for authentication with the Rackspace
+                Identity Service. This argument is not required if an
+                api_key or identity_client argument is used.
+            identity_client: optional IdentityServiceClient shared by
+                all regions.
+            write_quorum: number of regions which must succeed before
+                writes and deletes return. Defaults to a majority.
+            client_class: cloudfiles client class for each region
+            Remaining arguments, i.e. servicenet, timeout and pool_size,
+            are passed to client_class for each region.
+        """
+        if not regions:
+            raise ValueError("at least one region is required")
+        if write_quorum is None:
+            write_quorum = len(regions) // 2 + 1
+        if write_quorum < 1 or write_quorum > len(regions):
+            raise ValueError("write_quorum must be between 1 and %d"
+                    % len(regions))
+
+        if identity_client is None:
+            identity_client = GIdentityServiceClient(
+                    username=username,
+                    api_key=api_key,
+                    password=password,
+                    timeout=kwargs.get("timeout", 10))
+
+        self.regions = list(regions)
+        self.write_quorum = write_quorum
+        self.identity_client = identity_client
+        self.clients = dict((region, client_class(
+            region=region,
+            identity_client=identity_client,
+            **kwargs)) for region in self.regions)
+        self.latencies = dict((region, None) for region in self.regions)
+
+    def nearest(self):
+        """Return regions ordered by measured latency.
+
+        Regions which haven't been measured yet are ordered first,
+        in the order they were given, so they get measured.
+        """
+        return sorted(self.regions, key=lambda region: (
+            self.latencies[region] is not None,
+            self.latencies[region]))
+
+    def measure(self):
+        """Measure the latency of every region concurrently.
+
+        Returns:
+            dict of {region: latency estimate in seconds}
+        """
+        greenlets = [gevent.spawn(self._call, region,
+            lambda client: client._send_request("HEAD", "/").read(),
+            timed=True) for region in self.regions]
+        gevent.joinall(greenlets)
+        return dict(self.latencies)
+
+    def create_container(self, container_name, *args, **kwargs):
+        """Create container in every region.
+
+        Returns:
+            ReplicatedResult with GContainer results
+        Raises:
+            ReplicationError if write_quorum regions don't succeed.
+        """
+        return self._replicate(lambda client:
+                client.create_container(container_name, *args, **kwargs),
+                timed=True)
+
+    def write(self, container_name, object_name, data, **kwargs):
+        """Write object data to every region.
+
+        Args:
+            container_name: container name
+            object_name: object name
+            data: string data, which is sent to every region. File-like
+                data can only be read once, so files should be written
+                with write_file().
+            Remaining arguments are passed to GStorageObject.write().
+        Returns:
+            ReplicatedResult
+        Raises:
+            ValueError if data is file-like.
+            ReplicationError if write_quorum regions don't succeed.
+        """
+        if hasattr(data, "read"):
+            raise ValueError("data must be a string, use write_file() "
+                    "for files")
+        return self._replicate(lambda client: client.get_container(
+            container_name).create_object(object_name).write(data, **kwargs))
+
+    def write_file(self, container_name, object_name, path, **kwargs):
+        """Write file to every region.
+
+        Args:
+            container_name: container name
+            object_name: object name
+            path: path of the file, which is read by each region
+            Remaining arguments are passed to GStorageObject.write_file().
+            If journal_path is given, each region journals its upload
+            to '<journal_path>.<region>'.
+        Returns:
+            ReplicatedResult
+        Raises:
+            ReplicationError if write_quorum regions don't succeed.
+        """
+        journal_path = kwargs.pop("journal_path", None)
+        def write_file(client, **arguments):
+            arguments.update(kwargs)
+            return client.get_container(container_name).create_object(
+                    object_name).write_file(path, **arguments)
+
+        operations = {}
+        for region in self.regions:
+            arguments = {}
+            if journal_path is not None:
+                arguments["journal_path"] = "%s.%s" % (journal_path, region)
+            operations[region] = functools.partial(write_file, **arguments)
+        return self._replicate(operations)
+
+    def delete(self, container_name, object_name):
+        """Delete object from every region.
+
+        Returns:
+            ReplicatedResult
+        Raises:
+            ReplicationError if write_quorum regions don't succeed.
+        """
+        return self._replicate(lambda client: client.get_container(
+            container_name).delete_object(object_name), timed=True)
+
+    def get_object(self, container_name, object_name):
+        """Get object from the nearest region which has it.
+
+        Returns:
+            GStorageObject object
+        Raises:
+            the last region's error if no region succeeds.
+        """
+        return self._nearest(lambda client: client.get_container(
+            container_name).get_object(object_name), timed=True)
+
+    def read(self, container_name, object_name, **kwargs):
+        """Read object data from the nearest region which has it.
+
+        Args:
+            container_name: container name
+            object_name: object name
+            Remaining arguments are passed to GStorageObject.read().
+        Returns:
+            object data
+        Raises:
+            the last region's error if no region succeeds.
+        """
+        return self._nearest(lambda client: client.get_container(
+            container_name).get_object(object_name).read(**kwargs))
+
+    def _replicate(self, operation, timed=False):
+        """Run operation in every region and wait for the write quorum.
+
+        Args:
+            operation: callable invoked with each region's client, or
+                dict of {region: callable} for per-region operations.
+            timed: boolean indicating the operation's duration should
+                update region latency estimates.
+        Returns:
+            ReplicatedResult
+        Raises:
+            ReplicationError if write_quorum regions can't succeed. The
+            regions still running are included in its pending dict.
+        """
+        if isinstance(operation, dict):
+            operations = operation
+        else:
+            operations = dict((region, operation) for region in self.regions)
+
+        result = ReplicatedResult()
+        greenlets = dict((gevent.spawn(self._call, region,
+            operations[region], timed), region) for region in self.regions)
+
+        for greenlet in gevent.iwait(list(greenlets)):
+            region = greenlets[greenlet]
+            if greenlet.successful():
+                result.results[region] = greenlet.value
+            else:
+                result.errors[region] = greenlet.exception
+
+            if len(result.results) >= self.write_quorum:
+                break
+            if len(self.regions) - len(result.errors) < self.write_quorum:
+                raise ReplicationError("%d of %d regions failed" % (
+                    len(result.errors), len(self.regions)),
+                    result.errors, self._pending(greenlets))
+
+        result.pending = self._pending(greenlets)
+        return result
+
+    def _pending(self, greenlets):
+        """Return dict of {region: greenlet} for greenlets still running."""
+        return dict((region, greenlet)
+                for greenlet, region in greenlets.items()
+                if not greenlet.ready())
+
+    def _nearest(self, operation, timed=False):
+        """Run operation in the nearest region, falling back on error."""
+        for region in self.nearest():
+            try:
+                return self._call(region, operation, timed)
+            except Exception as error:
+                last_error = error
+        raise last_error
+
+    def _call(self, region, operation, timed=False):
+        """Run operation with region's client, updating its latency.
+
+        The latency estimate is updated with the operation's duration
+        if timed is True, and penalized if it fails to connect or
+        times out.
+        """
+        start = time.time()
+        try:
+            result = operation(self.clients[region])
+        except CONNECTION_ERRORS:
+            self._record(region,
+                    (self.latencies[region] or 0) + FAILURE_PENALTY)
+            raise
+        if timed:
+            self._record(region, time.time() - start)
+        return result
+
+    def _record(self, region, latency):
+        previous = self.latencies[region]
+        if previous is None:
+            self.latencies[region] = latency
+        else:
+            self.latencies[region] = previous + \
+                    LATENCY_SMOOTHING * (latency - previous)
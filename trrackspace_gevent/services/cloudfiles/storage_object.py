@@ -1 +1,412 @@
+import os
+import time
+import urllib
+
 from trrackspace.services.cloudfiles.storage_object import *
+from trrackspace.services.cloudfiles.storage_object import StorageObject
+from trrackspace_gevent.services.cloudfiles.errors import ObjectWriteError
+from trrackspace_gevent.services.cloudfiles.etag import HashingReader, \
+        verify_etag
+from trrackspace_gevent.services.cloudfiles.download import RangedDownload, \
+        ResumableDownload, DEFAULT_RANGE_SIZE, DEFAULT_RANGE_CONCURRENCY
+from trrackspace_gevent.services.cloudfiles.mapped import mapped, mappable, \
+        DEFAULT_BLOCK_SIZE
+from trrackspace_gevent.services.cloudfiles.upload import SegmentedUpload, \
+        DEFAULT_SEGMENT_CONCURRENCY
+
+class GStorageObject(StorageObject):
+    """GEvent Rackspace Cloudfiles storage object.
+
+    GStorageObject extends StorageObject with concurrent
+    segmented uploads, zero-copy file uploads and concurrent
+    ranged downloads.
+    """
+
+    @property
+    def path(self):
+        """Url quoted object path relative to the storage endpoint."""
+        return "/%s/%s" % (
+                urllib.quote(self.container.name),
+                urllib.quote(self.name))
+
+    def temp_url(self, method, seconds):
+        """Return temp url for this object.
+
+        The url is signed locally with the client's cached account
+        temp url key, so no network requests are made once the key
+        has been fetched.
+
+        Args:
+            method: http method the url is valid for, i.e. GET
+            seconds: number of seconds the url is valid for
+        Returns:
+            signed temp url
+        """
+        signer = self.container.client.temp_url_signer()
+        return signer.sign(self.path, method, time.time() + seconds)
+
+    def read(self, size=None, offset=0, output=None,
+            concurrency=None, range_size=DEFAULT_RANGE_SIZE, **kwargs):
+        """Read object data.
+
+        If concurrency is not given, the data is read with a single
+        GET exactly as StorageObject.read(). Otherwise, the data is
+        fetched with concurrent Range requests and reassembled in order.
+
+        Args:
+            size: optional number of bytes to read. If not given,
+                data will be read until the end of the object.
+            offset: optional byte offset to start reading from
+            output: optional file-like object to write data to
+            concurrency: optional maximum number of concurrent
+                Range requests in flight.
+            range_size: size in bytes of each Range request
+                when concurrency is given.
+            Remaining arguments are passed to StorageObject.read().
+        Returns:
+            object data as a string if output is not given,
+            otherwise None.
+        """
+        if concurrency is None:
+            return super(GStorageObject, self).read(
+                    size=size, offset=offset, output=output, **kwargs)
+
+        download = RangedDownload(
+                storage_object=self,
+                range_size=range_size,
+                concurrency=concurrency)
+        return download.read(
+                size=size,
+                offset=offset,
+                output=output,
+                output_chunk_size=kwargs.get("output_chunk_size"))
+
+    def chunks(self, size=None, offset=0, concurrency=None, **kwargs):
+        """Generator yielding object data in chunks.
+
+        If concurrency is not given, the data is read with a single
+        GET exactly as StorageObject.chunks(). Otherwise, each chunk
+        is fetched with its own Range request, with up to concurrency
+        requests in flight, and chunks are yielded in order.
+
+        Args:
+            size: optional number of bytes to read. If not given,
+                data will be read until the end of the object.
+            offset: optional byte offset to start reading from
+            concurrency: optional maximum number of concurrent
+                Range requests in flight.
+            chunk_size: optional chunk size in bytes
+            Remaining arguments are passed to StorageObject.chunks().
+        Returns:
+            generator yielding object data
+        """
+        if concurrency is None:
+            return super(GStorageObject, self).chunks(
+                    size=size, offset=offset, **kwargs)
+
+        download = RangedDownload(
+                storage_object=self,
+                range_size=kwargs.get("chunk_size", DEFAULT_RANGE_SIZE),
+                concurrency=concurrency)
+        return download.chunks(size=size, offset=offset)
+
+    def download(self, path,
+            range_size=DEFAULT_RANGE_SIZE,
+            concurrency=DEFAULT_RANGE_CONCURRENCY,
+            checkpoint_path=None):
+        """Resumable download of the object to a local file.
+
+        Completed byte ranges are recorded in a checkpoint file next to
+        path, so calling download() again after a failure only fetches
+        the missing ranges. If the object has changed since the
+        checkpoint was written, the download silently restarts from
+        the beginning. Ranges are requested with If-Match on the
+        object's etag, so ObjectChanged is raised, and the checkpoint
+        discarded, if the object changes mid-transfer.
+
+        Args:
+            path: local file path to download to
+            range_size: size in bytes of each Range request, which is
+                also the checkpoint granularity.
+            concurrency: maximum number of concurrent Range requests
+            checkpoint_path: optional checkpoint file path. Defaults
+                to '<path>.checkpoint'.
+        Returns:
+            number of bytes fetched by this call
+        Raises:
+            ObjectChanged if the object changes mid-transfer.
+        """
+        download = ResumableDownload(
+                storage_object=self,
+                path=path,
+                range_size=range_size,
+                concurrency=concurrency,
+                checkpoint_path=checkpoint_path)
+        return download.download()
+
+    def write(self, data, *args, **kwargs):
+        """Write data to object.
+
+        If segment_size is not given, the data is written with
+        a single PUT exactly as StorageObject.write(). Otherwise, the
+        data is split into segments which are uploaded concurrently,
+        followed by a Static Large Object manifest for this object.
+
+        If verify is True, file-like data is hashed as it's streamed
+        and verified against the returned etag, and segmented uploads
+        verify each segment's etag and the manifest's etag.
+
+        Args:
+            data: string or file-like object to write
+            verify: optional boolean indicating the etag should be
+                verified. Defaults to False.
+            segment_size: optional segment size in bytes. If given,
+                data will be uploaded as a Static Large Object.
+            segment_concurrency: optional number of segments to
+                upload concurrently.
+            segment_container: optional GContainer to store segments in.
+                If not given, segments will be stored in the
+                '<container>_segments' container.
+            journal_path: optional path of a segmented upload journal.
+                If a previous write of the same data with the same
+                journal_path was interrupted, only the segments it
+                didn't upload will be uploaded.
+            Remaining arguments are passed to StorageObject.write().
+        """
+        segment_size = kwargs.pop("segment_size", None)
+        segment_concurrency = kwargs.pop("segment_concurrency",
+                DEFAULT_SEGMENT_CONCURRENCY)
+        segment_container = kwargs.pop("segment_container", None)
+        journal_path = kwargs.pop("journal_path", None)
+        verify = kwargs.get("verify", False)
+
+        try:
+            if segment_size is None:
+                #StorageObject sources are handled by the base class
+                if verify and hasattr(data, "read") \
+                        and not isinstance(data, StorageObject):
+                    return self._write_verified(data, *args, **kwargs)
+                return super(GStorageObject, self).write(data, *args, **kwargs)
+
+            upload = SegmentedUpload(
+                    storage_object=self,
+                    segment_size=segment_size,
+                    concurrency=segment_concurrency,
+                    segment_container=segment_container,
+                    verify=verify,
+                    journal_path=journal_path)
+            upload.upload(data)
+        finally:
+            self.container.invalidate_metadata(self.name)
+
+    def write_file(self, source,
+            block_size=DEFAULT_BLOCK_SIZE,
+            segment_size=None,
+            segment_concurrency=DEFAULT_SEGMENT_CONCURRENCY,
+            segment_container=None,
+            verify=True,
+            journal_path=None):
+        """Write file to object without per-chunk copies.
+
+        The file is memory mapped and sent as zero-copy memoryview
+        (or buffer) slices, rather than being read into string
+        chunks as with write(). Sources which aren't regular files,
+        i.e. pipes and sockets, can't be mapped and are streamed
+        with write() instead.
+
+        Args:
+            source: file path, file descriptor, file object with
+                fileno(), mmap or memoryview. Files are written in
+                their entirety regardless of the current file position.
+            block_size: size of the slices passed to the socket
+            segment_size: optional segment size in bytes. If given, and
+                the file is larger, it will be uploaded as a Static
+                Large Object with zero-copy segments.
+            segment_concurrency: optional number of segments to
+                upload concurrently.
+            segment_container: optional GContainer to store segments in.
+            verify: boolean indicating the data should be hashed as
+                it's sent and verified against the returned etag(s).
+            journal_path: optional path of a segmented upload journal,
+                allowing an interrupted segmented upload to be resumed.
+        """
+        if not mappable(source):
+            return self._write_stream(source,
+                    segment_size=segment_size,
+                    segment_concurrency=segment_concurrency,
+                    segment_container=segment_container,
+                    verify=verify,
+                    journal_path=journal_path)
+
+        try:
+            with mapped(source) as mapped_buffer:
+                if segment_size is not None \
+                        and len(mapped_buffer) > segment_size:
+                    upload = SegmentedUpload(
+                            storage_object=self,
+                            segment_size=segment_size,
+                            concurrency=segment_concurrency,
+                            segment_container=segment_container,
+                            verify=verify,
+                            journal_path=journal_path)
+                    upload.upload(mapped_buffer)
+                else:
+                    self._write_mapped(mapped_buffer, block_size, verify)
+                    self.load()
+        finally:
+            self.container.invalidate_metadata(self.name)
+
+    def delete(self, *args, **kwargs):
+        """Delete object.
+
+        Arguments are passed to StorageObject.delete().
+        """
+        try:
+            return super(GStorageObject, self).delete(*args, **kwargs)
+        finally:
+            self.container.invalidate_metadata(self.name)
+
+    def update_metadata(self, *args, **kwargs):
+        """Update object metadata.
+
+        Arguments are passed to StorageObject.update_metadata().
+        """
+        try:
+            return super(GStorageObject, self).update_metadata(
+                    *args, **kwargs)
+        finally:
+            self.container.invalidate_metadata(self.name)
+
+    def delete_at(self, *args, **kwargs):
+        """Schedule object deletion at a time.
+
+        Arguments are passed to StorageObject.delete_at().
+        """
+        try:
+            return super(GStorageObject, self).delete_at(*args, **kwargs)
+        finally:
+            self.container.invalidate_metadata(self.name)
+
+    def delete_after(self, *args, **kwargs):
+        """Schedule object deletion after a number of seconds.
+
+        Arguments are passed to StorageObject.delete_after().
+        """
+        try:
+            return super(GStorageObject, self).delete_after(*args, **kwargs)
+        finally:
+            self.container.invalidate_metadata(self.name)
+
+    def update_cors(self, *args, **kwargs):
+        """Update object CORS headers.
+
+        Arguments are passed to StorageObject.update_cors().
+        """
+        try:
+            return super(GStorageObject, self).update_cors(*args, **kwargs)
+        finally:
+            self.container.invalidate_metadata(self.name)
+
+    def copy_to(self, object_name, *args, **kwargs):
+        """Copy object.
+
+        Args:
+            object_name: destination object name
+            Remaining arguments are passed to StorageObject.copy_to().
+        """
+        try:
+            return super(GStorageObject, self).copy_to(
+                    object_name, *args, **kwargs)
+        finally:
+            container_name = self.container.name
+            destination = kwargs.get("container",
+                    kwargs.get("container_name", args[0] if args else None))
+            destination = getattr(destination, "name", destination)
+            if isinstance(destination, basestring):
+                container_name = destination
+            self._invalidate_metadata(container_name, object_name)
+
+    def copy_from(self, *args, **kwargs):
+        """Copy object data from another object.
+
+        Arguments are passed to StorageObject.copy_from().
+        """
+        try:
+            return super(GStorageObject, self).copy_from(*args, **kwargs)
+        finally:
+            self.container.invalidate_metadata(self.name)
+
+    def _invalidate_metadata(self, container_name, object_name):
+        """Invalidate cached metadata of an object in any container."""
+        metadata_cache = self.container.client.metadata_cache
+        if metadata_cache is None:
+            return
+        metadata_cache.invalidate(metadata_cache.container_key(container_name))
+        metadata_cache.invalidate(
+                metadata_cache.object_key(container_name, object_name))
+
+    def _write_stream(self, source, **kwargs):
+        """Write unmappable file descriptor or file object with write()."""
+        if not isinstance(source, (int, long)):
+            return self.write(source, **kwargs)
+
+        #read from a duplicate so the caller's descriptor stays open
+        with os.fdopen(os.dup(source), "rb") as f:
+            return self.write(f, **kwargs)
+
+    def _write_verified(self, data, *args, **kwargs):
+        """Write file-like data, verifying the etag without re-reading it."""
+        reader = HashingReader(data)
+        kwargs["verify"] = False
+        result = super(GStorageObject, self).write(reader, *args, **kwargs)
+        verify_etag(self.name, reader.hexdigest(), self.etag)
+        return result
+
+    def _write_mapped(self, mapped_buffer,
+            block_size=DEFAULT_BLOCK_SIZE, verify=True):
+        """Write MappedBuffer to object with a single PUT.
+
+        Returns:
+            etag returned by cloudfiles
+        Raises:
+            ObjectWriteError if cloudfiles rejects the PUT.
+            EtagMismatch if verify is True and the etag doesn't
+            match the data sent.
+        """
+        reader = mapped_buffer.reader(block_size)
+        if verify:
+            reader = HashingReader(reader)
+        etag = self._put(reader, len(mapped_buffer))
+        if verify:
+            verify_etag(self.name, reader.hexdigest(), etag)
+        return etag
+
+    def _put(self, data, size, etag=None):
+        """Write data to object with a single PUT.
+
+        Args:
+            data: string or file-like object
+            size: data size in bytes
+            etag: optional MD5 of data. If given, cloudfiles will
+                reject data which doesn't match it.
+        Returns:
+            etag returned by cloudfiles
+        Raises:
+            ObjectWriteError if cloudfiles rejects the PUT.
+        """
+        headers = {
+            "Content-Length": str(size),
+            "Content-Type": self.content_type
+        }
+        if etag is not None:
+            headers["ETag"] = etag
+        response = self.container.client._send_request(
+                "PUT",
+                self.path,
+                data=data,
+                headers=headers)
+        response.read()
+        if response.status >= 300:
+            raise ObjectWriteError("%s write status %d"
+                    % (self.name, response.status), status=response.status)
+        return response.getheader("etag")
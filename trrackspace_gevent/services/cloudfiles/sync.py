@@ -0,0 +1,200 @@
+import hashlib
+import os
+
+from gevent.pool import Pool
+
+from trrackspace_gevent.services.cloudfiles.delete import BulkDelete
+from trrackspace_gevent.services.cloudfiles.etag import normalize_etag, slo_etag
+
+DEFAULT_SYNC_CONCURRENCY = 4
+
+#Size of reads when hashing local files.
+HASH_CHUNK_SIZE = 1024 * 1024
+
+class SyncResult(object):
+    """Result of a ContainerSync.
+
+    Attributes:
+        uploaded_objects: number of objects uploaded
+        uploaded_bytes: number of bytes uploaded
+        skipped_objects: number of unchanged objects not uploaded
+        deleted_objects: number of remote orphans deleted
+        errors: dict of {object_name: error} for objects which
+            could not be synced.
+    """
+
+    def __init__(self):
+        self.uploaded_objects = 0
+        self.uploaded_bytes = 0
+        self.skipped_objects = 0
+        self.deleted_objects = 0
+        self.errors = {}
+
+    def __repr__(self):
+        return "SyncResult(uploaded_objects=%d, uploaded_bytes=%d, " \
+                "skipped_objects=%d, deleted_objects=%d, errors=%d)" % (
+                self.uploaded_objects,
+                self.uploaded_bytes,
+                self.skipped_objects,
+                self.deleted_objects,
+                len(self.errors))
+
+
+class ContainerSync(object):
+    """Incremental local directory to container sync.
+
+    Local files are compared against the container listing by size
+    and, if sizes match, by MD5 against the listing's ETag. Files
+    uploaded as segmented objects are compared by the etag of their
+    manifest, computed from the MD5 of each segment. Only new or
+    changed files are uploaded, concurrently from a gevent pool.
+    Remote objects with no corresponding local file can optionally
+    be deleted.
+
+    Object names are the file paths relative to the local directory,
+    using '/' separators, prefixed with prefix.
+    """
+
+    def __init__(self,
+            container,
+            path,
+            prefix="",
+            delete=False,
+            concurrency=DEFAULT_SYNC_CONCURRENCY,
+            segment_size=None,
+            callback=None):
+        """ContainerSync constructor
+
+        Args:
+            container: GContainer to sync to
+            path: local directory to sync from
+            prefix: optional object name prefix, i.e. 'assets/'.
+                Only remote objects with this prefix are considered.
+            delete: boolean indicating that remote objects with no
+                corresponding local file should be deleted.
+            concurrency: maximum number of concurrent uploads
+            segment_size: optional segment size in bytes. Files larger
+                than segment_size are uploaded as segmented objects.
+            callback: optional callable invoked with (object_name,
+                SyncResult) after each file is processed.
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+
+        self.container = container
+        self.path = path
+        self.prefix = prefix
+        self.delete = delete
+        self.concurrency = concurrency
+        self.segment_size = segment_size
+        self.callback = callback
+        self.result = SyncResult()
+
+    def sync(self):
+        """Sync local directory to container.
+
+        Returns:
+            SyncResult object
+        """
+        remote = {}
+        for obj in self.container.list_all_objects(
+                prefix=self.prefix, prefetch=1):
+            remote[obj["name"]] = obj
+
+        pool = Pool(self.concurrency)
+        try:
+            for name, local_path in self.local_files():
+                pool.spawn(self._sync_file, name, local_path,
+                        remote.pop(name, None))
+            pool.join()
+        finally:
+            pool.kill()
+
+        if self.delete and remote:
+            delete = BulkDelete(
+                    container=self.container,
+                    concurrency=self.concurrency)
+            delete_result = delete.delete(remote.keys())
+            self.result.deleted_objects += delete_result.deleted
+            self.result.errors.update(delete_result.errors)
+
+        return self.result
+
+    def local_files(self):
+        """Generator yielding (object_name, local_path) tuples."""
+        for root, dirs, files in os.walk(self.path):
+            dirs.sort()
+            for filename in sorted(files):
+                local_path = os.path.join(root, filename)
+                relpath = os.path.relpath(local_path, self.path)
+                name = self.prefix + "/".join(relpath.split(os.sep))
+                yield name, local_path
+
+    def _sync_file(self, name, local_path, remote):
+        """Upload file if it's new or has changed."""
+        try:
+            size = os.path.getsize(local_path)
+            if remote is not None and remote.get("bytes") == size \
+                    and normalize_etag(remote.get("hash")) \
+                        == self._etag(local_path, size):
+                self.result.skipped_objects += 1
+            else:
+                self._upload(name, local_path, size)
+                self.result.uploaded_objects += 1
+                self.result.uploaded_bytes += size
+        except Exception as error:
+            self.result.errors[name] = error
+
+        if self.callback is not None:
+            self.callback(name, self.result)
+
+    def _segmented(self, size):
+        """Return True if a file of size is uploaded in segments."""
+        return self.segment_size is not None and size > self.segment_size
+
+    def _upload(self, name, local_path, size):
+        obj = self.container.create_object(name)
+        with open(local_path, "rb") as f:
+            if self._segmented(size):
+                obj.write(f, segment_size=self.segment_size)
+            else:
+                obj.write(f)
+
+    def _etag(self, local_path, size):
+        """Return the etag cloudfiles reports for the uploaded file.
+
+        This is the MD5 of the file, or for segmented uploads the
+        etag of the manifest of segment_size segments.
+        """
+        if not self._segmented(size):
+            return self._md5(local_path)
+
+        segment_etags = []
+        with open(local_path, "rb") as f:
+            while True:
+                etag = self._md5_segment(f, self.segment_size)
+                if etag is None:
+                    break
+                segment_etags.append(etag)
+        return slo_etag(segment_etags)
+
+    def _md5(self, local_path):
+        with open(local_path, "rb") as f:
+            return self._md5_segment(f) or hashlib.md5().hexdigest()
+
+    def _md5_segment(self, f, size=None):
+        """Return MD5 of the next size bytes of f, or None at eof."""
+        md5 = hashlib.md5()
+        remaining = size
+        read = 0
+        while remaining is None or remaining > 0:
+            chunk_size = HASH_CHUNK_SIZE if remaining is None \
+                    else min(HASH_CHUNK_SIZE, remaining)
+            data = f.read(chunk_size)
+            if not data:
+                break
+            md5.update(data)
+            read += len(data)
+            if remaining is not None:
+                remaining -= len(data)
+        return md5.hexdigest() if read else None
@@ -0,0 +1,431 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+
+from gevent.pool import Pool
+
+from trrackspace_gevent.services.cloudfiles.errors import ObjectWriteError, \
+        SegmentedUploadError
+from trrackspace_gevent.services.cloudfiles.etag import normalize_etag, \
+        slo_etag, verify_etag
+from trrackspace_gevent.services.cloudfiles.mapped import MappedBuffer
+
+#Cloudfiles requires all static large object segments, with the
+#exception of the last one, to be at least 1MB.
+MIN_SEGMENT_SIZE = 1024 * 1024
+
+#Maximum number of segments allowed in a static large object manifest.
+MAX_SEGMENTS = 1000
+
+DEFAULT_SEGMENT_SIZE = 100 * 1024 * 1024
+DEFAULT_SEGMENT_CONCURRENCY = 4
+
+class UploadJournal(object):
+    """On-disk journal of a segmented upload.
+
+    The journal records the upload id and the name, offset, size and
+    etag of every segment uploaded, so a restarted process can upload
+    only the missing segments and write the manifest. It's stored as
+    JSON and replaced atomically on each save.
+
+    Attributes:
+        path: journal file path
+        upload_id: segmented upload id used in segment names
+        container_name: name of the container being uploaded to
+        object_name: name of the object being uploaded
+        segment_container_name: name of the segment container
+        segment_size: segment size in bytes
+        source_size: optional size of the upload source, if known
+        source_mtime: optional modification time of the upload
+            source, if it's a file.
+        segments: dict of {index: manifest_entry} for uploaded segments.
+            Manifest entries contain 'path', 'etag', 'size_bytes' and
+            'offset' keys.
+    """
+
+    def __init__(self, path,
+            upload_id=None,
+            container_name=None,
+            object_name=None,
+            segment_container_name=None,
+            segment_size=None,
+            source_size=None,
+            source_mtime=None,
+            segments=None):
+        self.path = path
+        self.upload_id = upload_id
+        self.container_name = container_name
+        self.object_name = object_name
+        self.segment_container_name = segment_container_name
+        self.segment_size = segment_size
+        self.source_size = source_size
+        self.source_mtime = source_mtime
+        self.segments = segments or {}
+
+    @classmethod
+    def load(cls, path):
+        """Load journal from path.
+
+        Returns:
+            UploadJournal, or None if path doesn't exist or
+            can't be parsed.
+        """
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            segments = dict((int(index), entry)
+                    for index, entry in data.pop("segments").items())
+            return cls(path, segments=segments, **data)
+        except (IOError, ValueError, KeyError, TypeError):
+            return None
+
+    def matches(self, other):
+        """Return True if other journal describes the same upload."""
+        return self.container_name == other.container_name \
+                and self.object_name == other.object_name \
+                and self.segment_container_name == other.segment_container_name \
+                and self.segment_size == other.segment_size \
+                and self.source_size == other.source_size \
+                and self.source_mtime == other.source_mtime
+
+    def record(self, index, entry):
+        """Record uploaded segment and save the journal."""
+        self.segments[index] = entry
+        self.save()
+
+    def save(self):
+        """Atomically write journal to disk."""
+        data = {
+            "upload_id": self.upload_id,
+            "container_name": self.container_name,
+            "object_name": self.object_name,
+            "segment_container_name": self.segment_container_name,
+            "segment_size": self.segment_size,
+            "source_size": self.source_size,
+            "source_mtime": self.source_mtime,
+            "segments": self.segments
+        }
+        temp_path = "%s.tmp" % self.path
+        with open(temp_path, "w") as f:
+            json.dump(data, f)
+        os.rename(temp_path, self.path)
+
+    def delete(self):
+        """Remove journal from disk."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class SegmentedUpload(object):
+    """Concurrent Static Large Object (SLO) upload.
+
+    Data is split into segments of segment_size bytes which are
+    uploaded concurrently from a gevent pool. Once all segments have
+    been uploaded, a SLO manifest referencing the segments is written
+    to the storage object.
+
+    At most concurrency + 1 segments are held in memory at a time.
+
+    If verify is True, the MD5 of each segment is computed as it's
+    sent, without a second pass over the data, and verified against
+    the segment's etag. In-memory segments send their MD5 as the ETag
+    header so cloudfiles rejects corrupted segments. The manifest's
+    etag is verified against the MD5 of the segment etags.
+
+    If journal_path is given, uploaded segments are recorded in an
+    UploadJournal. Uploading the same source again with the same
+    journal_path, i.e. after a crash, skips the segments which were
+    already uploaded. The journal is discarded if the source's size
+    or modification time have changed, and each journaled segment is
+    re-read and only skipped if its MD5 matches the journaled etag.
+    Journaled segments past the end of the source are left out of
+    the manifest.
+    On failure, segments are left in place for the next attempt, and
+    the journal is removed once the manifest has been written.
+    """
+
+    def __init__(self,
+            storage_object,
+            segment_size=DEFAULT_SEGMENT_SIZE,
+            concurrency=DEFAULT_SEGMENT_CONCURRENCY,
+            segment_container=None,
+            verify=True,
+            journal_path=None):
+        """SegmentedUpload constructor
+
+        Args:
+            storage_object: GStorageObject to upload to
+            segment_size: segment size in bytes
+            concurrency: number of segments to upload concurrently
+            segment_container: optional GContainer to store segments in.
+                If not given, segments will be stored in the
+                '<container>_segments' container which will be created
+                if needed.
+            verify: boolean indicating segment and manifest etags
+                should be verified.
+            journal_path: optional path of an UploadJournal, allowing
+                an interrupted upload to be resumed.
+        """
+        if segment_size < MIN_SEGMENT_SIZE:
+            raise ValueError("segment_size must be at least %d bytes"
+                    % MIN_SEGMENT_SIZE)
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+
+        self.storage_object = storage_object
+        self.container = storage_object.container
+        self.client = self.container.client
+        self.segment_size = segment_size
+        self.concurrency = concurrency
+        self.segment_container = segment_container
+        self.verify = verify
+        self.journal_path = journal_path
+        self.journal = None
+        self.upload_id = "%d-%s" % (int(time.time()), uuid.uuid4().hex[:8])
+        self.segments = {}
+
+    def upload(self, data):
+        """Upload data as a static large object.
+
+        Args:
+            data: string, file-like object or MappedBuffer to upload.
+                MappedBuffer segments are uploaded without copies.
+        Raises:
+            SegmentedUploadError if a segment or manifest upload fails.
+        """
+        if self.segment_container is None:
+            self.segment_container = self.client.create_container(
+                    "%s_segments" % self.container.name)
+
+        if self.journal_path is not None:
+            self._open_journal(data)
+
+        pool = Pool(self.concurrency)
+        greenlets = []
+        last_index = -1
+        try:
+            for index, segment in self._segments(data):
+                last_index = index
+                if self._completed(index, segment):
+                    continue
+                #spawn blocks while the pool is full which bounds memory
+                greenlets.append(
+                        pool.spawn(self._upload_segment, index, segment))
+            pool.join()
+        except Exception:
+            pool.kill()
+            raise
+
+        for greenlet in greenlets:
+            if not greenlet.successful():
+                self._delete_segments()
+                raise SegmentedUploadError(
+                        "segment upload failed: %s" % greenlet.exception)
+
+        self._discard_stale(last_index)
+        try:
+            self._write_manifest()
+        except Exception as error:
+            self._delete_segments()
+            raise SegmentedUploadError(
+                    "manifest upload failed: %s" % error)
+
+        if self.journal is not None:
+            self.journal.delete()
+
+    def segment_name(self, index):
+        """Return segment object name for the given segment index."""
+        return "%s/%s/%08d" % (
+                self.storage_object.name, self.upload_id, index)
+
+    def _segments(self, data):
+        """Generator yielding (index, segment_data) tuples."""
+        if isinstance(data, MappedBuffer):
+            segments = (data.slice(offset, self.segment_size)
+                    for offset in range(0, len(data), self.segment_size))
+        elif hasattr(data, "read"):
+            segments = self._read_segments(data)
+        else:
+            segments = (data[offset:offset + self.segment_size]
+                    for offset in range(0, len(data), self.segment_size))
+
+        index = -1
+        for index, segment in enumerate(segments):
+            if index >= MAX_SEGMENTS:
+                raise SegmentedUploadError(
+                        "data exceeds maximum of %d segments" % MAX_SEGMENTS)
+            yield index, segment
+
+        #always upload at least one (empty) segment
+        if index < 0:
+            yield 0, ""
+
+    def _read_segments(self, data):
+        """Generator yielding segments of file-like data."""
+        while True:
+            segment = self._read_segment(data)
+            if not segment:
+                break
+            yield segment
+
+    def _read_segment(self, data):
+        """Read a full segment from file-like data.
+
+        File-like objects are allowed to return short reads, so keep
+        reading until segment_size bytes or EOF is reached.
+        """
+        result = []
+        remaining = self.segment_size
+        while remaining > 0:
+            buffer = data.read(remaining)
+            if not buffer:
+                break
+            result.append(buffer)
+            remaining -= len(buffer)
+        return "".join(result)
+
+    def _open_journal(self, data):
+        """Load journal for a previous attempt at this upload, or create one."""
+        journal = UploadJournal(self.journal_path,
+                upload_id=self.upload_id,
+                container_name=self.container.name,
+                object_name=self.storage_object.name,
+                segment_container_name=self.segment_container.name,
+                segment_size=self.segment_size,
+                source_size=self._source_size(data),
+                source_mtime=self._source_mtime(data))
+
+        previous = UploadJournal.load(self.journal_path)
+        if previous is not None and previous.matches(journal):
+            journal = previous
+            self.upload_id = journal.upload_id
+            self.segments.update(journal.segments)
+        else:
+            journal.save()
+        self.journal = journal
+
+    def _source_size(self, data):
+        """Return size of data if it can be determined, otherwise None."""
+        if hasattr(data, "fileno"):
+            try:
+                return os.fstat(data.fileno()).st_size
+            except (AttributeError, IOError, OSError):
+                return None
+        elif not hasattr(data, "read"):
+            return len(data)
+        return None
+
+    def _source_mtime(self, data):
+        """Return modification time of data if it's a file, otherwise None."""
+        if isinstance(data, MappedBuffer):
+            return data.mtime
+        elif hasattr(data, "fileno"):
+            try:
+                return os.fstat(data.fileno()).st_mtime
+            except (AttributeError, IOError, OSError):
+                return None
+        return None
+
+    def _completed(self, index, segment):
+        """Return True if segment was uploaded by a previous attempt.
+
+        The segment must match the journaled segment's size and etag.
+        """
+        entry = self.segments.get(index)
+        if entry is None:
+            return False
+        elif len(segment) == entry["size_bytes"] \
+                and self._md5(segment) == entry["etag"]:
+            return True
+        #source changed since the segment was journaled
+        del self.segments[index]
+        return False
+
+    def _discard_stale(self, last_index):
+        """Drop journaled segments past the last segment of the source.
+
+        A journal for a source of unknown size, i.e. a stream, matches
+        any previous upload to the same object, which may have had
+        more segments than this one.
+        """
+        for index in [i for i in self.segments if i > last_index]:
+            del self.segments[index]
+            if self.journal is not None:
+                self.journal.segments.pop(index, None)
+
+    def _md5(self, segment):
+        """Return MD5 hex digest of string or MappedBuffer segment."""
+        if isinstance(segment, MappedBuffer):
+            segment = segment.view()
+        return hashlib.md5(segment).hexdigest()
+
+    def _upload_segment(self, index, segment):
+        """Upload a single segment and record its manifest entry."""
+        name = self.segment_name(index)
+        segment_object = self.segment_container.create_object(name)
+        if isinstance(segment, MappedBuffer):
+            etag = segment_object._write_mapped(segment, verify=self.verify)
+        else:
+            md5 = hashlib.md5(segment).hexdigest() if self.verify else None
+            etag = segment_object._put(segment, len(segment), etag=md5)
+            if self.verify:
+                verify_etag(name, md5, etag)
+        entry = {
+            "path": "/%s/%s" % (self.segment_container.name, name),
+            "etag": normalize_etag(etag),
+            "size_bytes": len(segment),
+            "offset": index * self.segment_size
+        }
+        self.segments[index] = entry
+        if self.journal is not None:
+            self.journal.record(index, entry)
+
+    def _write_manifest(self):
+        """Write SLO manifest for uploaded segments.
+
+        Raises:
+            ObjectWriteError if cloudfiles rejects the manifest. The
+            message includes the response body, which names the
+            failing segments.
+        """
+        manifest = [{
+            "path": self.segments[i]["path"],
+            "etag": self.segments[i]["etag"],
+            "size_bytes": self.segments[i]["size_bytes"]
+        } for i in sorted(self.segments)]
+        headers = {
+            "Content-Type": self.storage_object.content_type
+        }
+        response = self.client._send_request(
+                "PUT",
+                self.storage_object.path,
+                data=json.dumps(manifest),
+                params={"multipart-manifest": "put"},
+                headers=headers)
+        body = response.read()
+        if response.status >= 300:
+            raise ObjectWriteError("%s manifest status %d: %s"
+                    % (self.storage_object.name, response.status, body),
+                    status=response.status)
+        if self.verify:
+            verify_etag(self.storage_object.name,
+                    slo_etag([s["etag"] for s in manifest]),
+                    response.getheader("etag"))
+        self.storage_object.load()
+
+    def _delete_segments(self):
+        """Delete uploaded segments, ignoring errors.
+
+        Segments are kept if a journal is in use so the
+        upload can be resumed.
+        """
+        if self.journal is not None:
+            return
+        for index in list(self.segments):
+            try:
+                self.segment_container.delete_object(self.segment_name(index))
+            except Exception:
+                pass
+            del self.segments[index]
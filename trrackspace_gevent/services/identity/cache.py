@@ -0,0 +1,176 @@
+import calendar
+import datetime
+import hashlib
+import time
+
+import gevent
+from gevent.event import AsyncResult
+
+#Number of seconds before token expiration to proactively refresh it.
+DEFAULT_REFRESH_WINDOW = 300
+
+#Lifetime in seconds assumed for tokens without an expiration.
+DEFAULT_TOKEN_TTL = 3600
+
+#Number of seconds to wait before retrying a failed proactive refresh.
+REFRESH_RETRY_INTERVAL = 30
+
+class TokenCacheEntry(object):
+    """Cached authentication state.
+
+    Attributes:
+        token_id: cached token id
+        state: dict of client authentication state attributes
+        expires_at: token expiration as a unix timestamp
+    """
+
+    def __init__(self, token_id, state, expires_at):
+        self.token_id = token_id
+        self.state = state
+        self.expires_at = expires_at
+
+
+class TokenCache(object):
+    """Greenlet-safe, single-flight authentication cache.
+
+    Authentication state (token and service catalog) is cached by key
+    so it can be shared by many identity clients. Concurrent
+    authentications for the same key are collapsed into a single
+    identity request.
+
+    Entries read within refresh_window seconds of their token's
+    expiration are proactively refreshed by a background greenlet
+    while the current token is returned, so frequently used
+    credentials never block on expiration. Entries which aren't read
+    aren't refreshed, so no greenlets outlive the clients using the
+    cache. Since the refresh runs in the background, the authenticate
+    callable must not modify client state. Clients pick up refreshed
+    tokens with peek().
+    """
+
+    def __init__(self, refresh_window=DEFAULT_REFRESH_WINDOW):
+        """TokenCache constructor
+
+        Args:
+            refresh_window: number of seconds before token expiration
+                at which the token will be proactively refreshed.
+        """
+        self.refresh_window = refresh_window
+        self.entries = {}
+        self.pending = {}
+        self.refresh_times = {}
+
+    @staticmethod
+    def key(username, api_key=None, password=None, endpoint=None):
+        """Return cache key for the given credentials.
+
+        Credentials are hashed so they are not retained in the key.
+        """
+        credential = hashlib.sha256(
+                "%s:%s" % (api_key or "", password or "")).hexdigest()
+        return (username, credential, endpoint)
+
+    @staticmethod
+    def expires_at(token):
+        """Return token expiration as a unix timestamp.
+
+        Args:
+            token: Token object
+        """
+        expires = getattr(token, "expires", None)
+        if isinstance(expires, datetime.datetime):
+            return calendar.timegm(expires.utctimetuple())
+        elif isinstance(expires, (int, long, float)):
+            return expires
+        return time.time() + DEFAULT_TOKEN_TTL
+
+    def get(self, key, authenticate, stale_token_id=None):
+        """Get cached authentication entry.
+
+        Args:
+            key: cache key returned from key()
+            authenticate: callable which authenticates and returns
+                a new TokenCacheEntry without modifying client state.
+                It will be invoked at most once concurrently for a
+                given key.
+            stale_token_id: optional id of a token which the caller
+                knows to be invalid, i.e. following a 401 response. If
+                the cached token matches it will be refreshed.
+        Returns:
+            TokenCacheEntry object
+        """
+        entry = self.peek(key, authenticate)
+        if entry is None or entry.token_id == stale_token_id:
+            return self._refresh(key, authenticate)
+        return entry
+
+    def peek(self, key, authenticate=None):
+        """Return cached entry for key without blocking on authentication.
+
+        Args:
+            key: cache key returned from key()
+            authenticate: optional callable as passed to get(). If
+                given, and the entry is within its refresh window, the
+                entry is refreshed in a background greenlet.
+        Returns:
+            TokenCacheEntry object, or None if there is no entry
+            or the entry's token has expired.
+        """
+        entry = self.entries.get(key)
+        if entry is None or entry.expires_at <= time.time():
+            return None
+        if authenticate is not None \
+                and self.refresh_times.get(key, 0) <= time.time() \
+                and key not in self.pending:
+            gevent.spawn(self._background_refresh, key, authenticate)
+        return entry
+
+    def invalidate(self, key=None):
+        """Remove cached entry for key, or all entries if key is None."""
+        keys = self.entries.keys() if key is None else [key]
+        for key in keys:
+            self.entries.pop(key, None)
+            self.refresh_times.pop(key, None)
+
+    def _background_refresh(self, key, authenticate):
+        """Proactively refresh entry.
+
+        Failed refreshes are retried by reads at least
+        REFRESH_RETRY_INTERVAL seconds later while the cached token
+        remains valid. Once it expires the failure will be raised
+        to callers.
+        """
+        try:
+            self._refresh(key, authenticate)
+        except Exception:
+            if key in self.entries:
+                self.refresh_times[key] = time.time() + REFRESH_RETRY_INTERVAL
+
+    def _refresh(self, key, authenticate):
+        """Authenticate, collapsing concurrent requests for key."""
+        pending = self.pending.get(key)
+        if pending is not None:
+            return pending.get()
+
+        pending = self.pending[key] = AsyncResult()
+        try:
+            entry = authenticate()
+            self.entries[key] = entry
+            #refresh within the window, but no sooner than half way
+            #to expiration for tokens shorter lived than the window.
+            now = time.time()
+            remaining = entry.expires_at - now
+            self.refresh_times[key] = now + max(
+                    remaining - self.refresh_window, remaining / 2.0, 0)
+            pending.set(entry)
+        except Exception as error:
+            pending.set_exception(error)
+            raise
+        finally:
+            del self.pending[key]
+        return entry
+
+
+#Process-wide token cache shared by default by all
+#GIdentityServiceClient objects.
+TOKEN_CACHE = TokenCache()
@@ -1,8 +1,29 @@
+import functools
+
 from trhttp_gevent.rest.client import GRestClient
 from trrackspace.services.identity.client import IdentityServiceClient
+from trrackspace_gevent.rest.client import GPooledRestClient
+from trrackspace_gevent.retry import RetryPolicy
+from trrackspace_gevent.services.identity.cache import TokenCache, \
+        TokenCacheEntry, TOKEN_CACHE
 
 class GIdentityServiceClient(IdentityServiceClient):
-    """Gevent Rackspace identity service client."""
+    """Gevent Rackspace identity service client.
+
+    By default authentication state is shared through the process-wide
+    TOKEN_CACHE, so clients with the same credentials authenticate once,
+    concurrent re-authentications following token expiration collapse
+    into a single identity request, and tokens in use are refreshed
+    before they expire. Cache authentications run on a private client, so
+    background refreshes never modify this client's state, and
+    sync_token() applies refreshed state to this client.
+
+    If a metrics sink is given, identity requests and re-authentications
+    are reported to it (see Metrics).
+    """
+
+    #Client attributes holding authentication state to cache
+    AUTH_STATE_ATTRIBUTES = ("token", "user", "service_catalog")
 
     def __init__(self,
             username,
@@ -14,7 +35,9 @@ class GIdentityServiceClient(IdentityServiceClient):
             keepalive=True,
             proxy=None,
             rest_client_class=GRestClient,
-            debug_level=0):
+            debug_level=0,
+            token_cache=TOKEN_CACHE,
+            metrics=None):
         """IdentityServiceClient constructor
 
         Args:
@@ -28,7 +51,8 @@ class GIdentityServiceClient(IdentityServiceClient):
             retries: Number of times to try a request with an unexpected
                 error before an exception is raised. Note that a value of 2
                 means to try each api request twice (not 3 times) before
-                raising an exception.
+                raising an exception. Alternatively a RetryPolicy can be
+                given for deadline-aware retries with backoff and jitter.
             keepalive: boolean indicating whether connections to the
                 cloudfiles servers should be maintained between requests.
                 If false, connections will be closed immediately following
@@ -39,7 +63,45 @@ class GIdentityServiceClient(IdentityServiceClient):
             debug_level: httplib debug level. Setting this to 1 will log
                 http requests and responses which is very useful for 
                 debugging.
+            token_cache: optional TokenCache to share authentication
+                state through. If None, the client will authenticate
+                on its own.
+            metrics: optional Metrics sink
         """
+        self.token_cache = token_cache
+        self.metrics = metrics
+        self._auth_client = None
+        self._auth_arguments = dict(
+                username=username,
+                api_key=api_key,
+                password=password,
+                endpoint=endpoint,
+                timeout=timeout,
+                retries=retries,
+                keepalive=keepalive,
+                proxy=proxy,
+                rest_client_class=rest_client_class,
+                debug_level=debug_level,
+                token_cache=None,
+                metrics=metrics)
+        self.token_cache_key = TokenCache.key(
+                username=username,
+                api_key=api_key,
+                password=password,
+                endpoint=endpoint)
+
+        self.retry_policy = None
+        if isinstance(retries, RetryPolicy):
+            self.retry_policy = retries
+            retries = 1
+
+        if self.retry_policy is not None or metrics is not None:
+            rest_client_class = functools.partial(
+                    GPooledRestClient,
+                    rest_client_class=rest_client_class,
+                    retry_policy=self.retry_policy,
+                    metrics=metrics,
+                    metrics_name="identity")
 
         super(GIdentityServiceClient, self).__init__(
                 username=username,
@@ -52,3 +114,78 @@ class GIdentityServiceClient(IdentityServiceClient):
                 proxy=proxy,
                 rest_client_class=rest_client_class,
                 debug_level=debug_level)
+
+    def authenticate(self):
+        """Authenticate with the identity service.
+
+        If a token_cache is in use, cached authentication state will be
+        used unless this client's current token is the cached token, in
+        which case the token is assumed to have been rejected and a
+        single re-authentication is shared by all waiting clients.
+        """
+        token = getattr(self, "token", None)
+        if token is not None and self.metrics is not None:
+            self.metrics.count("identity.reauthenticate")
+
+        if self.token_cache is None:
+            self._authenticate()
+            return
+
+        entry = self.token_cache.get(
+                self.token_cache_key,
+                self._cache_authenticate,
+                stale_token_id=getattr(token, "id", token))
+
+        for name, value in entry.state.items():
+            setattr(self, name, value)
+
+    def sync_token(self):
+        """Apply cached authentication state if the token has changed.
+
+        This never blocks on authentication, so it's cheap enough to
+        call before every request to pick up proactively refreshed
+        tokens. Tokens within the cache's refresh window are refreshed
+        in the background.
+
+        Returns:
+            True if the token changed, False otherwise.
+        """
+        if self.token_cache is None:
+            return False
+        entry = self.token_cache.peek(
+                self.token_cache_key, self._cache_authenticate)
+        token = getattr(self, "token", None)
+        if entry is None or token is None \
+                or entry.token_id == getattr(token, "id", token):
+            return False
+
+        for name, value in entry.state.items():
+            setattr(self, name, value)
+        return True
+
+    def _cache_authenticate(self):
+        """Authenticate on the private client for the token cache.
+
+        Returns:
+            TokenCacheEntry for the new state
+        """
+        if self._auth_client is None:
+            self._auth_client = GIdentityServiceClient(**self._auth_arguments)
+        return self._auth_client._authenticate()
+
+    def _authenticate(self):
+        """Authenticate and return TokenCacheEntry for the new state."""
+        if self.metrics is None:
+            super(GIdentityServiceClient, self).authenticate()
+        else:
+            with self.metrics.timer("identity.authenticate"):
+                super(GIdentityServiceClient, self).authenticate()
+
+        state = {}
+        for name in self.AUTH_STATE_ATTRIBUTES:
+            if hasattr(self, name):
+                state[name] = getattr(self, name)
+        return TokenCacheEntry(
+                token_id=getattr(self.token, "id", self.token),
+                state=state,
+                expires_at=TokenCache.expires_at(self.token))
@@ -1,5 +1,6 @@
 from trhttp_gevent.rest.client import GRestClient
 from trpycore.factory.base import Factory
+from trrackspace_gevent.services.identity.cache import TOKEN_CACHE
 from trrackspace_gevent.services.identity.client import GIdentityServiceClient
 
 class GIdentityServiceClientFactory(Factory):
@@ -15,7 +16,9 @@ class GIdentityServiceClientFactory(Factory):
             keepalive=True,
             proxy=None,
             rest_client_class=GRestClient,
-            debug_level=0):
+            debug_level=0,
+            token_cache=TOKEN_CACHE,
+            metrics=None):
         """GIdentityServiceClientFactory constructor
 
         Args:
@@ -33,7 +36,8 @@ class GIdentityServiceClientFactory(Factory):
             retries: Number of times to try a request with an unexpected
                 error before an exception is raised. Note that a value of 2
                 means to try each api request twice (not 3 times) before
-                raising an exception.
+                raising an exception. Alternatively a RetryPolicy can be
+                given for deadline-aware retries with backoff and jitter.
             keepalive: boolean indicating whether connections to the
                 cloudfiles servers should be maintained between requests.
                 If false, connections will be closed immediately following
@@ -44,6 +48,9 @@ class GIdentityServiceClientFactory(Factory):
             debug_level: httplib debug level. Setting this to 1 will log
                 http requests and responses which is very useful for 
                 debugging.
+            token_cache: optional TokenCache shared by created clients.
+                If None, each client will authenticate on its own.
+            metrics: optional Metrics sink shared by created clients.
         """
         self.username = username
         self.api_key = api_key
@@ -55,6 +62,8 @@ class GIdentityServiceClientFactory(Factory):
         self.proxy = proxy
         self.rest_client_class = rest_client_class
         self.debug_level = debug_level
+        self.token_cache = token_cache
+        self.metrics = metrics
         self.username = username
 
     def create(self):
@@ -69,4 +78,6 @@ class GIdentityServiceClientFactory(Factory):
                 keepalive=self.keepalive,
                 proxy=self.proxy,
                 rest_client_class=self.rest_client_class,
-                debug_level=self.debug_level)
+                debug_level=self.debug_level,
+                token_cache=self.token_cache,
+                metrics=self.metrics)